@@ -0,0 +1,165 @@
+from typing import Optional
+
+import typer
+from sqlmodel import Session, select, update, delete, func
+
+from .db.database import get_database
+from .models.models import Habits, HabitLogs
+from .services.habit_log_archive import get_hot_logs_start, archive_habit_logs_batch
+from .services.habit_schedule import apply_compiled_repeat_rule
+from .services.habit_summaries import rebuild_monthly_summaries
+
+# Maintenance commands, run with: python -m app.cli <command>
+cli = typer.Typer()
+
+
+@cli.callback()
+def main():
+    """
+    Better Habits maintenance commands
+    """
+
+
+@cli.command()
+def compile_repeat_rules(batch_size: int = 500):
+    """
+    Backfills the compiled repeat rule columns (weekday_mask, month_day_mask, repeat_n) of every habit
+    """
+    compiled_habits = 0
+    last_habit_id = 0
+    with Session(get_database().engine) as session:
+        while True:
+            statement = select(Habits).where(Habits.id > last_habit_id).order_by(Habits.id).limit(batch_size)
+            habits = session.exec(statement).all()
+            if not habits:
+                break
+
+            for habit in habits:
+                try:
+                    apply_compiled_repeat_rule(habit)
+                except ValueError as error:
+                    typer.echo(f"Skipping habit {habit.id}: {error}", err=True)
+            session.add_all(habits)
+            session.commit()
+            compiled_habits += len(habits)
+            last_habit_id = habits[-1].id
+
+    typer.echo(f"Compiled the repeat rules of {compiled_habits} habits")
+
+
+def delete_duplicate_habit_logs(batch_size: int, session: Session) -> int:
+    """
+    Deletes all but one of the logs that share a habit and a log_date, keeping the last updated one (the highest ID
+    on a tie), so that the unique (habit_fk, log_date) index can be created. It commits after each batch.
+    :return: number of deleted logs
+    """
+    deleted_logs = 0
+    while True:
+        duplicates_statement = (
+            select(HabitLogs.habit_fk, HabitLogs.log_date)
+            .where(HabitLogs.log_date.is_not(None))
+            .group_by(HabitLogs.habit_fk, HabitLogs.log_date)
+            .having(func.count() > 1)
+            .limit(batch_size)
+        )
+        duplicates = set(session.exec(duplicates_statement).all())
+        if not duplicates:
+            break
+
+        logs_statement = (
+            select(HabitLogs.id, HabitLogs.habit_fk, HabitLogs.log_date)
+            .where(HabitLogs.habit_fk.in_({habit_id for habit_id, _ in duplicates}),
+                   HabitLogs.log_date.in_({log_date for _, log_date in duplicates}))
+            .order_by(HabitLogs.habit_fk, HabitLogs.log_date, HabitLogs.updated_at.desc(), HabitLogs.id.desc())
+        )
+        kept_logs = set()
+        deleted_log_ids = []
+        for habit_log_id, habit_id, log_date in session.exec(logs_statement):
+            if (habit_id, log_date) not in duplicates:
+                continue
+            if (habit_id, log_date) in kept_logs:
+                deleted_log_ids.append(habit_log_id)
+            else:
+                kept_logs.add((habit_id, log_date))
+
+        session.exec(delete(HabitLogs).where(HabitLogs.id.in_(deleted_log_ids)))
+        session.commit()
+        deleted_logs += len(deleted_log_ids)
+
+    return deleted_logs
+
+
+@cli.command()
+def backfill_log_dates(batch_size: int = 5000):
+    """
+    Fills the log_date column of the habit_logs rows written before it existed, from their created_at, then deletes
+    the duplicate logs of a habit and day (see delete_duplicate_habit_logs). Run it before creating the unique
+    (habit_fk, log_date) index, and rebuild-habit-summaries after it when logs were deleted.
+    """
+    backfilled_logs = 0
+    with Session(get_database().engine) as session:
+        while True:
+            ids_statement = select(HabitLogs.id).where(HabitLogs.log_date.is_(None)).limit(batch_size)
+            habit_log_ids = session.exec(ids_statement).all()
+            if not habit_log_ids:
+                break
+
+            session.exec(update(HabitLogs)
+                         .where(HabitLogs.id.in_(habit_log_ids))
+                         .values(log_date=func.date(HabitLogs.created_at)))
+            session.commit()
+            backfilled_logs += len(habit_log_ids)
+
+        deleted_logs = delete_duplicate_habit_logs(batch_size, session)
+
+    typer.echo(f"Backfilled the log_date of {backfilled_logs} habit logs")
+    if deleted_logs:
+        typer.echo(f"Deleted {deleted_logs} duplicate habit logs, run rebuild-habit-summaries to update the summaries")
+
+
+@cli.command()
+def rebuild_habit_summaries(habit_id: Optional[int] = None, batch_size: int = 100):
+    """
+    Rebuilds the habit_monthly_summaries rows from the existing habit_logs, for one habit or for all of them
+    """
+    written_summaries = 0
+    last_habit_id = 0
+    with Session(get_database().engine) as session:
+        while True:
+            statement = select(Habits.id).where(Habits.id > last_habit_id).order_by(Habits.id).limit(batch_size)
+            if habit_id is not None:
+                statement = statement.where(Habits.id == habit_id)
+            habit_ids = session.exec(statement).all()
+            if not habit_ids:
+                break
+
+            written_summaries += rebuild_monthly_summaries(list(habit_ids), session)
+            session.commit()
+            last_habit_id = habit_ids[-1]
+
+    typer.echo(f"Wrote {written_summaries} monthly summaries")
+
+
+@cli.command()
+def archive_habit_logs(batch_size: int = 5000):
+    """
+    Moves the habit_logs rows older than the last HABIT_LOGS_HOT_YEARS calendar years to habit_logs_archive. Run it
+    after the new year, the reads pick up the archive by themselves.
+    """
+    hot_logs_start = get_hot_logs_start()
+    archived_logs = 0
+    last_habit_log_id = 0
+    with Session(get_database().engine) as session:
+        while True:
+            habit_log_ids = archive_habit_logs_batch(hot_logs_start, last_habit_log_id, batch_size, session)
+            if not habit_log_ids:
+                break
+            session.commit()
+            archived_logs += len(habit_log_ids)
+            last_habit_log_id = habit_log_ids[-1]
+
+    typer.echo(f"Archived {archived_logs} habit logs from before {hot_logs_start}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import List, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -8,7 +11,67 @@ class Settings(BaseSettings):
     db_prd_host: str
     db_port: int
     db_name: str
+    # picks the primary host, either "dev" (db_dev_host) or "prd" (db_prd_host)
+    db_environment: str = "dev"
+    # overrides the MySQL URL built from the settings above, e.g. "sqlite:///./local.db" for local testing
+    db_url: Optional[str] = None
+
+    # read replicas that serve the GET requests, as hosts of the primary's database or as full URLs, e.g.
+    # DB_REPLICA_URLS='["sqlite:///./replica.db"]' for local testing
+    db_replica_hosts: List[str] = []
+    db_replica_urls: List[str] = []
+    # clients are pinned to the primary for this long after a write, so that they read their own writes
+    db_read_your_writes_seconds: float = 5
+
+    # connection pool, the recycle time has to stay below MySQL's wait_timeout to avoid stale connections
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_timeout: int = 30
+    db_connect_timeout: int = 10
+    # connections opened on every engine when the app starts, so that the first requests don't pay for them
+    db_warm_up_connections: int = 2
+    # run the hot queries once when the app starts, so that their compiled SQL is cached before the first requests
+    db_precompile_statements: bool = False
+
+    # serve the hot routes with async endpoints on an async engine instead of the blocking PyMySQL one
+    db_async_mode: bool = False
+    db_async_driver: str = "asyncmy"
+    # overrides the async MySQL URL, e.g. "sqlite+aiosqlite:///./local.db" for local testing
+    db_async_url: Optional[str] = None
+
+    # per-worker read cache of the user and habit endpoints
+    cache_enabled: bool = True
+    cache_max_entries: int = 10_000
+    cache_ttl_seconds: float = 60
+
+    # per-user change events pushed to the clients subscribed to /users/{user_id}/changes, in process
+    change_feed_enabled: bool = True
+    # events buffered for a slow client before they are replaced with a single resync event
+    change_feed_max_pending_events: int = 100
+
+    # calendar years of logs kept in habit_logs, e.g. 2 for the current and the previous year. The older ones are moved
+    # to habit_logs_archive by "python -m app.cli archive-habit-logs" and only read by the ranges that reach them.
+    habit_logs_hot_years: int = 2
+
+    # write-behind of the progress of timer habits (goal_is_time): the PUTs of a log that is already tracked are kept
+    # in memory and flushed every habit_log_flush_seconds, and on shutdown, instead of being written one by one
+    habit_log_write_behind: bool = False
+    habit_log_flush_seconds: float = 2
+    # logs that aren't written for this long are no longer tracked, e.g. once their timer is stopped
+    habit_log_idle_seconds: float = 60
+
+    # per-route latency and query metrics, served by /internal/metrics
+    metrics_enabled: bool = True
+    # requests slower than this are logged with their SQL statements, disabled when None
+    slow_request_seconds: Optional[float] = None
 
     model_config = SettingsConfigDict(env_file=".env")
 
-settings = Settings()
\ No newline at end of file
+@lru_cache
+def get_settings() -> Settings:
+    """
+    Reads the settings from the environment and .env on first use, instead of at import time
+    """
+    return Settings()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import threading
+from typing import Annotated, Optional
+
+from fastapi import Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ..config import Settings, get_settings
+from ..services.metrics import attach_query_metrics
+from .database import get_pool_options, get_primary_host, pin_to_primary, READ_METHODS
+from .pool_statistics import PoolStatistics, TimedAsyncAdaptedQueuePool
+
+# Only imported when settings.db_async_mode is enabled, so the async driver is not required otherwise
+
+_async_engine: Optional[AsyncEngine] = None
+_async_engine_lock = threading.Lock()
+
+def build_async_database_url(settings: Settings) -> str:
+    # URL Structure: "mysql+<async_driver>://<username>:<password>@<host>:<port>/<database_name>"
+    return settings.db_async_url or f"mysql+{settings.db_async_driver}://{settings.db_username}:{settings.db_password}@{get_primary_host(settings)}:{settings.db_port}/{settings.db_name}"
+
+def create_pooled_async_engine(settings: Settings) -> AsyncEngine:
+    async_database_url = build_async_database_url(settings)
+    async_engine_options = get_pool_options(settings, async_database_url)
+    if async_engine_options:
+        async_engine_options["poolclass"] = TimedAsyncAdaptedQueuePool
+    async_engine = create_async_engine(async_database_url, **async_engine_options)
+    PoolStatistics("primary_async").attach(async_engine.sync_engine)
+    attach_query_metrics(async_engine.sync_engine)
+    return async_engine
+
+def init_async_engine(settings: Settings) -> AsyncEngine:
+    """
+    Creates the async engine from the given settings. Called by the app factory on startup.
+    """
+    global _async_engine
+    with _async_engine_lock:
+        _async_engine = create_pooled_async_engine(settings)
+        return _async_engine
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        with _async_engine_lock:
+            if _async_engine is None:
+                _async_engine = create_pooled_async_engine(get_settings())
+    return _async_engine
+
+async def close_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+async def get_async_session(request: Request, response: Response):
+    # the async engine is the primary's, the writes pin their client to it like the sync ones
+    if request.method not in READ_METHODS:
+        pin_to_primary(response)
+    # expire_on_commit is disabled because expired attributes can't be lazy loaded outside of an await
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
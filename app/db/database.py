@@ -1,18 +1,192 @@
-from typing import Annotated
+import threading
+from itertools import cycle
+from time import time
+from typing import Annotated, Dict, List, Optional
 
-from fastapi import Depends
+from fastapi import Depends, Request, Response
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
 from sqlmodel import create_engine, Session
-from ..config import settings
+from ..config import Settings, get_settings
+from ..services.metrics import attach_query_metrics
+from .pool_statistics import PoolStatistics, TimedQueuePool
 
-# URL Structure: "mysql+pymysql://<username>:<password>@<host>:<port>/<database_name>"
-DATABASE_URL = f"mysql+pymysql://{settings.db_username}:{settings.db_password}@{settings.db_dev_host}:{settings.db_port}/{settings.db_name}"
+# methods that don't write, their requests are served by the read replicas
+READ_METHODS = ("GET", "HEAD")
+# cookie that holds the time until which a client that just wrote reads from the primary
+PRIMARY_PIN_COOKIE = "db_primary_until"
 
-engine = create_engine(DATABASE_URL)
+def build_database_url(settings: Settings, host: str) -> str:
+    # URL Structure: "mysql+pymysql://<username>:<password>@<host>:<port>/<database_name>"
+    return f"mysql+pymysql://{settings.db_username}:{settings.db_password}@{host}:{settings.db_port}/{settings.db_name}"
 
-SessionLocal = Session(bind=engine)
+def get_primary_host(settings: Settings) -> str:
+    return settings.db_prd_host if settings.db_environment == "prd" else settings.db_dev_host
 
-def get_session():
-    with Session(engine) as session:
+def get_pool_options(settings: Settings, url: str) -> Dict:
+    """
+    Returns the create_engine options of the connection pool configured in the settings
+    """
+    if url.startswith("sqlite"):
+        # SQLite is only used for local testing and picks its own pool
+        return {}
+
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_timeout": settings.db_pool_timeout,
+        "connect_args": {"connect_timeout": settings.db_connect_timeout},
+    }
+
+def create_pooled_engine(settings: Settings, url: str, name: str) -> Engine:
+    """
+    Creates an engine with the pool configured in the settings, reporting to the pool statistics of the given name and
+    to the query metrics of the requests
+    """
+    engine_options = get_pool_options(settings, url)
+    if engine_options:
+        engine_options["poolclass"] = TimedQueuePool
+    pooled_engine = create_engine(url, **engine_options)
+    PoolStatistics(name).attach(pooled_engine)
+    attach_query_metrics(pooled_engine)
+    return pooled_engine
+
+
+class Database:
+    """
+    Engines of the primary and of the read replicas. Creating them doesn't connect, the pools open their connections
+    on first use or when they are warmed up.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        primary_url = settings.db_url or build_database_url(settings, get_primary_host(settings))
+        self.engine = create_pooled_engine(settings, primary_url, "primary")
+        replica_urls = settings.db_replica_urls or [build_database_url(settings, host)
+                                                    for host in settings.db_replica_hosts]
+        self.replica_engines: List[Engine] = [create_pooled_engine(settings, url, f"replica_{index}")
+                                              for index, url in enumerate(replica_urls, 1)]
+        self._next_replica_engines = cycle(self.replica_engines)
+        # time until which the replicas may not have caught up with the last write served by this worker
+        self.replicas_behind_until = 0.0
+
+    def get_read_engine(self, request: Request) -> Engine:
+        """
+        Returns the engine that serves the reads of a request: the next replica in round robin, or the primary when
+        there are no replicas or the client wrote in the last db_read_your_writes_seconds
+        """
+        if not self.replica_engines or is_pinned_to_primary(request):
+            return self.engine
+        return next(self._next_replica_engines)
+
+    def record_write(self):
+        """
+        Records that a write just went to the primary, which the replicas may not have applied for the next
+        db_read_your_writes_seconds
+        """
+        if self.replica_engines:
+            self.replicas_behind_until = time() + self.settings.db_read_your_writes_seconds
+
+    def is_cacheable_read(self, session: Session) -> bool:
+        """
+        Whether what a session read can be stored in the read cache: always when it's bound to the primary, and only
+        once the replicas have caught up with the last write of this worker when it's bound to a replica. The clients
+        that just wrote read from the primary, and the cache would otherwise serve them what a lagging replica returned
+        after the write invalidated it.
+        """
+        return session.get_bind() is self.engine or time() >= self.replicas_behind_until
+
+    def warm_up(self, connections: int):
+        """
+        Opens the given number of connections on every engine at once and returns them to their pools
+        """
+        for pooled_engine in (self.engine, *self.replica_engines):
+            opened_connections = []
+            try:
+                for _ in range(connections):
+                    connection = pooled_engine.connect()
+                    opened_connections.append(connection)
+                    connection.execute(text("SELECT 1"))
+            finally:
+                for connection in opened_connections:
+                    connection.close()
+
+    def dispose(self):
+        for pooled_engine in (self.engine, *self.replica_engines):
+            pooled_engine.dispose()
+
+
+_database: Optional[Database] = None
+_database_lock = threading.Lock()
+
+def init_database(settings: Settings) -> Database:
+    """
+    Creates the engines from the given settings, replacing the current ones. Called by the app factory on startup.
+    """
+    global _database
+    with _database_lock:
+        if _database is not None:
+            _database.dispose()
+        _database = Database(settings)
+        return _database
+
+def get_database() -> Database:
+    """
+    Returns the engines of the app, created from the environment settings on first use when the app factory
+    didn't create them, e.g. in the maintenance commands
+    """
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = Database(get_settings())
+    return _database
+
+def close_database():
+    global _database
+    with _database_lock:
+        if _database is not None:
+            _database.dispose()
+            _database = None
+
+def is_pinned_to_primary(request: Request) -> bool:
+    """
+    Whether the reads of a request go to the primary: the client wrote in the last db_read_your_writes_seconds, or
+    something the request reads was just written on its behalf, e.g. the pending habit logs flushed before it
+    """
+    if getattr(request.state, "reads_from_primary", False):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time()
+    except ValueError:
+        return False
+
+def get_read_engine(request: Request) -> Engine:
+    return get_database().get_read_engine(request)
+
+def pin_to_primary(response: Response):
+    """
+    Records a write of the request and pins its client to the primary until the replicas have caught up, so that the
+    client reads its own writes. Called by the session dependencies of the sync and of the async routes.
+    """
+    database = get_database()
+    database.record_write()
+    if database.replica_engines:
+        read_your_writes_seconds = database.settings.db_read_your_writes_seconds
+        response.set_cookie(PRIMARY_PIN_COOKIE, str(time() + read_your_writes_seconds),
+                            max_age=int(read_your_writes_seconds) + 1, httponly=True)
+
+def get_session(request: Request, response: Response):
+    database = get_database()
+    if request.method in READ_METHODS:
+        bind = database.get_read_engine(request)
+    else:
+        # writes go to the primary, and so do the reads of the client until its replicas have caught up
+        bind = database.engine
+        pin_to_primary(response)
+    with Session(bind) as session:
         yield session
 
-SessionDep = Annotated[Session, Depends(get_session)]
\ No newline at end of file
+SessionDep = Annotated[Session, Depends(get_session)]
@@ -0,0 +1,118 @@
+import threading
+from time import perf_counter
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolStatistics:
+    """
+    Collects live usage statistics of the connection pool of an engine, used to size the pool from real traffic
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._pool = None
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.connections_invalidated = 0
+        self.timed_waits = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def attach(self, engine: Engine):
+        self._pool = engine.pool
+        if isinstance(engine.pool, TimedCheckoutMixin):
+            engine.pool.statistics = self
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "close", self._on_close)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "engine_disposed", self._on_engine_disposed)
+        registered_pool_statistics[self.name] = self
+
+    def record_wait(self, wait_seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.timed_waits += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+            if timed_out:
+                self.checkout_timeouts += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections_opened += 1
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections_closed += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.connections_invalidated += 1
+
+    def _on_engine_disposed(self, engine: Engine):
+        self._pool = engine.pool
+
+    def snapshot(self) -> Dict:
+        pool = self._pool
+        with self._lock:
+            return {
+                "pool_size": pool.size() if isinstance(pool, QueuePool) else None,
+                "checked_out": pool.checkedout() if isinstance(pool, QueuePool) else None,
+                "checked_in": pool.checkedin() if isinstance(pool, QueuePool) else None,
+                "overflow": pool.overflow() if isinstance(pool, QueuePool) else None,
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "avg_wait_ms": self.total_wait_seconds * 1000 / self.timed_waits if self.timed_waits else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+                "connections_opened": self.connections_opened,
+                "connections_closed": self.connections_closed,
+                "connections_invalidated": self.connections_invalidated,
+            }
+
+
+class TimedCheckoutMixin:
+    """
+    Pool mixin that times how long every checkout waits for a connection, including opening a new one
+    """
+    statistics: Optional[PoolStatistics] = None
+
+    def _do_get(self):
+        started_at = perf_counter()
+        try:
+            connection_record = super()._do_get()
+        except PoolTimeoutError:
+            if self.statistics is not None:
+                self.statistics.record_wait(perf_counter() - started_at, timed_out=True)
+            raise
+        if self.statistics is not None:
+            self.statistics.record_wait(perf_counter() - started_at)
+        return connection_record
+
+    def recreate(self):
+        # the pool is recreated when the engine is disposed, keep reporting to the same statistics
+        pool = super().recreate()
+        pool.statistics = self.statistics
+        return pool
+
+
+class TimedQueuePool(TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+registered_pool_statistics: Dict[str, PoolStatistics] = {}
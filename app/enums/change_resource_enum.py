@@ -0,0 +1,8 @@
+from enum import Enum
+
+class ChangeResource(Enum):
+    HABITS = "habits"
+    HABIT_LOGS = "habit_logs"
+    CATEGORIES = "categories"
+    # sent instead of the events a slow subscriber missed, the client has to refresh everything
+    RESYNC = "resync"
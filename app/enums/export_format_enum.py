@@ -0,0 +1,5 @@
+from enum import Enum
+
+class ExportFormat(Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
@@ -0,0 +1,6 @@
+from enum import Enum
+
+class StatisticsBucket(Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
@@ -1,7 +1,13 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 
-from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import DateTime
+from sqlalchemy.dialects.mysql import DATETIME
+from sqlmodel import SQLModel, Field, Relationship, UniqueConstraint, Index
+
+# created_at and updated_at keep microseconds on MySQL too (DATETIME(6) instead of whole seconds), since they validate
+# the ETags and tell the writes apart, even when a row is written twice within the same second
+TIMESTAMP_TYPE = DateTime().with_variant(DATETIME(fsp=6), "mysql")
 
 
 class Users(SQLModel, table=True):
@@ -17,11 +23,19 @@ class HabitsCategoriesLink(SQLModel, table=True):
 
     habit_fk: int = Field(foreign_key="habits.id", primary_key=True)
     category_fk: int = Field(foreign_key="categories.id", primary_key=True)
-    created_at: datetime
-    updated_at: datetime
+    created_at: datetime = Field(sa_type=TIMESTAMP_TYPE)
+    updated_at: datetime = Field(sa_type=TIMESTAMP_TYPE)
 
 
 class Habits(SQLModel, table=True):
+    __table_args__ = (
+        # keyset pagination orders
+        Index("ix_habits_user_fk_display_order_id", "user_fk", "display_order", "id"),
+        Index("ix_habits_created_at_id", "created_at", "id"),
+        # the hot paths only read the habits that are not archived
+        Index("ix_habits_user_fk_is_archived_display_order_id", "user_fk", "is_archived", "display_order", "id"),
+    )
+
     id: int = Field(primary_key=True)
     name: str
     description: Optional[str] = None
@@ -30,7 +44,11 @@ class Habits(SQLModel, table=True):
     is_bad_habit: bool
     repeat_type: str
     repeat_config: Optional[str] = None
-    is_archived: bool
+    # compiled from repeat_type and repeat_config whenever the habit is written (see services/habit_schedule.py)
+    weekday_mask: int = 0
+    month_day_mask: int = 0
+    repeat_n: Optional[int] = None
+    is_archived: bool = False
     is_check_only: bool
     start_date: datetime
     end_date: Optional[datetime] = None
@@ -39,33 +57,75 @@ class Habits(SQLModel, table=True):
     goal_unit: Optional[str] = None
     goal_is_time: bool
     user_fk: int = Field(foreign_key="users.id")
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP_TYPE)
+    updated_at: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP_TYPE)
 
     categories: List["Categories"] = Relationship(back_populates="habits", link_model=HabitsCategoriesLink)
 
 
 class Categories(SQLModel, table=True):
+    __table_args__ = (
+        # keyset pagination order
+        Index("ix_categories_user_fk_created_at_id", "user_fk", "created_at", "id"),
+    )
+
     id: int = Field(primary_key=True)
     name: str
     icon: Optional[str] = None
     user_fk: int = Field(foreign_key="users.id")
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
+    created_at: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP_TYPE)
+    updated_at: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP_TYPE)
 
     habits: List["Habits"] = Relationship(back_populates="categories", link_model=HabitsCategoriesLink)
 
 
-class HabitLogs(SQLModel, table=True):
-    __tablename__ = "habit_logs"
-
+class HabitLogBase(SQLModel):
     id: int = Field(primary_key=True)
     habit_fk: int = Field(foreign_key="habits.id")
+    # day the log belongs to, there can only be one log per habit and day
+    log_date: date
     progress_value: Optional[float] = None
     note: Optional[str] = None
     # these are the goal value and goal unit at time of entry
     goal_value: Optional[int] = None
     goal_unit: Optional[str] = None
     completion_percentage: float
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
\ No newline at end of file
+    created_at: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP_TYPE)
+    updated_at: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP_TYPE)
+
+
+# logs of the last settings.habit_logs_hot_years calendar years, the ones read by the hot paths
+class HabitLogs(HabitLogBase, table=True):
+    __tablename__ = "habit_logs"
+    __table_args__ = (
+        UniqueConstraint("habit_fk", "log_date", name="uq_habit_logs_habit_fk_log_date"),
+        Index("ix_habit_logs_habit_fk_updated_at", "habit_fk", "updated_at"),
+    )
+
+
+# older logs, moved out of habit_logs with their IDs by "python -m app.cli archive-habit-logs" so that the hot table
+# and its indexes stay small as history builds up (see services/habit_log_archive.py)
+class HabitLogsArchive(HabitLogBase, table=True):
+    __tablename__ = "habit_logs_archive"
+    __table_args__ = (
+        UniqueConstraint("habit_fk", "log_date", name="uq_habit_logs_archive_habit_fk_log_date"),
+    )
+
+class HabitMonthlySummaries(SQLModel, table=True):
+    __tablename__ = "habit_monthly_summaries"
+
+    habit_fk: int = Field(foreign_key="habits.id", primary_key=True)
+    year: int = Field(primary_key=True)
+    month: int = Field(primary_key=True)
+    active_days: int = 0
+    perfect_days: int = 0
+    total_completed: float = 0
+    goal_unit: Optional[str] = None
+    longest_active_streak: int = 0
+    longest_perfect_streak: int = 0
+    # streaks that start on the first day and end on the last day of the month, used to stitch streaks across months
+    leading_active_streak: int = 0
+    trailing_active_streak: int = 0
+    leading_perfect_streak: int = 0
+    trailing_perfect_streak: int = 0
+    updated_at: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP_TYPE)
@@ -0,0 +1,33 @@
+from datetime import date, datetime
+from typing import List
+
+from fastapi import APIRouter, Depends, Request, Response
+from ..db.async_database import AsyncSessionDep
+from ..services.habit_log_buffer import flush_pending_habit_logs
+from ..schemas.schemas import UpsertHabitLogRequest, HabitLogResponse, YearlySummaryResponse
+from . import habits, habit_logs
+
+# Async versions of the hot routes, included ahead of the sync routers when settings.db_async_mode is enabled.
+# They run the sync route logic through AsyncSession.run_sync, where every query is awaited on the async driver
+# instead of blocking a threadpool worker.
+router = APIRouter(dependencies=[Depends(flush_pending_habit_logs)])
+
+
+@router.get("/users/{user_id}/habits-for-date")
+async def get_habits_to_complete_in_given_date(user_id: int, session: AsyncSessionDep,
+                                               param_date: datetime | None = None) -> List[int]:
+    return await session.run_sync(
+        lambda sync_session: habits.get_habits_to_complete_in_given_date(user_id, sync_session, param_date))
+
+@router.get("/habits/{habit_id}/year/{year}", response_model_exclude_unset=True)
+async def get_yearly_summary(habit_id: int, year: int, session: AsyncSessionDep, request: Request, response: Response,
+                             include_daily_progress: bool = True) -> YearlySummaryResponse:
+    return await session.run_sync(
+        lambda sync_session: habit_logs.get_yearly_summary(habit_id, year, sync_session, request, response,
+                                                           include_daily_progress))
+
+@router.put("/habits/{habit_id}/logs/{date}")
+async def upsert_habit_log(request_body: UpsertHabitLogRequest, habit_id: int, date: date, response: Response,
+                           session: AsyncSessionDep) -> HabitLogResponse:
+    return await session.run_sync(
+        lambda sync_session: habit_logs.upsert_habit_log(request_body, habit_id, date, response, sync_session))
@@ -1,44 +1,70 @@
+from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 from sqlmodel import select
 
 from ..db.database import SessionDep
+from ..enums.change_resource_enum import ChangeResource
 from ..models.models import Categories
-from ..schemas.schemas import CreateCategoryRequest, UpdateCategoryRequest, DeleteCategoryResponse
+from ..schemas.schemas import CreateCategoryRequest, UpdateCategoryRequest, DeleteCategoryResponse, CategoryResponse
+from ..services.cache import response_cache, user_categories_tag, user_habits_tag
+from ..services.change_feed import change_feed
+from ..services.etags import check_etag, with_etag
+from ..services.habit_categories import touch_habits_of_category
+from ..services.pagination import fetch_page, set_next_cursor_header, PageLimit
 
 router = APIRouter()
 
 @router.get("/users/{user_id}/categories")
-def get_categories_for_user(user_id: int, session: SessionDep) -> List[Categories]:
+def get_categories_for_user(user_id: int, session: SessionDep, request: Request, response: Response,
+                            limit: PageLimit = None, cursor: str | None = None) -> List[CategoryResponse]:
+    not_modified_response = check_etag(request, response, session, "user_categories",
+                                       {"user_id": user_id, "limit": limit, "cursor": cursor},
+                                       Categories.updated_at, Categories.user_fk == user_id)
+    if not_modified_response:
+        return not_modified_response
+
     statement = select(Categories).where(Categories.user_fk == user_id)
-    categories = session.exec(statement).all()
+    categories, next_cursor = response_cache.get_or_compute(
+        "user_categories", with_etag({"user_id": user_id, "limit": limit, "cursor": cursor}, response),
+        [user_categories_tag(user_id)],
+        lambda: fetch_page(statement, [Categories.created_at, Categories.id], session, limit, cursor), session)
+    set_next_cursor_header(response, next_cursor)
     return categories
 
 @router.post("/categories")
-def create_category(category: CreateCategoryRequest, session: SessionDep) -> Categories:
+def create_category(category: CreateCategoryRequest, session: SessionDep) -> CategoryResponse:
     new_category = Categories(**category.model_dump())
     session.add(new_category)
     session.commit()
     session.refresh(new_category)
+    response_cache.invalidate(user_categories_tag(new_category.user_fk))
+    change_feed.publish(new_category.user_fk, ChangeResource.CATEGORIES, [new_category.id])
     return new_category
 
 @router.patch("/categories/{category_id}")
-def update_category(category_id: int, updated_category: UpdateCategoryRequest, session: SessionDep) -> Categories:
+def update_category(category_id: int, updated_category: UpdateCategoryRequest, session: SessionDep) -> CategoryResponse:
     category = session.exec(select(Categories).where(Categories.id == category_id)).one()
     updated_category_dict = updated_category.model_dump(exclude_unset=True)
     for key, value in updated_category_dict.items():
         setattr(category, key, value)
+    category.updated_at = datetime.now()
+    # the category is embedded in the responses of its habits
+    touch_habits_of_category(category_id, session)
 
     session.add(category)
     session.commit()
     session.refresh(category)
+    response_cache.invalidate(user_categories_tag(category.user_fk), user_habits_tag(category.user_fk))
+    change_feed.publish(category.user_fk, ChangeResource.CATEGORIES, [category_id])
     return category
 
 @router.delete("/categories/{category_id}")
 def delete_category(category_id: int, session: SessionDep) -> DeleteCategoryResponse:
     statement = select(Categories).where(Categories.id == category_id)
     category = session.exec(statement).one()
+    touch_habits_of_category(category_id, session)
     session.delete(category)
     session.commit()
 
@@ -48,5 +74,7 @@ def delete_category(category_id: int, session: SessionDep) -> DeleteCategoryResp
         # TODO: Raise an exception
         pass
 
+    response_cache.invalidate(user_categories_tag(category.user_fk), user_habits_tag(category.user_fk))
+    change_feed.publish(category.user_fk, ChangeResource.CATEGORIES, [category_id])
     response = DeleteCategoryResponse(is_success=True)
     return response
\ No newline at end of file
@@ -0,0 +1,53 @@
+import asyncio
+
+import anyio
+from fastapi import APIRouter, WebSocket
+from fastapi.responses import StreamingResponse
+from ..services.change_feed import change_feed
+
+# Change streams that replace the polling of the habit lists and schedules: clients keep one of them open and refresh
+# the resources named by the events, see ChangeFeed for their format
+router = APIRouter()
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# comments are sent on idle streams so that proxies don't close them
+SSE_KEEP_ALIVE_SECONDS = 15
+
+
+@router.get("/users/{user_id}/changes", response_class=StreamingResponse)
+async def stream_changes(user_id: int) -> StreamingResponse:
+    """
+    Streams the change events of a user as Server-Sent Events, one JSON event per data line
+    """
+    async def events():
+        async with change_feed.subscribe(user_id) as subscription:
+            # sends the headers right away, so that the client knows it's subscribed
+            yield ": subscribed\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), SSE_KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+
+    return StreamingResponse(events(), media_type=SSE_MEDIA_TYPE,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.websocket("/users/{user_id}/changes/ws")
+async def stream_changes_over_websocket(websocket: WebSocket, user_id: int):
+    """
+    Sends the change events of a user as WebSocket text messages, one JSON event per message
+    """
+    await websocket.accept()
+    async with change_feed.subscribe(user_id) as subscription:
+        async with anyio.create_task_group() as task_group:
+            async def forward_events():
+                while True:
+                    await websocket.send_text(await subscription.get())
+
+            task_group.start_soon(forward_events)
+            # the messages of the client are ignored, receiving only waits for it to disconnect
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+            task_group.cancel_scope.cancel()
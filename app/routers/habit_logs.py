@@ -1,205 +1,277 @@
-from collections import defaultdict
-from datetime import date, timedelta, datetime
-from typing import Dict, Tuple, List
-
-from fastapi import APIRouter, Response, status
-from sqlmodel import select, func
-from ..db.database import SessionDep
-from ..models.models import HabitLogs
-from ..schemas.schemas import UpsertHabitLogRequest
-
-router = APIRouter()
-
+import json
+from datetime import date, datetime
+from typing import Annotated, Any, AsyncIterator, Set, Tuple, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+from ..db.database import SessionDep, get_read_engine, get_database
+from ..enums.change_resource_enum import ChangeResource
+from ..enums.export_format_enum import ExportFormat
+from ..enums.statistics_bucket_enum import StatisticsBucket
+from ..models.models import Habits, HabitLogs, HabitMonthlySummaries
+from ..schemas.schemas import UpsertHabitLogRequest, BulkHabitLogEntry, BulkHabitLogError, \
+    BulkUpsertHabitLogsResponse, HabitStatisticsResponse, HabitHeatmapResponse, UserSummaryResponse, HabitLogResponse, \
+    YearlySummaryResponse
+from ..services.cache import response_cache, habit_summary_tag, user_schedule_tag, user_habits_tag
+from ..services.change_feed import change_feed
+from ..services.etags import check_etag, with_etag
+from ..services.habit_log_buffer import habit_log_buffer, flush_pending_habit_logs
+from ..services.habit_log_exports import select_habit_logs_for_export, stream_habit_logs, EXPORT_MEDIA_TYPES
+from ..services.habit_logs import upsert_habit_log_row, bulk_upsert_habit_logs, BULK_UPSERT_CHUNK_SIZE
+from ..services.habit_statistics import resolve_date_range, build_habit_statistics, build_habit_heatmap, \
+    MAX_STATISTICS_RANGE_DAYS
+from ..services.habit_summaries import build_yearly_summary, refresh_monthly_summary, build_user_summary
+
+router = APIRouter(dependencies=[Depends(flush_pending_habit_logs)])
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MAX_BULK_ENTRIES = 50_000
+MAX_BULK_BODY_BYTES = 32 * 1024 * 1024
+
+
+def publish_habit_log_changes(habit_log_keys: Set[Tuple[int, date]], session: SessionDep):
+    """
+    Invalidates the cached summaries of the habits whose logs changed and the schedules of their users, and publishes
+    the changes to their users
+    :param habit_log_keys: (habit ID, log date) of the written logs
+    """
+    if not habit_log_keys:
+        return
+    habit_ids = {habit_id for habit_id, _ in habit_log_keys}
+    user_ids_by_habit_id = dict(session.exec(select(Habits.id, Habits.user_fk).where(Habits.id.in_(habit_ids))).all())
+    response_cache.invalidate(*[habit_summary_tag(habit_id) for habit_id in habit_ids],
+                              *[user_schedule_tag(user_id) for user_id in set(user_ids_by_habit_id.values())])
+    for user_id in set(user_ids_by_habit_id.values()):
+        user_keys = [key for key in habit_log_keys if user_ids_by_habit_id.get(key[0]) == user_id]
+        change_feed.publish(user_id, ChangeResource.HABIT_LOGS, [habit_id for habit_id, _ in user_keys],
+                            [log_date for _, log_date in user_keys])
 
 @router.put("/habits/{habit_id}/logs/{date}")
 def upsert_habit_log(request_body: UpsertHabitLogRequest, habit_id: int, date: date, response: Response,
-                     session: SessionDep):
-    statement = select(HabitLogs).where(HabitLogs.habit_fk == habit_id).where(func.date(HabitLogs.created_at) == date)
-    habit_log = session.exec(statement).one_or_none()
-    request_body_dict = request_body.model_dump(exclude_unset=True)
-
-    if habit_log:
-        habit_log_dict = habit_log.model_dump()
-        del habit_log_dict["created_at"]
-        del habit_log_dict["updated_at"]
-
-        if habit_log_dict["goal_value"] is None:
-            del habit_log_dict["goal_value"]
-        if habit_log_dict["goal_unit"] is None:
-            del habit_log_dict["goal_unit"]
-
-        if request_body_dict == habit_log_dict:
-            response.status_code = status.HTTP_200_OK
-            return habit_log
-
-        habit_log.progress_value = request_body.progress_value
-        habit_log.note = request_body.note
-        habit_log.goal_value = request_body.goal_value
-        habit_log.goal_value = request_body.goal_unit
-        habit_log.completion_percentage = request_body.completion_percentage
-        session.add(habit_log)
-        session.commit()
-        session.refresh(habit_log)
-        response.status_code = status.HTTP_200_OK
-        return habit_log
+                     session: SessionDep) -> HabitLogResponse:
+    values = request_body.model_dump()
+    if habit_log_buffer.is_enabled:
+        # the log of a running timer, acknowledged right away and written with the next flush
+        buffered_log = habit_log_buffer.write(habit_id, date, values)
+        if buffered_log is not None:
+            return buffered_log
+
+    habit_log, is_created, is_changed = upsert_habit_log_row(habit_id, date, values, session)
+    if is_changed:
+        refresh_monthly_summary(habit_id, date, session)
+    # detach the log so that it keeps the values it was just read with instead of being expired by the commit
+    session.expunge(habit_log)
+    session.commit()
+    if is_changed:
+        publish_habit_log_changes({(habit_id, date)}, session)
+
+    if habit_log_buffer.is_enabled:
+        habit = session.exec(select(Habits.goal_is_time, Habits.user_fk).where(Habits.id == habit_id)).one()
+        if habit.goal_is_time:
+            habit_log_buffer.track(habit_log, habit.user_fk)
+    response.status_code = status.HTTP_201_CREATED if is_created else status.HTTP_200_OK
+    return habit_log
+
+async def read_bulk_body(request: Request) -> AsyncIterator[bytes]:
+    """
+    Yields the chunks of the body of a bulk request as they arrive, and rejects it with a 413 as soon as it's over
+    MAX_BULK_BODY_BYTES, whether it declares its Content-Length or is chunked
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > MAX_BULK_BODY_BYTES:
+        raise HTTPException(status_code=413, detail=f"The body can't be larger than {MAX_BULK_BODY_BYTES} bytes")
+
+    body_size = 0
+    async for chunk in request.stream():
+        body_size += len(chunk)
+        if body_size > MAX_BULK_BODY_BYTES:
+            raise HTTPException(status_code=413, detail=f"The body can't be larger than {MAX_BULK_BODY_BYTES} bytes")
+        yield chunk
+
+async def read_bulk_habit_log_entries(request: Request) -> AsyncIterator[Union[bytes, Any]]:
+    """
+    Yields the raw entries of a bulk request, either a JSON array or NDJSON streamed line by line
+    """
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        buffer = b""
+        async for chunk in read_bulk_body(request):
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
     else:
-        new_habit_log = HabitLogs(**request_body_dict, habit_fk=habit_id)
-        session.add(new_habit_log)
-        session.commit()
-        session.refresh(new_habit_log)
-        response.status_code = status.HTTP_201_CREATED
-        return new_habit_log
-
-def get_longest_perfect_streak(logs):
-    if not logs or len(logs) < 2:
-        return 0
-
-    # Step 1: Group records by date and check for perfect days
-    perfect_dates = [
-        log.created_at.date()  # Single conversion: datetime → date
-        for log in logs
-        if log.completion_percentage == 100
-    ]
-
-    # If less than 2 perfect days exist, no streak possible
-    if len(perfect_dates) < 2:
-        return 0
-
-    # Step 2: Sort perfect dates
-    sorted_perfect_dates = sorted(perfect_dates)
-
-    # Step 3: Find longest consecutive sequence
-    max_streak = 0
-    current_streak = 1
-    for i in range(1, len(sorted_perfect_dates)):
-        # Check if dates are consecutive (1 day apart)
-        if (sorted_perfect_dates[i] - sorted_perfect_dates[i - 1]).days == 1:
-            current_streak += 1
-            max_streak = max(max_streak, current_streak)
-        else:
-            # Reset streak on gap
-            current_streak = 1
-
-    # Return streak only if it's 2 or more days
-    return max_streak if max_streak >= 2 else 0
-
-def get_longest_active_streak(logs):
-    if not logs or len(logs) < 2:
-        return 0
-
-    active_dates = [log.created_at.date() for log in logs]
-    sorted_active_dates = sorted(active_dates)
-    max_streak = 0
-    current_streak = 1
-
-    for i in range(1, len(sorted_active_dates)):
-        if (sorted_active_dates[i] - sorted_active_dates[i - 1]).days == 1:
-            current_streak += 1
-            max_streak = max(max_streak, current_streak)
-        else:
-            current_streak = 1
-
-    return max_streak if max_streak >= 2 else 0
-
-def create_monthly_summary(month_logs):
-    daily_progress = []
-    monthly_summary = {
-        "active_days": 0,
-        "longest_active_streak": 0,
-        "perfect_days": 0,
-        "longest_perfect_streak": 0,
-        "total_completed": 0
-    }
-
-    perfect_days = 0
-    total_completed = 0
-    goal_unit = month_logs[0].goal_unit
-    for i, log in enumerate(month_logs):
-        daily_progress.append({
-            "date": log.created_at.strftime("%m/%d/%Y"),
-            "completion_percentage": log.completion_percentage
-        })
-
-        if log.completion_percentage == 100:
-            perfect_days += 1
-
-        total_completed += log.progress_value
-
-    monthly_summary["active_days"] = len(month_logs)
-    monthly_summary["longest_active_streak"] = get_longest_active_streak(month_logs)
-    monthly_summary["perfect_days"] = perfect_days
-    monthly_summary["longest_perfect_streak"] = get_longest_perfect_streak(month_logs)
-    monthly_summary["total_completed"] = f"{total_completed} {goal_unit}"
-    return daily_progress, monthly_summary
-
-def calculate_yearly_totals(monthly_summaries: List[Dict]) -> Tuple[int, int]:
-    """
-    Function that calculates the yearly perfect_days and total_completed
-    :param monthly_summaries: list that contains monthly summaries to be processed
-    """
-    yearly_perfect_days = 0
-    yearly_total_completed = 0
-
-    for summary in monthly_summaries:
-        yearly_perfect_days += summary["perfect_days"]
-        # TODO: research how to keep consistency with the float thing here
-        yearly_total_completed += float(summary["total_completed"].split()[0])
-
-    return yearly_perfect_days, yearly_total_completed
-
-@router.get("/habits/{habit_id}/year/{year}")
-def get_yearly_summary(habit_id: int, year: int, session: SessionDep):
-    yearly_habit_logs_statement = select(HabitLogs).where(HabitLogs.habit_fk == habit_id).where(
-        func.year(HabitLogs.created_at) == year).order_by(HabitLogs.created_at)
-    yearly_habit_logs = session.exec(yearly_habit_logs_statement).all()
-
-    response = {
-        "monthly_data": {},
-        "yearly_summary": {}
-    }
-
-    if len(yearly_habit_logs) == 0:
-        return response
-
-    logs_by_month = {i: [] for i in range(1, 13)}
-    num_to_month = {
-        1: "january",
-        2: "february",
-        3: "march",
-        4: "april",
-        5: "may",
-        6: "june",
-        7: "july",
-        8: "august",
-        9: "september",
-        10: "october",
-        11: "november",
-        12: "december"
-    }
-    for log in yearly_habit_logs:
-        month_number = log.created_at.month
-        logs_by_month[month_number].append(log)
-
-    monthly_data = defaultdict(dict)
-    for i in range(1, 13):
-        if len(logs_by_month[i]) > 0:
-            daily_progress, monthly_summary = create_monthly_summary(logs_by_month[i])
-            monthly_data[num_to_month[i]]["daily_progress"] = daily_progress
-            monthly_data[num_to_month[i]]["monthly_summary"] = monthly_summary
-    response["monthly_data"] = monthly_data
-
-    # Create yearly summary
-    monthly_summaries = []
-    for i in range(1, 13):
-        if num_to_month[i] in monthly_data:
-            monthly_summaries.append(monthly_data[num_to_month[i]]["monthly_summary"])
-    perfect_days_in_year, total_completed_in_year = calculate_yearly_totals(monthly_summaries)
-    yearly_summary = {
-        "active_days": len(yearly_habit_logs),
-        "longest_active_streak": get_longest_active_streak(yearly_habit_logs),
-        "perfect_days": perfect_days_in_year,
-        "longest_perfect_streak": get_longest_perfect_streak(yearly_habit_logs),
-        "total_completed": f"{total_completed_in_year} {yearly_habit_logs[0].goal_unit}"
-    }
-    response["yearly_summary"] = yearly_summary
+        body = b"".join([chunk async for chunk in read_bulk_body(request)])
+        try:
+            entries = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid JSON body")
+        if not isinstance(entries, list):
+            raise HTTPException(status_code=422, detail="Expected a JSON array of habit log entries")
+        for entry in entries:
+            yield entry
+
+async def aenumerate(iterable: AsyncIterator):
+    index = 0
+    async for item in iterable:
+        yield index, item
+        index += 1
+
+def merge_bulk_responses(response: BulkUpsertHabitLogsResponse, chunk_response: BulkUpsertHabitLogsResponse):
+    response.created.extend(chunk_response.created)
+    response.updated.extend(chunk_response.updated)
+    response.unchanged.extend(chunk_response.unchanged)
+    response.errors.extend(chunk_response.errors)
+
+@router.post("/habit-logs/bulk")
+async def upsert_habit_logs_in_bulk(request: Request, session: SessionDep) -> BulkUpsertHabitLogsResponse:
+    """
+    Upserts many habit logs at once, e.g. the progress buffered by a client while it was offline. Accepts a JSON array
+    or NDJSON of BulkHabitLogEntry, and writes them in chunks of multi-row statements.
+    :return: indexes of the created, updated, unchanged and rejected entries
+    """
+    if habit_log_buffer.has_unwritten_logs():
+        # so that the buffered values don't overwrite the entries of the request later
+        await run_in_threadpool(habit_log_buffer.flush, get_database().engine)
+
+    response = BulkUpsertHabitLogsResponse()
+    # every entry is read and validated before the first write, so that a request over the limit writes nothing
+    entries = []
+    async for index, raw_entry in aenumerate(read_bulk_habit_log_entries(request)):
+        if index >= MAX_BULK_ENTRIES:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ENTRIES} entries can be sent at once")
+        try:
+            if isinstance(raw_entry, bytes):
+                entry = BulkHabitLogEntry.model_validate_json(raw_entry)
+            else:
+                entry = BulkHabitLogEntry.model_validate(raw_entry)
+        except ValidationError as error:
+            detail = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+            response.errors.append(BulkHabitLogError(index=index, detail=detail))
+            continue
+        entries.append((index, entry))
+
+    written_keys = set()
+    try:
+        for start in range(0, len(entries), BULK_UPSERT_CHUNK_SIZE):
+            chunk = entries[start:start + BULK_UPSERT_CHUNK_SIZE]
+            chunk_response = await run_in_threadpool(bulk_upsert_habit_logs, chunk, session)
+            merge_bulk_responses(response, chunk_response)
+            written_indexes = set(chunk_response.created + chunk_response.updated)
+            written_keys.update((entry.habit_id, entry.log_date) for index, entry in chunk if index in written_indexes)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        # the chunks are committed one by one, the ones written before a failure are published as well
+        await run_in_threadpool(publish_habit_log_changes, written_keys, session)
+    # the entries rejected by the validation come before the ones rejected while writing
+    response.errors.sort(key=lambda error: error.index)
     return response
+
+@router.get("/habits/{habit_id}/year/{year}", response_model_exclude_unset=True)
+def get_yearly_summary(habit_id: int, year: int, session: SessionDep, request: Request, response: Response,
+                       include_daily_progress: bool = True) -> YearlySummaryResponse:
+    # the summary rows of a month are rewritten with every change of its logs, so they also validate daily_progress
+    not_modified_response = check_etag(
+        request, response, session, "yearly_summary",
+        {"habit_id": habit_id, "year": year, "include_daily_progress": include_daily_progress},
+        HabitMonthlySummaries.updated_at, HabitMonthlySummaries.habit_fk == habit_id,
+        HabitMonthlySummaries.year == year)
+    if not_modified_response:
+        return not_modified_response
+
+    return response_cache.get_or_compute(
+        "yearly_summary",
+        with_etag({"habit_id": habit_id, "year": year, "include_daily_progress": include_daily_progress}, response),
+        [habit_summary_tag(habit_id)], lambda: build_yearly_summary(habit_id, year, session, include_daily_progress),
+        session)
+
+@router.get("/users/{user_id}/summary")
+def get_user_summary(user_id: int, session: SessionDep, param_date: date | None = None) -> UserSummaryResponse:
+    """
+    Returns the current streak, longest streak, completion rate and progress of the week of every habit of a user,
+    to draw the stats overview in one request
+    :param param_date: date the summary is built for, today by default
+    """
+    today = param_date or date.today()
+    # every log write invalidates the schedule tag of the user
+    return response_cache.get_or_compute(
+        "user_summary", {"user_id": user_id, "date": today}, [user_habits_tag(user_id), user_schedule_tag(user_id)],
+        lambda: build_user_summary(user_id, today, session), session)
+
+@router.get("/habits/{habit_id}/statistics")
+def get_habit_statistics(habit_id: int, session: SessionDep, request: Request, response: Response,
+                         start_date: date | None = None, end_date: date | None = None,
+                         days: Annotated[int | None, Query(ge=1, le=MAX_STATISTICS_RANGE_DAYS)] = None,
+                         bucket: StatisticsBucket = StatisticsBucket.MONTH) -> HabitStatisticsResponse:
+    """
+    Returns the statistics of a habit over a date range, split into daily, weekly or monthly buckets
+    :param start_date: first date of the range
+    :param end_date: last date of the range (inclusive), today by default
+    :param days: length of a rolling range that ends on end_date, e.g. 30, 90 or 365, instead of start_date
+    :param bucket: size of the buckets
+    """
+    start_date, end_date = resolve_date_range(start_date, end_date, days)
+    params = {"habit_id": habit_id, "start_date": start_date, "end_date": end_date, "bucket": bucket.value}
+    not_modified_response = check_etag(request, response, session, "habit_statistics", params,
+                                       HabitLogs.updated_at, HabitLogs.habit_fk == habit_id,
+                                       HabitLogs.log_date >= start_date, HabitLogs.log_date <= end_date)
+    if not_modified_response:
+        return not_modified_response
+
+    return response_cache.get_or_compute(
+        "habit_statistics", with_etag(params, response), [habit_summary_tag(habit_id)],
+        lambda: build_habit_statistics(habit_id, start_date, end_date, bucket, session), session)
+
+@router.get("/habits/{habit_id}/heatmap")
+def get_habit_heatmap(habit_id: int, session: SessionDep, request: Request, response: Response,
+                      start_date: date | None = None, end_date: date | None = None,
+                      days: Annotated[int | None, Query(ge=1, le=MAX_STATISTICS_RANGE_DAYS)] = None) -> HabitHeatmapResponse:
+    """
+    Returns the completion percentage of every logged day of a range, to draw a per-day heatmap. The last 365 days
+    by default.
+    """
+    start_date, end_date = resolve_date_range(start_date, end_date, days)
+    params = {"habit_id": habit_id, "start_date": start_date, "end_date": end_date}
+    not_modified_response = check_etag(request, response, session, "habit_heatmap", params,
+                                       HabitLogs.updated_at, HabitLogs.habit_fk == habit_id,
+                                       HabitLogs.log_date >= start_date, HabitLogs.log_date <= end_date)
+    if not_modified_response:
+        return not_modified_response
+
+    return response_cache.get_or_compute(
+        "habit_heatmap", with_etag(params, response), [habit_summary_tag(habit_id)],
+        lambda: build_habit_heatmap(habit_id, start_date, end_date, session), session)
+
+def build_export_response(request: Request, statement, export_format: ExportFormat,
+                          filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_habit_logs(statement, export_format, get_read_engine(request)),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"'},
+    )
+
+@router.get("/habits/{habit_id}/logs/export")
+def export_habit_logs_for_habit(habit_id: int, request: Request, export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.NDJSON,
+                                since: datetime | None = None) -> StreamingResponse:
+    """
+    Streams every log of a habit as NDJSON or CSV
+    :param since: only export the logs created or updated at or after this timestamp, for incremental syncs
+    """
+    statement = select_habit_logs_for_export(habit_id=habit_id, since=since)
+    return build_export_response(request, statement, export_format, f"habit_{habit_id}_logs")
+
+@router.get("/users/{user_id}/logs/export")
+def export_habit_logs_for_user(user_id: int, request: Request, export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.NDJSON,
+                               since: datetime | None = None) -> StreamingResponse:
+    """
+    Streams the logs of every habit of a user as NDJSON or CSV
+    :param since: only export the logs created or updated at or after this timestamp, for incremental syncs
+    """
+    statement = select_habit_logs_for_export(user_id=user_id, since=since)
+    return build_export_response(request, statement, export_format, f"user_{user_id}_logs")
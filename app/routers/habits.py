@@ -1,218 +1,262 @@
-from datetime import date, datetime
-from typing import List, Annotated
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Annotated
 
-from fastapi import APIRouter, HTTPException, Query
-from sqlmodel import select, func, desc, distinct
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import selectinload
+from sqlmodel import select, update, func, desc, distinct, case
 from ..db.database import SessionDep
-from ..enums.repeat_type_enum import RepeatType
+from ..enums.change_resource_enum import ChangeResource
 from ..models.models import Habits, HabitLogs, Categories, HabitsCategoriesLink
 from ..schemas.schemas import UpsertHabitRequest, UpdateHabitCategoriesRequest, DeleteHabitResponse, \
-    ReorderHabitsRequest, ReorderHabitsResponse
-
-router = APIRouter()
+    ReorderHabitsRequest, ReorderHabitsResponse, CategoryResponse, BulkAssignHabitCategoriesRequest, \
+    BulkAssignHabitCategoriesResponse, HabitResponse, HabitWithCategoriesResponse, HabitLogResponse
+from ..services.cache import response_cache, user_habits_tag, user_schedule_tag, habit_summary_tag
+from ..services.change_feed import change_feed
+from ..services.etags import check_etag, with_etag
+from ..services.habit_categories import validate_habit_and_category_ids, link_categories_to_habits, \
+    unlink_categories_from_habit, get_categories_for_habits, touch_habits, serialize_habits
+from ..services.habit_log_archive import get_habit_logs_entity_for_habit
+from ..services.habit_log_buffer import habit_log_buffer, flush_pending_habit_logs
+from ..services.pagination import paginate_into_response, fetch_page, set_next_cursor_header, PageLimit, \
+    DEFAULT_PAGE_SIZE, decode_cursor
+from ..services.habit_schedule import get_habit_ids_due_on_date, get_habit_ids_due_in_date_range, \
+    apply_compiled_repeat_rule, build_calendar_rule_filter, MAX_SCHEDULE_RANGE_DAYS
+
+router = APIRouter(dependencies=[Depends(flush_pending_habit_logs)])
 
 # TODO: Add docstring comments
 # TODO: Move the logic and helper functions of these endpoints to the services directory
 
 # TODO: Might want to delete this endpoint after development, as there is no need to get all the habits
 @router.get("/habits")
-def get_habits(session: SessionDep):
-    habits = session.exec(select(Habits)).all()
+def get_habits(session: SessionDep, response: Response, limit: PageLimit = DEFAULT_PAGE_SIZE,
+               cursor: str | None = None) -> List[HabitResponse]:
+    habits = paginate_into_response(select(Habits), [Habits.created_at, Habits.id], session, response, limit, cursor)
     return habits
 
-@router.get("/users/{user_id}/habits")
-def get_habits_for_user(user_id: int, session: SessionDep):
-    statement = select(Habits).where(Habits.user_fk == user_id).order_by(desc(Habits.display_order))
-    habits = session.exec(statement).all()
+@router.get("/users/{user_id}/habits", response_model_exclude_unset=True)
+def get_habits_for_user(user_id: int, session: SessionDep, request: Request, response: Response,
+                        limit: PageLimit = None, cursor: str | None = None, include_categories: bool = False,
+                        include_archived: bool = False) -> List[HabitWithCategoriesResponse]:
+    params = {"user_id": user_id, "limit": limit, "cursor": cursor, "include_categories": include_categories,
+              "include_archived": include_archived}
+    conditions = [Habits.user_fk == user_id]
+    if not include_archived:
+        # skipped through the (user_fk, is_archived, display_order, id) index
+        conditions.append(Habits.is_archived == False)
+    not_modified_response = check_etag(request, response, session, "user_habits", params,
+                                       Habits.updated_at, *conditions)
+    if not_modified_response:
+        return not_modified_response
+
+    statement = select(Habits).where(*conditions)
+    if include_categories:
+        statement = statement.options(selectinload(Habits.categories))
+
+    def load_habits():
+        habits, next_cursor = fetch_page(statement, [Habits.display_order, Habits.id], session, limit, cursor,
+                                         descending=True)
+        return serialize_habits(habits, include_categories), next_cursor
+
+    habits, next_cursor = response_cache.get_or_compute("user_habits", with_etag(params, response),
+                                                        [user_habits_tag(user_id)], load_habits, session)
+    set_next_cursor_header(response, next_cursor)
     return habits
 
-def is_date_in_list_of_specific_weekdays(repeat_config: str, given_date: datetime | None):
-    if not repeat_config:
-        return False
-
-    weekday = given_date if given_date else datetime.now()
-    weekday_index = weekday.weekday()
-    weekdays = repeat_config.split(",")
-    weekday_strings = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
-    return weekday_strings[weekday_index].lower() in [weekday.lower() for weekday in weekdays]
-
-def is_date_in_list_of_specific_month_days(repeat_config: str, given_date: datetime | None):
-    if not repeat_config:
-        return False
-
-    month_days = repeat_config.split(",")
-    today = given_date.day if given_date else datetime.today().day
-    return today in [int(day) for day in month_days]
-
-def is_n_times_per_week_goal_met(repeat_config: str, habit_id: int, given_date: datetime, session: SessionDep):
-    if not repeat_config:
-        return False
-
-    n = int(repeat_config)
-    statement = (select(HabitLogs)
-                 .where(HabitLogs.habit_fk == habit_id)
-                 .order_by(desc(HabitLogs.created_at))
-                 .limit(n))
-    last_n_habit_logs = session.exec(statement).all()
-    if not last_n_habit_logs:
-        return False
-
-    oldest_log_date = last_n_habit_logs[-1].created_at
-    oldest_log_year_and_week = oldest_log_date.isocalendar()[:2]
-    # isocalendar returns year, week, weekday. We're slicing out the weekday so that we only compare year and week
-    today_year_and_week = given_date.isocalendar()[:2] if given_date else datetime.now().isocalendar()[:2]
-    return oldest_log_year_and_week == today_year_and_week
-
-def is_n_times_per_month_goal_met(repeat_config: str, habit_id: int, given_date: datetime, session: SessionDep):
-    if not repeat_config:
-        return False
-
-    n = int(repeat_config)
-    statement = (select(HabitLogs)
-                 .where(HabitLogs.habit_fk == habit_id)
-                 .order_by(desc(HabitLogs.created_at))
-                 .limit(n))
-    last_n_habit_logs = session.exec(statement).all()
-    if not last_n_habit_logs:
-        return False
-
-    oldest_log_date = last_n_habit_logs[-1].created_at
-    today = given_date if given_date else datetime.now()
-    return oldest_log_date.month == today.month
-
-def habit_was_last_displayed_n_or_more_days_ago(repeat_config: str, habit_id: int, given_date: datetime, session: SessionDep):
-    if not repeat_config:
-        return False
-
-    n = int(repeat_config)
-    today = given_date.date() if given_date else datetime.now().date()
-    statement = (select(HabitLogs)
-                 .where(HabitLogs.habit_fk == habit_id)
-                 .where(HabitLogs.created_at < today)
-                 .order_by(desc(HabitLogs.created_at))
-                 .limit(1))
-    latest_habit_log = session.exec(statement).all()
-    # We return true because if there are no habit_log records, that means this habit has never been displayed
-    if not latest_habit_log:
-        return True
-
-    latest_habit_log_date = latest_habit_log[0].created_at.date()
-    days_difference = (today - latest_habit_log_date).days
-    return days_difference >= n
-
 @router.get("/users/{user_id}/habits-for-date")
-def get_habits_to_complete_in_given_date(user_id: int, session: SessionDep, param_date: datetime | None = None):
-    statement = select(Habits).where(Habits.user_fk == user_id).order_by(desc(Habits.display_order))
-    habits = session.exec(statement).all()
-    habits_to_complete_ids = []
-    for habit in habits:
-        repeat_type = habit.repeat_type
-        # TODO: Update all these helper functions so that it throws an exception when the repeat_config is None instead of returning False
-        match repeat_type:
-            case RepeatType.DAILY.value:
-                habits_to_complete_ids.append(habit.id)
-            case RepeatType.SPECIFIC_WEEKDAYS.value:
-                if is_date_in_list_of_specific_weekdays(habit.repeat_config, param_date):
-                    habits_to_complete_ids.append(habit.id)
-            case RepeatType.SPECIFIC_MONTH_DAYS.value:
-                if is_date_in_list_of_specific_month_days(habit.repeat_config, param_date):
-                    habits_to_complete_ids.append(habit.id)
-            case RepeatType.N_TIMES_PER_WEEK.value:
-                if not is_n_times_per_week_goal_met(habit.repeat_config, habit.id, param_date, session):
-                    habits_to_complete_ids.append(habit.id)
-            case RepeatType.N_TIMES_PER_MONTH.value:
-                if not is_n_times_per_month_goal_met(habit.repeat_config, habit.id, param_date, session):
-                    habits_to_complete_ids.append(habit.id)
-            case RepeatType.EVERY_N_DAYS.value:
-                if habit_was_last_displayed_n_or_more_days_ago(habit.repeat_config, habit.id, param_date, session):
-                    habits_to_complete_ids.append(habit.id)
-
-    return habits_to_complete_ids
+def get_habits_to_complete_in_given_date(user_id: int, session: SessionDep,
+                                         param_date: datetime | None = None) -> List[int]:
+    given_date = param_date.date() if param_date else datetime.now().date()
+
+    def load_habit_ids_due_on_date():
+        statement = (select(Habits)
+                     .where(Habits.user_fk == user_id)
+                     .where(Habits.is_archived == False)
+                     .where(build_calendar_rule_filter(given_date))
+                     .order_by(desc(Habits.display_order)))
+        habits = session.exec(statement).all()
+        return get_habit_ids_due_on_date(habits, given_date, session)
+
+    return response_cache.get_or_compute("habits_for_date", {"user_id": user_id, "date": given_date},
+                                         [user_schedule_tag(user_id)], load_habit_ids_due_on_date,
+                                         session)
+
+@router.get("/users/{user_id}/habits-for-date-range")
+def get_habits_to_complete_in_date_range(user_id: int, start_date: date, end_date: date,
+                                         session: SessionDep) -> Dict[date, List[int]]:
+    """
+    Returns the IDs of the habits to complete on every date of the given range, e.g. to draw week and month views
+    :param user_id: ID of the user the habits belong to
+    :param start_date: first date of the range
+    :param end_date: last date of the range (inclusive)
+    :param session: current DB session
+    :return: dict that maps every date of the range to a list of habit IDs
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if (end_date - start_date).days >= MAX_SCHEDULE_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date ranges can span at most {MAX_SCHEDULE_RANGE_DAYS} days")
+
+    def load_habit_ids_due_in_date_range():
+        statement = (select(Habits)
+                     .where(Habits.user_fk == user_id)
+                     .where(Habits.is_archived == False)
+                     .order_by(desc(Habits.display_order)))
+        habits = session.exec(statement).all()
+        return get_habit_ids_due_in_date_range(habits, start_date, end_date, session)
+
+    return response_cache.get_or_compute(
+        "habits_for_date_range", {"user_id": user_id, "start_date": start_date, "end_date": end_date},
+        [user_schedule_tag(user_id)], load_habit_ids_due_in_date_range, session)
+
+def invalidate_habit_categories_caches(habit_ids: Iterable[int], session: SessionDep):
+    """
+    Invalidates the cached habit lists of the users whose habits were linked to or unlinked from categories, and
+    publishes the changed habits to them
+    """
+    habits = session.exec(select(Habits.id, Habits.user_fk).where(Habits.id.in_(set(habit_ids)))).all()
+    user_ids = {habit.user_fk for habit in habits}
+    response_cache.invalidate(*[user_habits_tag(user_id) for user_id in user_ids])
+    for user_id in user_ids:
+        change_feed.publish(user_id, ChangeResource.HABITS, [habit.id for habit in habits if habit.user_fk == user_id])
 
 @router.get("/habits/{habit_id}/categories")
-def get_categories_for_habit(habit_id: int, session: SessionDep):
-    statement = select(Habits).where(Habits.id == habit_id)
-    habit = session.exec(statement).one_or_none()
-    return habit.categories
+def get_categories_for_habit(habit_id: int, session: SessionDep) -> List[CategoryResponse]:
+    return get_categories_for_habits([habit_id], session)[habit_id]
 
 @router.post("/habits/{habit_id}/categories")
-def add_categories_for_habit(habit_id: int, request_body: UpdateHabitCategoriesRequest, session: SessionDep):
-    # TODO: Add input validation to avoid adding categories that already exist
-    habit = session.exec(select(Habits).where(Habits.id == habit_id)).one()
-
-    for category_id in request_body.category_ids:
-        category = session.exec(select(Categories).where(Categories.id == category_id)).one()
-        habit.categories.append(category)
-
-    session.add(habit)
+def add_categories_for_habit(habit_id: int, request_body: UpdateHabitCategoriesRequest,
+                             session: SessionDep) -> List[CategoryResponse]:
+    validate_habit_and_category_ids([habit_id], request_body.category_ids, session)
+    link_categories_to_habits({habit_id: request_body.category_ids}, session)
+    touch_habits([habit_id], session)
     session.commit()
-    return habit.categories
+    invalidate_habit_categories_caches([habit_id], session)
+    return get_categories_for_habits([habit_id], session)[habit_id]
 
 @router.delete("/habits/{habit_id}/categories")
-def delete_category_from_habit(habit_id: int, request_body: UpdateHabitCategoriesRequest, session: SessionDep):
-    habit = session.exec(select(Habits).where(Habits.id == habit_id)).one()
-
-    for category_id in request_body.category_ids:
-        category = session.exec(select(Categories).where(Categories.id == category_id)).one()
-        habit.categories.remove(category)
+def delete_category_from_habit(habit_id: int, request_body: UpdateHabitCategoriesRequest,
+                               session: SessionDep) -> List[CategoryResponse]:
+    validate_habit_and_category_ids([habit_id], request_body.category_ids, session)
+    unlink_categories_from_habit(habit_id, request_body.category_ids, session)
+    touch_habits([habit_id], session)
+    session.commit()
+    invalidate_habit_categories_caches([habit_id], session)
+    return get_categories_for_habits([habit_id], session)[habit_id]
 
-    session.add(habit)
+@router.post("/habits-categories/bulk")
+def assign_categories_to_habits(request_body: BulkAssignHabitCategoriesRequest,
+                                session: SessionDep) -> BulkAssignHabitCategoriesResponse:
+    """
+    Links categories to many habits at once, links that already exist are skipped
+    :param request_body: habits and the IDs of the categories to link each of them to
+    :param session: current DB session
+    :return: number of links created and the resulting category IDs of every habit
+    """
+    category_ids_by_habit_id: Dict[int, set] = {}
+    for assignment in request_body.assignments:
+        category_ids_by_habit_id.setdefault(assignment.habit_id, set()).update(assignment.category_ids)
+    all_category_ids = set().union(*category_ids_by_habit_id.values())
+    validate_habit_and_category_ids(category_ids_by_habit_id.keys(), all_category_ids, session)
+
+    created_links = link_categories_to_habits(category_ids_by_habit_id, session)
+    touch_habits(category_ids_by_habit_id.keys(), session)
     session.commit()
-    return habit.categories
+    invalidate_habit_categories_caches(category_ids_by_habit_id.keys(), session)
+    categories_by_habit_id = get_categories_for_habits(category_ids_by_habit_id.keys(), session)
+    return BulkAssignHabitCategoriesResponse(
+        created_links=created_links,
+        category_ids_by_habit_id={habit_id: [category.id for category in categories]
+                                  for habit_id, categories in categories_by_habit_id.items()},
+    )
 
 @router.get("/habits/{habit_id}/logs")
-def get_habit_logs_for_habit(habit_id: int, session: SessionDep):
-    statement = select(HabitLogs).where(HabitLogs.habit_fk == habit_id)
-    habit_logs = session.exec(statement).all()
+def get_habit_logs_for_habit(habit_id: int, session: SessionDep, request: Request, response: Response,
+                             limit: PageLimit = None, cursor: str | None = None) -> List[HabitLogResponse]:
+    not_modified_response = check_etag(request, response, session, "habit_logs",
+                                       {"habit_id": habit_id, "limit": limit, "cursor": cursor},
+                                       HabitLogs.updated_at, HabitLogs.habit_fk == habit_id)
+    if not_modified_response:
+        return not_modified_response
+
+    # every log, including the archived ones unless the page starts after them or the habit has none
+    first_date = None
+    if cursor is not None:
+        try:
+            first_date = decode_cursor(cursor, [HabitLogs.log_date])[0] + timedelta(days=1)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+    logs = get_habit_logs_entity_for_habit(habit_id, first_date, session)
+    statement = select(logs).where(logs.habit_fk == habit_id)
+    # log_date is unique per habit, so it orders the logs on its own through the (habit_fk, log_date) index
+    habit_logs = paginate_into_response(statement, [logs.log_date], session, response, limit, cursor)
     return habit_logs
 
 @router.post("/habits")
-def create_habit(habit: UpsertHabitRequest, session: SessionDep):
-    new_habit = Habits(**habit.model_dump())
-    get_greatest_display_order_statement = select(func.max(Habits.display_order))
+def create_habit(habit: UpsertHabitRequest, session: SessionDep) -> HabitResponse:
+    # the fields left out or null keep the defaults of the model, e.g. is_archived
+    new_habit = Habits(**habit.model_dump(exclude_none=True))
+    try:
+        apply_compiled_repeat_rule(new_habit)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    get_greatest_display_order_statement = (select(func.max(Habits.display_order))
+                                            .where(Habits.user_fk == new_habit.user_fk))
     greatest_display_order = session.exec(get_greatest_display_order_statement).one()
     new_habit.display_order = (greatest_display_order or 0) + 1
     session.add(new_habit)
     session.commit()
     session.refresh(new_habit)
+    response_cache.invalidate(user_habits_tag(new_habit.user_fk), user_schedule_tag(new_habit.user_fk))
+    change_feed.publish(new_habit.user_fk, ChangeResource.HABITS, [new_habit.id])
     return new_habit
 
 @router.patch("/habits/{habit_id}")
-def update_habit(habit_id: int, updated_habit: UpsertHabitRequest, session: SessionDep):
+def update_habit(habit_id: int, updated_habit: UpsertHabitRequest, session: SessionDep) -> HabitResponse:
     get_habit_statement = select(Habits).where(Habits.id == habit_id)
     habit = session.exec(get_habit_statement).one()
 
     updated_habit_dict = updated_habit.model_dump(exclude_unset=True)
     for key, value in updated_habit_dict.items():
         setattr(habit, key, value)
+    habit.updated_at = datetime.now()
+    try:
+        apply_compiled_repeat_rule(habit)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
 
     session.add(habit)
     session.commit()
     session.refresh(habit)
+    response_cache.invalidate(user_habits_tag(habit.user_fk), user_schedule_tag(habit.user_fk))
+    change_feed.publish(habit.user_fk, ChangeResource.HABITS, [habit.id])
     return habit
 
-def balance_display_order_fields(deleted_display_order: int, session: SessionDep):
+def balance_display_order_fields(user_id: int, deleted_display_order: int, session: SessionDep):
     """
-    Updates the display_order fields to remove gaps and ensure they are sequential, typically after habit deletion.
+    Updates the display_order fields of a user's habits to remove gaps and ensure they are sequential, typically after
+    habit deletion. It runs a single UPDATE and doesn't commit, so that it's applied in the same transaction as the
+    deletion.
+    :param user_id: ID of the user the deleted habit belonged to
     :param deleted_display_order: display order of the deleted habit
     :param session: current DB session
     """
-    statement = select(Habits).where(Habits.display_order > deleted_display_order)
-    habits_to_update = session.exec(statement).all()
-
-    for habit in habits_to_update:
-        habit.display_order = habit.display_order - 1
-
-    if habits_to_update:
-        session.add_all(habits_to_update)
-        session.commit()
+    statement = (
+        update(Habits)
+        .where(Habits.user_fk == user_id)
+        .where(Habits.display_order > deleted_display_order)
+        .values(display_order=Habits.display_order - 1, updated_at=datetime.now())
+    )
+    session.exec(statement)
 
 @router.delete("/habits/{habit_id}")
 def delete_habit(habit_id: int, session: SessionDep) -> DeleteHabitResponse:
     statement = select(Habits).where(Habits.id == habit_id)
     habit = session.exec(statement).one()
     session.delete(habit)
+    balance_display_order_fields(habit.user_fk, habit.display_order, session)
     session.commit()
+    habit_log_buffer.discard(habit_id)
 
     # confirm habit was deleted
     deleted_habit = session.exec(statement).first()
@@ -220,7 +264,9 @@ def delete_habit(habit_id: int, session: SessionDep) -> DeleteHabitResponse:
         # TODO: Raise an exception
         pass
 
-    balance_display_order_fields(habit.display_order, session)
+    response_cache.invalidate(user_habits_tag(habit.user_fk), user_schedule_tag(habit.user_fk),
+                              habit_summary_tag(habit_id))
+    change_feed.publish(habit.user_fk, ChangeResource.HABITS, [habit_id])
     response = DeleteHabitResponse(is_success=True)
     return response
 
@@ -232,44 +278,54 @@ def reorder_habits(request_body: ReorderHabitsRequest, session: SessionDep) -> R
         raise HTTPException(status_code=400, detail=f"Duplicate habit IDs found in request")
 
     id_to_display_order_dict = {habit.id: habit.display_order for habit in habits_to_reorder}
-    statement = select(Habits).where(Habits.id.in_(id_to_display_order_dict.keys()))
-    habits = session.exec(statement).all()
+    statement = select(Habits.id, Habits.user_fk).where(Habits.id.in_(id_to_display_order_dict.keys()))
+    found_habits = session.exec(statement).all()
 
-    found_ids = {habit.id for habit in habits}
+    found_ids = {habit.id for habit in found_habits}
     missing_ids = habits_to_reorder_ids - found_ids
     if missing_ids:
         raise HTTPException(status_code=400, detail=f"Not all habit IDs in the request were found - missing IDs: {sorted(missing_ids)}")
 
-    for habit in habits:
-        habit.display_order = id_to_display_order_dict[habit.id]
-
-    session.add_all(habits)
+    # apply the whole batch with a single UPDATE ... SET display_order = CASE id WHEN ... END
+    reorder_statement = (
+        update(Habits)
+        .where(Habits.id.in_(id_to_display_order_dict.keys()))
+        .values(display_order=case(id_to_display_order_dict, value=Habits.id), updated_at=datetime.now())
+    )
+    session.exec(reorder_statement)
     session.commit()
+    for user_id in {habit.user_fk for habit in found_habits}:
+        response_cache.invalidate(user_habits_tag(user_id), user_schedule_tag(user_id))
+        change_feed.publish(user_id, ChangeResource.HABITS,
+                            [habit.id for habit in found_habits if habit.user_fk == user_id])
     response = ReorderHabitsResponse(is_success=True)
     return response
 
-@router.get("/habits-by-categories")
-def get_habits_by_categories(category_ids: Annotated[List[int], Query()], session: SessionDep) -> List[Habits]:
+@router.get("/habits-by-categories", response_model_exclude_unset=True)
+def get_habits_by_categories(category_ids: Annotated[List[int], Query()], session: SessionDep,
+                             include_categories: bool = False) -> List[HabitWithCategoriesResponse]:
     """
     Returns habits filtered by one or multiple categories
     :param category_ids: Query parameter that contains a list of category iDs to filter habits by
     :param session: current DB session
+    :param include_categories: whether to embed the categories of every habit, loaded with one extra query
     :return: list of Habits
     """
     validate_category_ids_statement = select(Categories.id).where(Categories.id.in_(category_ids))
     found_category_ids = session.exec(validate_category_ids_statement).all()
-    if len(found_category_ids) != len(category_ids):
+    if len(found_category_ids) != len(set(category_ids)):
         categories_not_found = set(category_ids) - set(found_category_ids)
         raise HTTPException(status_code=400, detail=f"Not all category IDs in the request were found - missing IDs: {sorted(categories_not_found)}")
 
-    habits_by_categories_statement = (
+    # habits linked to every one of the categories, filtered in the same query that loads them
+    habit_ids_in_categories = (
         select(HabitsCategoriesLink.habit_fk)
         .where(HabitsCategoriesLink.category_fk.in_(category_ids))
         .group_by(HabitsCategoriesLink.habit_fk)
-        .having(func.count(distinct(HabitsCategoriesLink.category_fk)) == len(category_ids))
+        .having(func.count(distinct(HabitsCategoriesLink.category_fk)) == len(set(category_ids)))
     )
-    habits_ids = session.exec(habits_by_categories_statement).all()
-
-    get_habits_statement = select(Habits).where(Habits.id.in_(habits_ids))
-    habits = session.exec(get_habits_statement)
-    return habits
\ No newline at end of file
+    get_habits_statement = select(Habits).where(Habits.id.in_(habit_ids_in_categories))
+    if include_categories:
+        get_habits_statement = get_habits_statement.options(selectinload(Habits.categories))
+    habits = session.exec(get_habits_statement).all()
+    return serialize_habits(habits, include_categories)
@@ -0,0 +1,60 @@
+from typing import Dict
+
+from fastapi import APIRouter, Request, Response, status
+from fastapi.responses import PlainTextResponse
+from ..db.pool_statistics import registered_pool_statistics
+from ..services.cache import response_cache
+from ..services.change_feed import change_feed
+from ..services.habit_log_buffer import habit_log_buffer
+from ..services.metrics import metrics_registry, PROMETHEUS_CONTENT_TYPE
+
+# Operational endpoints, not meant to be exposed to clients
+router = APIRouter(prefix="/internal", include_in_schema=False)
+
+
+@router.get("/db/pool")
+def get_pool_statistics() -> Dict[str, Dict]:
+    """
+    Returns live checkouts, overflow, checkout wait times and connection churn of every connection pool
+    """
+    return {name: statistics.snapshot() for name, statistics in registered_pool_statistics.items()}
+
+@router.get("/cache")
+def get_cache_statistics() -> Dict:
+    """
+    Returns the hit and miss counters and the size of the read cache of this worker
+    """
+    return response_cache.statistics()
+
+@router.get("/change-feed")
+def get_change_feed_statistics() -> Dict:
+    """
+    Returns the subscriptions to the change feed of this worker and how many events were published
+    """
+    return change_feed.statistics()
+
+@router.get("/habit-log-buffer")
+def get_habit_log_buffer_statistics() -> Dict:
+    """
+    Returns the tracked and pending logs of the write-behind buffer of this worker, and how many writes it coalesced
+    """
+    return habit_log_buffer.statistics()
+
+@router.get("/ready")
+def get_readiness(request: Request, response: Response) -> Dict[str, bool]:
+    """
+    Returns 200 once the worker has warmed up its connections and can take traffic, and 503 before that or while it
+    shuts down
+    """
+    is_ready = getattr(request.app.state, "is_ready", False)
+    if not is_ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"is_ready": is_ready}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    """
+    Returns the per-route latency histograms, query counts, DB time and rows of this worker in the Prometheus text
+    format
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,5 +1,5 @@
-from datetime import datetime
-from typing import Optional, List
+from datetime import date, datetime
+from typing import Dict, Optional, List
 
 from pydantic import BaseModel
 
@@ -14,6 +14,7 @@ class UpsertHabitRequest(BaseModel):
     repeat_type: Optional[str] = None
     repeat_config: Optional[str] = None
     is_check_only: Optional[bool] = None
+    is_archived: Optional[bool] = None
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     goal_value: Optional[int] = None
@@ -24,6 +25,13 @@ class UpsertHabitRequest(BaseModel):
 class UpdateHabitCategoriesRequest(BaseModel):
     category_ids: List[int]
 
+class HabitCategoriesAssignment(BaseModel):
+    habit_id: int
+    category_ids: List[int]
+
+class BulkAssignHabitCategoriesRequest(BaseModel):
+    assignments: List[HabitCategoriesAssignment]
+
 class ReorderHabit(BaseModel):
     id: int
     display_order: int
@@ -47,6 +55,10 @@ class UpsertHabitLogRequest(BaseModel):
     goal_unit: Optional[str] = None
     completion_percentage: float
 
+class BulkHabitLogEntry(UpsertHabitLogRequest):
+    habit_id: int
+    log_date: date
+
 
 # //////////////////////////////////////// RESPONSES ////////////////////////////////////////
 class DeleteHabitResponse(BaseModel):
@@ -57,3 +69,138 @@ class ReorderHabitsResponse(BaseModel):
 
 class DeleteCategoryResponse(BaseModel):
     is_success: bool
+
+class CategoryResponse(BaseModel):
+    id: int
+    name: str
+    icon: Optional[str] = None
+    user_fk: int
+    created_at: datetime
+    updated_at: datetime
+
+class HabitResponse(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    icon: Optional[str] = None
+    color_hex: Optional[str] = None
+    is_bad_habit: bool
+    repeat_type: str
+    repeat_config: Optional[str] = None
+    weekday_mask: int
+    month_day_mask: int
+    repeat_n: Optional[int] = None
+    is_archived: bool
+    is_check_only: bool
+    start_date: datetime
+    end_date: Optional[datetime] = None
+    display_order: int
+    goal_value: Optional[int] = None
+    goal_unit: Optional[str] = None
+    goal_is_time: bool
+    user_fk: int
+    created_at: datetime
+    updated_at: datetime
+
+class HabitWithCategoriesResponse(HabitResponse):
+    # only set when the categories are requested, the field is left out of the response otherwise
+    categories: Optional[List[CategoryResponse]] = None
+
+class HabitLogResponse(BaseModel):
+    id: int
+    habit_fk: int
+    log_date: date
+    progress_value: Optional[float] = None
+    note: Optional[str] = None
+    goal_value: Optional[int] = None
+    goal_unit: Optional[str] = None
+    completion_percentage: float
+    created_at: datetime
+    updated_at: datetime
+
+class DailyProgress(BaseModel):
+    # formatted as MM/DD/YYYY
+    date: str
+    completion_percentage: float
+
+class MonthlySummary(BaseModel):
+    active_days: int
+    longest_active_streak: int
+    perfect_days: int
+    longest_perfect_streak: int
+    # total progress followed by the goal unit, e.g. "120.0 minutes"
+    total_completed: str
+
+class MonthData(BaseModel):
+    monthly_summary: MonthlySummary
+    # left out of the response when the daily progress is not requested
+    daily_progress: List[DailyProgress] = []
+
+class YearlySummary(BaseModel):
+    # the defaults are never sent, the yearly summary is an empty object for years without logs
+    active_days: int = 0
+    longest_active_streak: int = 0
+    perfect_days: int = 0
+    longest_perfect_streak: int = 0
+    total_completed: str = ""
+
+class YearlySummaryResponse(BaseModel):
+    # keyed by the lowercase month name, only the months with logs are included
+    monthly_data: Dict[str, MonthData]
+    yearly_summary: YearlySummary
+
+class BulkAssignHabitCategoriesResponse(BaseModel):
+    created_links: int
+    # IDs of the categories of every habit of the request after the assignment
+    category_ids_by_habit_id: Dict[int, List[int]]
+
+class HabitStatisticsBucket(BaseModel):
+    start_date: date
+    active_days: int
+    perfect_days: int
+    total_completed: float
+    average_completion_percentage: Optional[float] = None
+
+class HabitStatisticsResponse(BaseModel):
+    start_date: date
+    end_date: date
+    bucket: str
+    active_days: int
+    perfect_days: int
+    total_completed: float
+    average_completion_percentage: Optional[float] = None
+    longest_active_streak: int
+    longest_perfect_streak: int
+    buckets: List[HabitStatisticsBucket]
+
+class HabitHeatmapResponse(BaseModel):
+    start_date: date
+    end_date: date
+    # completion percentage of every logged day
+    days: Dict[date, float]
+
+class HabitDashboardSummary(BaseModel):
+    habit_id: int
+    name: str
+    current_streak: int
+    longest_streak: int
+    # share of the expected completions of the last completion_rate_days days, None if none were expected
+    completion_rate: Optional[float] = None
+    completed_this_week: int
+    target_this_week: float
+
+class UserSummaryResponse(BaseModel):
+    date: date
+    completion_rate_days: int
+    habits: List[HabitDashboardSummary]
+
+class BulkHabitLogError(BaseModel):
+    index: int
+    detail: str
+
+class BulkUpsertHabitLogsResponse(BaseModel):
+    # indexes of the entries in the request
+    created: List[int] = []
+    updated: List[int] = []
+    unchanged: List[int] = []
+    errors: List[BulkHabitLogError] = []
@@ -0,0 +1,180 @@
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import Session
+
+from ..config import Settings
+from ..db.database import get_database
+
+MISSING = object()
+
+
+class CacheBackend(ABC):
+    """
+    Storage of the read cache. Entries are tagged so that writes can invalidate exactly the entries they affect.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """
+        Returns the value stored under the key, or MISSING
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Any, tags: Iterable[str]):
+        pass
+
+    @abstractmethod
+    def invalidate_tags(self, tags: Iterable[str]):
+        """
+        Deletes every entry stored with any of the given tags
+        """
+
+    @abstractmethod
+    def statistics(self) -> Dict:
+        pass
+
+
+class InMemoryLRUCache(CacheBackend):
+    """
+    Bounded in-process backend that evicts the least recently used entries and expires entries after a TTL.
+    Every worker has its own copy, so invalidations of other workers are only picked up when the TTL expires.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (expires_at, value, tags)
+        self._entries: OrderedDict[str, Tuple[float, Any, Tuple[str, ...]]] = OrderedDict()
+        self._keys_by_tag: Dict[str, Set[str]] = {}
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= monotonic():
+                self._delete(key)
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, tags: Iterable[str]):
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._entries:
+                self._delete(key)
+            self._entries[key] = (monotonic() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._delete(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_tags(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._delete(key)
+
+    def _delete(self, key: str):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def statistics(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class ResponseCache:
+    """
+    Caches the results of read endpoints, keyed by endpoint and parameters. Values are stored JSON-encoded so that
+    they don't hold on to the session they were loaded with.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, backend: Optional[CacheBackend]):
+        """
+        Replaces the backend, dropping every cached entry. The cache is disabled while the backend is None.
+        """
+        self.backend = backend
+
+    def get_or_compute(self, namespace: str, params: Dict, tags: Iterable[str], compute: Callable[[], Any],
+                       session: Optional[Session] = None) -> Any:
+        """
+        Returns the cached result of an endpoint, computing and storing it on a miss
+        :param namespace: name of the endpoint
+        :param params: parameters the result depends on
+        :param tags: tags that writes invalidate the entry with
+        :param compute: function that computes the result
+        :param session: session the result is computed with, a result read from a replica that may be behind is
+            returned without being stored, see Database.is_cacheable_read
+        """
+        if self.backend is None:
+            return compute()
+
+        key = f"{namespace}:{json.dumps(params, sort_keys=True, default=str)}"
+        value = self.backend.get(key)
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is not MISSING:
+            return value
+
+        value = jsonable_encoder(compute())
+        if session is None or get_database().is_cacheable_read(session):
+            self.backend.set(key, value, tags)
+        return value
+
+    def invalidate(self, *tags: str):
+        if self.backend is not None:
+            self.backend.invalidate_tags(tags)
+
+    def statistics(self) -> Dict:
+        with self._lock:
+            statistics = {"enabled": self.backend is not None, "hits": self.hits, "misses": self.misses}
+        if self.backend is not None:
+            statistics.update(self.backend.statistics())
+        return statistics
+
+
+def user_habits_tag(user_id: int) -> str:
+    return f"user:{user_id}:habits"
+
+def user_categories_tag(user_id: int) -> str:
+    return f"user:{user_id}:categories"
+
+def user_schedule_tag(user_id: int) -> str:
+    return f"user:{user_id}:schedule"
+
+def habit_summary_tag(habit_id: int) -> str:
+    return f"habit:{habit_id}:summary"
+
+
+def create_cache_backend(settings: Settings) -> Optional[CacheBackend]:
+    if not settings.cache_enabled:
+        return None
+    return InMemoryLRUCache(settings.cache_max_entries, settings.cache_ttl_seconds)
+
+
+# disabled until the app factory configures it from the settings
+response_cache = ResponseCache()
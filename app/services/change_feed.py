@@ -0,0 +1,160 @@
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+
+from ..config import Settings
+from ..enums.change_resource_enum import ChangeResource
+
+RESYNC_MESSAGE = json.dumps({"resource": ChangeResource.RESYNC.value})
+
+
+class Subscription:
+    """
+    Change events of one user, delivered to one connected client. Events can be offered from any thread, they are
+    handed over to the event loop the client is served on.
+    """
+
+    def __init__(self, user_id: int, max_pending_events: int):
+        self.user_id = user_id
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_pending_events)
+
+    def offer(self, message: str):
+        self._loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message: str):
+        if self._queue.full():
+            # the client is too slow to keep up, replace its backlog with a single resync
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            message = RESYNC_MESSAGE
+        self._queue.put_nowait(message)
+
+    async def get(self) -> str:
+        return await self._queue.get()
+
+
+class ChangeFeedBackend(ABC):
+    """
+    Delivers the change events of a user to every client of that user that is subscribed. A backend shared by the
+    workers, e.g. on a pub/sub channel per user, delivers them to the clients of every worker.
+    """
+
+    @abstractmethod
+    def publish(self, user_id: int, message: str):
+        """
+        Delivers a message to the subscribers of a user. Called from the threadpool as well as from the event loop.
+        """
+
+    @abstractmethod
+    def subscribe(self, subscription: Subscription):
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription):
+        pass
+
+    @abstractmethod
+    def statistics(self) -> Dict:
+        pass
+
+
+class InMemoryChangeFeed(ChangeFeedBackend):
+    """
+    In-process backend, only the clients connected to the worker that committed the change receive its events
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions_by_user: Dict[int, Set[Subscription]] = {}
+        self.published_events = 0
+
+    def publish(self, user_id: int, message: str):
+        with self._lock:
+            subscriptions = list(self._subscriptions_by_user.get(user_id, ()))
+            self.published_events += 1
+        for subscription in subscriptions:
+            subscription.offer(message)
+
+    def subscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions_by_user.setdefault(subscription.user_id, set()).add(subscription)
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions_by_user.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions_by_user[subscription.user_id]
+
+    def statistics(self) -> Dict:
+        with self._lock:
+            return {
+                "subscribed_users": len(self._subscriptions_by_user),
+                "subscriptions": sum(len(subscriptions) for subscriptions in self._subscriptions_by_user.values()),
+                "published_events": self.published_events,
+            }
+
+
+class ChangeFeed:
+    """
+    Per-user stream of compact change events, published by the write routes once they committed, so that clients
+    refresh what changed instead of polling. An event names the changed resource and the IDs of the changed habits or
+    categories, e.g. {"resource": "habit_logs", "ids": [12], "dates": ["2025-04-03"]}.
+    """
+
+    def __init__(self, backend: Optional[ChangeFeedBackend] = None, max_pending_events: int = 100):
+        self.backend = backend
+        self.max_pending_events = max_pending_events
+
+    def configure(self, backend: Optional[ChangeFeedBackend], max_pending_events: int):
+        """
+        Replaces the backend. Nothing is published while the backend is None.
+        """
+        self.backend = backend
+        self.max_pending_events = max_pending_events
+
+    def publish(self, user_id: int, resource: ChangeResource, ids: Iterable[int], dates: Iterable[date] = ()):
+        if self.backend is None:
+            return
+        event = {"resource": resource.value, "ids": sorted(set(ids))}
+        dates = sorted(set(dates))
+        if dates:
+            event["dates"] = [log_date.isoformat() for log_date in dates]
+        self.backend.publish(user_id, json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int) -> AsyncIterator[Subscription]:
+        """
+        Subscribes to the change events of a user for as long as the context is open
+        """
+        backend = self.backend
+        subscription = Subscription(user_id, self.max_pending_events)
+        if backend is not None:
+            backend.subscribe(subscription)
+        try:
+            yield subscription
+        finally:
+            if backend is not None:
+                backend.unsubscribe(subscription)
+
+    def statistics(self) -> Dict:
+        statistics = {"enabled": self.backend is not None}
+        if self.backend is not None:
+            statistics.update(self.backend.statistics())
+        return statistics
+
+
+def create_change_feed_backend(settings: Settings) -> Optional[ChangeFeedBackend]:
+    if not settings.change_feed_enabled:
+        return None
+    return InMemoryChangeFeed()
+
+
+# disabled until the app factory configures it from the settings
+change_feed = ChangeFeed()
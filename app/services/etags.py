@@ -0,0 +1,51 @@
+import hashlib
+import json
+from typing import Dict, Optional
+
+from fastapi import Request, Response, status
+from sqlmodel import Session, select, func
+
+
+def compute_etag(namespace: str, params: Dict, validator) -> str:
+    """
+    Builds a weak ETag from the endpoint, its parameters and a cheap validator of the data it returns
+    """
+    serialized = json.dumps([namespace, params, list(validator)], sort_keys=True, default=str)
+    return f'W/"{hashlib.sha1(serialized.encode()).hexdigest()[:20]}"'
+
+def matches_if_none_match(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, the W/ prefix is ignored
+    client_etags = {client_etag.strip().removeprefix("W/") for client_etag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in client_etags
+
+def check_etag(request: Request, response: Response, session: Session, namespace: str, params: Dict,
+               updated_at_column, *conditions) -> Optional[Response]:
+    """
+    Computes the ETag of a read endpoint from the max updated_at and the row count of the rows it returns, without
+    loading them. Writes that change, add or delete rows change either of them.
+    :param namespace: name of the endpoint
+    :param params: parameters the response depends on
+    :param updated_at_column: updated_at column of the rows returned by the endpoint
+    :param conditions: WHERE conditions that select the rows returned by the endpoint
+    :return: a 304 response when the client already has the current version, otherwise None, after setting the ETag
+    header of the response
+    """
+    validator = session.exec(select(func.max(updated_at_column), func.count()).where(*conditions)).one()
+    etag = compute_etag(namespace, params, validator)
+    if matches_if_none_match(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
+def with_etag(params: Dict, response: Response) -> Dict:
+    """
+    Returns the cache parameters of a response whose ETag header was set by check_etag, extended with that ETag. A body
+    cached before a change that didn't invalidate it, e.g. a write served by another worker, then misses the cache
+    instead of being sent under the ETag of the current data.
+    """
+    return {**params, "etag": response.headers["ETag"]}
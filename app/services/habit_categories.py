@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from fastapi import HTTPException
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, update, delete
+
+from ..models.models import Categories, Habits, HabitsCategoriesLink
+
+
+def validate_ids_exist(model, ids: Iterable[int], session: Session, label: str):
+    """
+    Checks with a single IN query that every ID exists
+    :raises HTTPException: 400 listing the missing IDs
+    """
+    ids = set(ids)
+    found_ids = set(session.exec(select(model.id).where(model.id.in_(ids))).all())
+    missing_ids = ids - found_ids
+    if missing_ids:
+        raise HTTPException(status_code=400, detail=f"Not all {label} IDs in the request were found - missing IDs: {sorted(missing_ids)}")
+
+def build_links_insert_ignoring_existing(dialect_name: str, rows: List[Dict]):
+    """
+    Builds a single multi-row INSERT IGNORE statement that skips the links that already exist, or the equivalent
+    INSERT ... ON CONFLICT DO NOTHING for SQLite
+    :param dialect_name: name of the dialect of the bound engine
+    :param rows: dicts with the habit_fk, category_fk, created_at and updated_at of every link
+    """
+    if dialect_name == "mysql":
+        return mysql_insert(HabitsCategoriesLink).values(rows).prefix_with("IGNORE")
+    if dialect_name == "sqlite":
+        return sqlite_insert(HabitsCategoriesLink).values(rows).on_conflict_do_nothing(
+            index_elements=["habit_fk", "category_fk"])
+    raise NotImplementedError(f"Category link inserts are not supported for the {dialect_name} dialect")
+
+def link_categories_to_habits(category_ids_by_habit_id: Dict[int, Iterable[int]], session: Session) -> int:
+    """
+    Links categories to habits with one multi-row INSERT that skips the links that already exist, including the ones
+    created concurrently by another request. It doesn't commit.
+    :param category_ids_by_habit_id: dict that maps habit IDs to the IDs of the categories to link them to
+    :param session: current DB session
+    :return: number of links created
+    """
+    requested_links = sorted({(habit_id, category_id)
+                              for habit_id, category_ids in category_ids_by_habit_id.items()
+                              for category_id in category_ids})
+    if not requested_links:
+        return 0
+
+    now = datetime.now()
+    statement = build_links_insert_ignoring_existing(session.get_bind().dialect.name, [
+        {"habit_fk": habit_id, "category_fk": category_id, "created_at": now, "updated_at": now}
+        for habit_id, category_id in requested_links
+    ])
+    # only the inserted rows are counted, the skipped ones are not affected
+    return session.exec(statement).rowcount
+
+def unlink_categories_from_habit(habit_id: int, category_ids: Iterable[int], session: Session):
+    """
+    Deletes the links of a habit to the given categories with one statement, links that don't exist are ignored.
+    It doesn't commit.
+    """
+    session.exec(delete(HabitsCategoriesLink)
+                 .where(HabitsCategoriesLink.habit_fk == habit_id)
+                 .where(HabitsCategoriesLink.category_fk.in_(set(category_ids))))
+
+def touch_habits(habit_ids: Iterable[int], session: Session):
+    """
+    Bumps the updated_at of habits whose categories changed, so that the responses that embed their categories are
+    revalidated. It doesn't commit.
+    """
+    session.exec(update(Habits).where(Habits.id.in_(set(habit_ids))).values(updated_at=datetime.now()))
+
+def touch_habits_of_category(category_id: int, session: Session):
+    """
+    Same as touch_habits, for every habit linked to a category that changed. It doesn't commit.
+    """
+    linked_habit_ids = select(HabitsCategoriesLink.habit_fk).where(HabitsCategoriesLink.category_fk == category_id)
+    session.exec(update(Habits).where(Habits.id.in_(linked_habit_ids)).values(updated_at=datetime.now()))
+
+def serialize_habits(habits: Iterable[Habits], include_categories: bool) -> List[Dict]:
+    """
+    Returns the habits as dicts, with their categories when requested, which must have been eager-loaded with
+    selectinload(Habits.categories) to avoid a lazy load per habit
+    """
+    if not include_categories:
+        return [habit.model_dump() for habit in habits]
+    return [{**habit.model_dump(), "categories": [category.model_dump() for category in habit.categories]}
+            for habit in habits]
+
+def get_categories_for_habits(habit_ids: Iterable[int], session: Session) -> Dict[int, List[Categories]]:
+    """
+    Returns the categories of several habits with one joined query
+    :return: dict that maps every habit ID to its categories, ordered by ID
+    """
+    habit_ids = set(habit_ids)
+    categories_by_habit_id = {habit_id: [] for habit_id in habit_ids}
+    statement = (
+        select(HabitsCategoriesLink.habit_fk, Categories)
+        .join(Categories, Categories.id == HabitsCategoriesLink.category_fk)
+        .where(HabitsCategoriesLink.habit_fk.in_(habit_ids))
+        .order_by(HabitsCategoriesLink.habit_fk, Categories.id)
+    )
+    for habit_id, category in session.exec(statement):
+        categories_by_habit_id[habit_id].append(category)
+    return categories_by_habit_id
+
+def validate_habit_and_category_ids(habit_ids: Iterable[int], category_ids: Iterable[int], session: Session):
+    """
+    Checks that every habit and category of a link operation exists, with one query for each
+    :raises HTTPException: 400 listing the missing IDs
+    """
+    validate_ids_exist(Habits, habit_ids, session, "habit")
+    validate_ids_exist(Categories, category_ids, session, "category")
@@ -0,0 +1,110 @@
+from datetime import date
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Type, Union
+
+from sqlalchemy import insert
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.util import AliasedClass
+from sqlmodel import Session, select, delete, func, union_all, tuple_
+
+from ..db.database import get_database
+from ..models.models import HabitLogs, HabitLogsArchive
+
+# HabitLogs mapped onto a UNION ALL of habit_logs and habit_logs_archive, for the reads that reach into the archive.
+# MySQL 8 and SQLite push the WHERE clauses of the outer query down into both tables, so they still use their indexes.
+all_habit_logs = aliased(
+    HabitLogs,
+    union_all(select(*HabitLogs.__table__.c),
+              select(*[HabitLogsArchive.__table__.c[column.name] for column in HabitLogs.__table__.c]))
+    .subquery("all_habit_logs"),
+)
+
+
+def get_hot_logs_start(today: Optional[date] = None) -> date:
+    """
+    Returns the first day of the logs kept in habit_logs: the first day of the oldest of the last
+    settings.habit_logs_hot_years calendar years. The older logs are moved to habit_logs_archive. The settings are the
+    ones the engines were created with, i.e. the settings of the app.
+    """
+    today = today or date.today()
+    return date(today.year - get_database().settings.habit_logs_hot_years + 1, 1, 1)
+
+def get_habit_logs_entity(start_date: Optional[date]) -> Union[Type[HabitLogs], AliasedClass]:
+    """
+    Returns the entity to read the logs from start_date onwards from: HabitLogs when they are all hot, the union of
+    habit_logs and habit_logs_archive otherwise. Since the cutoff only moves forward, every archived log is before the
+    current cutoff.
+    :param start_date: first date that is read, None when the read is not bounded
+    """
+    if start_date is not None and start_date >= get_hot_logs_start():
+        return HabitLogs
+    return all_habit_logs
+
+def get_habit_logs_entity_for_habit(habit_id: int, start_date: Optional[date],
+                                    session: Session) -> Union[Type[HabitLogs], AliasedClass]:
+    """
+    Same as get_habit_logs_entity for the logs of a single habit, but also returns HabitLogs when the habit has no
+    archived log, which one lookup of the (habit_fk, log_date) index of the archive tells
+    """
+    logs = get_habit_logs_entity(start_date)
+    if logs is not HabitLogs:
+        archived_log_statement = select(HabitLogsArchive.id).where(HabitLogsArchive.habit_fk == habit_id).limit(1)
+        if session.exec(archived_log_statement).first() is None:
+            return HabitLogs
+    return logs
+
+def get_latest_log_dates(habit_ids: Sequence[int], before_date: date, session: Session) -> Dict[int, date]:
+    """
+    Returns the date of the latest log strictly before before_date of every given habit that has one. The archive is
+    only read for the habits without a hot log.
+    """
+    latest_log_dates = {}
+    for logs in (HabitLogs, HabitLogsArchive):
+        habit_ids = [habit_id for habit_id in habit_ids if habit_id not in latest_log_dates]
+        if not habit_ids:
+            break
+        latest_log_statement = (
+            select(logs.habit_fk, func.max(logs.log_date))
+            .where(logs.habit_fk.in_(habit_ids))
+            .where(logs.log_date < before_date)
+            .group_by(logs.habit_fk)
+        )
+        latest_log_dates.update(session.exec(latest_log_statement).all())
+    return latest_log_dates
+
+def unarchive_habit_logs(keys: Iterable[Tuple[int, date]], session: Session):
+    """
+    Moves the archived logs of the given (habit ID, log date) keys back to habit_logs before they are written, so that
+    a log is never in both tables. Only the keys before the cutoff are looked up. It doesn't commit.
+    """
+    hot_logs_start = get_hot_logs_start()
+    cold_keys = [(habit_id, log_date) for habit_id, log_date in keys if log_date < hot_logs_start]
+    if not cold_keys:
+        return
+
+    is_cold_key = tuple_(HabitLogsArchive.habit_fk, HabitLogsArchive.log_date).in_(cold_keys)
+    archived_columns = [HabitLogsArchive.__table__.c[column.name] for column in HabitLogs.__table__.c]
+    session.exec(insert(HabitLogs).from_select(list(HabitLogs.__table__.c.keys()),
+                                               select(*archived_columns).where(is_cold_key)))
+    session.exec(delete(HabitLogsArchive).where(is_cold_key))
+
+def archive_habit_logs_batch(hot_logs_start: date, after_id: int, batch_size: int, session: Session) -> Sequence[int]:
+    """
+    Moves the next batch of logs before hot_logs_start to habit_logs_archive, scanning habit_logs in primary key order
+    from after_id. It doesn't commit.
+    :return: IDs of the moved logs, empty once there is nothing left to move
+    """
+    ids_statement = (
+        select(HabitLogs.id)
+        .where(HabitLogs.id > after_id)
+        .where(HabitLogs.log_date < hot_logs_start)
+        .order_by(HabitLogs.id)
+        .limit(batch_size)
+    )
+    habit_log_ids = session.exec(ids_statement).all()
+    if not habit_log_ids:
+        return habit_log_ids
+
+    session.exec(insert(HabitLogsArchive).from_select(
+        list(HabitLogs.__table__.c.keys()), select(*HabitLogs.__table__.c).where(HabitLogs.id.in_(habit_log_ids))))
+    session.exec(delete(HabitLogs).where(HabitLogs.id.in_(habit_log_ids)))
+    return habit_log_ids
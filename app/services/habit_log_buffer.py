@@ -0,0 +1,220 @@
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import Engine
+from sqlmodel import Session
+
+from ..db.database import get_database, READ_METHODS
+from ..enums.change_resource_enum import ChangeResource
+from ..models.models import HabitLogs
+from .cache import response_cache, habit_summary_tag, user_schedule_tag
+from .change_feed import change_feed
+from .habit_logs import build_habit_logs_upsert, LOG_VALUE_COLUMNS
+from .habit_summaries import refresh_monthly_summaries, lock_habits
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BufferedHabitLog:
+    habit_id: int
+    log_date: date
+    user_id: int
+    # fields of the HabitLogResponse of the log, kept up to date with the pending values
+    log: Dict
+    # monotonic time of the last write, the log stops being tracked once it's idle for too long
+    written_at: float
+    # whether the log has values that were not flushed yet
+    is_pending: bool = False
+
+
+class HabitLogWriteBuffer:
+    """
+    Write-behind buffer of the logs of timer habits (goal_is_time), whose progress is PUT every few seconds while a
+    timer runs. The first write of a log goes to the database and starts tracking it, the following ones only replace
+    its pending values in memory and are flushed in one multi-row upsert every few seconds, so that the database load
+    doesn't grow with the update frequency of the clients.
+    Reads flush the pending logs of their habit or user first, so they always see the latest values. The buffer is
+    per worker, like the read cache.
+    """
+
+    def __init__(self):
+        self.is_enabled = False
+        self.idle_seconds = 60.0
+        self._lock = threading.Lock()
+        # serializes the flushes, so that an older value is never written after a newer one
+        self._flush_lock = threading.Lock()
+        self._logs: Dict[Tuple[int, date], BufferedHabitLog] = {}
+        self._pending_count = 0
+        self.flushed_logs = 0
+        self.coalesced_writes = 0
+
+    def configure(self, is_enabled: bool, idle_seconds: float):
+        """
+        Called by the app factory. The buffer starts out empty, the app that used it before flushed its pending logs
+        on shutdown.
+        :param is_enabled: whether the writes of timer habits are buffered
+        :param idle_seconds: logs that aren't written for this long are no longer tracked, the next write of a timer
+            that was stopped goes to the database again
+        """
+        self.is_enabled = is_enabled
+        self.idle_seconds = idle_seconds
+        with self._lock:
+            self._logs.clear()
+            self._pending_count = 0
+
+    def has_unwritten_logs(self) -> bool:
+        """
+        Whether some logs are pending or being flushed, i.e. whether a read could miss a value
+        """
+        return self._pending_count > 0 or self._flush_lock.locked()
+
+    def track(self, habit_log: HabitLogs, user_id: int):
+        """
+        Starts buffering the writes of a log that was just written to the database
+        """
+        with self._lock:
+            self._logs[(habit_log.habit_fk, habit_log.log_date)] = BufferedHabitLog(
+                habit_log.habit_fk, habit_log.log_date, user_id, habit_log.model_dump(), monotonic())
+
+    def write(self, habit_id: int, log_date: date, values: Dict) -> Optional[Dict]:
+        """
+        Replaces the pending values of a tracked log
+        :return: the log with the new values, or None if the log is not tracked and has to be written to the database
+        """
+        with self._lock:
+            buffered_log = self._logs.get((habit_id, log_date))
+            if buffered_log is None:
+                return None
+            buffered_log.log.update(values, updated_at=datetime.now())
+            buffered_log.written_at = monotonic()
+            if buffered_log.is_pending:
+                self.coalesced_writes += 1
+            else:
+                buffered_log.is_pending = True
+                self._pending_count += 1
+            return dict(buffered_log.log)
+
+    def discard(self, habit_id: int):
+        """
+        Stops tracking the logs of a habit without writing them, e.g. when the habit is deleted
+        """
+        with self._lock:
+            for key in [key for key in self._logs if key[0] == habit_id]:
+                if self._logs.pop(key).is_pending:
+                    self._pending_count -= 1
+
+    def _take_pending(self, habit_id: Optional[int], user_id: Optional[int]) -> List[BufferedHabitLog]:
+        """
+        Returns copies of the pending logs that match the filters and marks them as written. The idle logs are no longer
+        tracked.
+        """
+        taken_logs = []
+        idle_since = monotonic() - self.idle_seconds
+        with self._lock:
+            for key, buffered_log in list(self._logs.items()):
+                if habit_id is not None and buffered_log.habit_id != habit_id:
+                    continue
+                if user_id is not None and buffered_log.user_id != user_id:
+                    continue
+                if buffered_log.is_pending:
+                    taken_logs.append(BufferedHabitLog(buffered_log.habit_id, buffered_log.log_date,
+                                                       buffered_log.user_id, dict(buffered_log.log),
+                                                       buffered_log.written_at))
+                    buffered_log.is_pending = False
+                    self._pending_count -= 1
+                elif buffered_log.written_at < idle_since:
+                    del self._logs[key]
+        return taken_logs
+
+    def _restore_pending(self, failed_logs: Iterable[BufferedHabitLog]):
+        with self._lock:
+            for failed_log in failed_logs:
+                buffered_log = self._logs.get((failed_log.habit_id, failed_log.log_date))
+                if buffered_log is not None and not buffered_log.is_pending:
+                    buffered_log.is_pending = True
+                    self._pending_count += 1
+
+    def flush(self, engine: Engine, habit_id: Optional[int] = None, user_id: Optional[int] = None) -> int:
+        """
+        Writes the pending logs with one multi-row upsert, together with their monthly summaries, invalidates the
+        cached responses they affect and publishes them to their users
+        :param engine: engine of the primary database
+        :param habit_id: only flush the logs of this habit
+        :param user_id: only flush the logs of the habits of this user
+        :return: number of written logs
+        """
+        with self._flush_lock:
+            taken_logs = self._take_pending(habit_id, user_id)
+            if not taken_logs:
+                return 0
+
+            rows = [{**{column: taken_log.log[column] for column in LOG_VALUE_COLUMNS},
+                     "habit_fk": taken_log.habit_id, "log_date": taken_log.log_date,
+                     "created_at": taken_log.log["created_at"], "updated_at": taken_log.log["updated_at"]}
+                    for taken_log in taken_logs]
+            try:
+                with Session(engine) as session:
+                    lock_habits({row["habit_fk"] for row in rows}, session)
+                    session.exec(build_habit_logs_upsert(engine.dialect.name, rows))
+                    refresh_monthly_summaries({(row["habit_fk"], row["log_date"].replace(day=1)) for row in rows},
+                                              session)
+                    session.commit()
+            except Exception:
+                # keep them pending, unless they were written again in the meantime, and retry with the next flush
+                self._restore_pending(taken_logs)
+                raise
+
+            get_database().record_write()
+            self.flushed_logs += len(taken_logs)
+            response_cache.invalidate(*{habit_summary_tag(taken_log.habit_id) for taken_log in taken_logs},
+                                      *{user_schedule_tag(taken_log.user_id) for taken_log in taken_logs})
+            for user_id in {taken_log.user_id for taken_log in taken_logs}:
+                user_logs = [taken_log for taken_log in taken_logs if taken_log.user_id == user_id]
+                change_feed.publish(user_id, ChangeResource.HABIT_LOGS, [taken_log.habit_id for taken_log in user_logs],
+                                    [taken_log.log_date for taken_log in user_logs])
+            return len(taken_logs)
+
+    def statistics(self) -> Dict:
+        with self._lock:
+            return {
+                "is_enabled": self.is_enabled,
+                "tracked_logs": len(self._logs),
+                "pending_logs": self._pending_count,
+                "flushed_logs": self.flushed_logs,
+                "coalesced_writes": self.coalesced_writes,
+            }
+
+
+habit_log_buffer = HabitLogWriteBuffer()
+
+
+def flush_pending_habit_logs(request: Request):
+    """
+    Router dependency that flushes the pending logs a read could return before it runs: the logs of the habit_id or
+    user_id of the path, or all of them for the routes without either. The request then reads from the primary, which
+    has the flushed logs before the replicas, also when another request flushed them. A failed flush doesn't fail the
+    read, the logs stay pending and the request reads what the primary has.
+    """
+    if request.method not in READ_METHODS or not habit_log_buffer.has_unwritten_logs():
+        return
+
+    # the replicas may not have the flushed logs yet, whether this request or a concurrent one flushes them
+    request.state.reads_from_primary = True
+    habit_id = request.path_params.get("habit_id")
+    user_id = request.path_params.get("user_id")
+    try:
+        habit_id = int(habit_id) if habit_id is not None else None
+        user_id = int(user_id) if user_id is not None else None
+    except ValueError:
+        # not an ID, the route rejects it anyway
+        return
+    try:
+        habit_log_buffer.flush(get_database().engine, habit_id=habit_id, user_id=user_id)
+    except Exception:
+        logger.exception("Failed to flush the pending habit logs before a read of %s", request.url.path)
@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from ..enums.export_format_enum import ExportFormat
+from ..models.models import Habits
+from .habit_log_archive import get_habit_logs_entity
+
+EXPORT_COLUMNS = ("id", "habit_fk", "log_date", "progress_value", "note", "goal_value", "goal_unit",
+                  "completion_percentage", "created_at", "updated_at")
+# number of rows fetched from the server-side cursor and written to the response at a time
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def select_habit_logs_for_export(habit_id: Optional[int] = None, user_id: Optional[int] = None,
+                                 since: Optional[datetime] = None):
+    """
+    Builds the export query of the logs of a habit or of all the habits of a user
+    :param since: only export the logs created or updated at or after this timestamp, for incremental syncs
+    """
+    # every log, including the archived ones
+    logs = get_habit_logs_entity(None)
+    statement = select(*[getattr(logs, column) for column in EXPORT_COLUMNS]).order_by(logs.id)
+    if habit_id is not None:
+        statement = statement.where(logs.habit_fk == habit_id)
+    if user_id is not None:
+        # an IN on the column of the union, which MySQL pushes down into both tables, rather than a join that it
+        # can only apply once the whole union is materialized
+        statement = statement.where(logs.habit_fk.in_(select(Habits.id).where(Habits.user_fk == user_id)))
+    if since is not None:
+        statement = statement.where(logs.updated_at >= since)
+    return statement
+
+def format_ndjson_rows(rows) -> str:
+    return "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=lambda value: value.isoformat()) + "\n"
+                   for row in rows)
+
+def format_csv_rows(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [value.isoformat() if hasattr(value, "isoformat") else value for value in row] for row in rows)
+    return buffer.getvalue()
+
+def stream_habit_logs(statement, export_format: ExportFormat, bind: Engine) -> Iterator[str]:
+    """
+    Streams the rows of an export query in fixed-size batches read from a server-side cursor, so that memory stays
+    bounded however many logs are exported. It uses its own session, since the response is streamed after the
+    request's session is closed.
+    :param bind: engine to read the logs from, a read replica when there are any
+    """
+    with Session(bind) as session:
+        if export_format == ExportFormat.CSV:
+            yield format_csv_rows([EXPORT_COLUMNS])
+
+        result = session.exec(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            if export_format == ExportFormat.CSV:
+                yield format_csv_rows(rows)
+            else:
+                yield format_ndjson_rows(rows)
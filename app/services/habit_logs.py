@@ -0,0 +1,129 @@
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, tuple_, or_, func
+
+from ..models.models import HabitLogs
+from ..schemas.schemas import BulkHabitLogEntry, BulkHabitLogError, BulkUpsertHabitLogsResponse
+from .habit_log_archive import unarchive_habit_logs
+from .habit_summaries import refresh_monthly_summaries, lock_habits
+
+# values of a log that are written by the client
+LOG_VALUE_COLUMNS = ("progress_value", "note", "goal_value", "goal_unit", "completion_percentage")
+# columns overwritten when a log of the same habit and date already exists
+UPSERT_COLUMNS = (*LOG_VALUE_COLUMNS, "updated_at")
+# number of entries written per statement and transaction by the bulk upsert
+BULK_UPSERT_CHUNK_SIZE = 500
+
+
+def build_habit_logs_upsert(dialect_name: str, rows: List[Dict]):
+    """
+    Builds a single multi-row INSERT ... ON DUPLICATE KEY UPDATE statement on the (habit_fk, log_date) unique index.
+    SQLite, used for local testing, gets the equivalent INSERT ... ON CONFLICT DO UPDATE. An existing log is only
+    updated, and its updated_at bumped, when one of its values differs from the written ones.
+    :param dialect_name: name of the dialect of the bound engine
+    :param rows: dicts with the habit_fk, log_date, created_at and UPSERT_COLUMNS values of every log
+    """
+    if dialect_name == "mysql":
+        statement = mysql_insert(HabitLogs).values(rows)
+        is_changed = or_(*[HabitLogs.__table__.c[column].is_distinct_from(statement.inserted[column])
+                           for column in LOG_VALUE_COLUMNS])
+        # MySQL applies the assignments in order, so updated_at has to be compared before the values are overwritten
+        return statement.on_duplicate_key_update([
+            ("updated_at", func.if_(is_changed, statement.inserted.updated_at, HabitLogs.__table__.c.updated_at)),
+            *[(column, statement.inserted[column]) for column in LOG_VALUE_COLUMNS],
+        ])
+    if dialect_name == "sqlite":
+        statement = sqlite_insert(HabitLogs).values(rows)
+        is_changed = or_(*[HabitLogs.__table__.c[column].is_distinct_from(statement.excluded[column])
+                           for column in LOG_VALUE_COLUMNS])
+        return statement.on_conflict_do_update(index_elements=["habit_fk", "log_date"],
+                                               set_={column: statement.excluded[column] for column in UPSERT_COLUMNS},
+                                               where=is_changed)
+    raise NotImplementedError(f"Habit log upserts are not supported for the {dialect_name} dialect")
+
+def upsert_habit_log_row(habit_id: int, log_date: date, values: Dict,
+                         session: Session) -> Tuple[HabitLogs, bool, bool]:
+    """
+    Inserts or updates the log of a habit for a given date with a single statement. It doesn't commit.
+    :param habit_id: ID of the habit
+    :param log_date: date of the log
+    :param values: values of the LOG_VALUE_COLUMNS to write
+    :param session: current DB session
+    :return: tuple of the stored log, whether it was created and whether it was created or changed
+    """
+    # the writes of the logs of a habit are serialized, see lock_habits
+    lock_habits([habit_id], session)
+    unarchive_habit_logs([(habit_id, log_date)], session)
+    now = datetime.now()
+    row = {**values, "habit_fk": habit_id, "log_date": log_date, "created_at": now, "updated_at": now}
+    session.exec(build_habit_logs_upsert(session.get_bind().dialect.name, [row]))
+
+    get_habit_log_statement = (
+        select(HabitLogs)
+        .where(HabitLogs.habit_fk == habit_id)
+        .where(HabitLogs.log_date == log_date)
+        .execution_options(populate_existing=True)
+    )
+    habit_log = session.exec(get_habit_log_statement).one()
+    # created_at is only written by an insert and updated_at by an insert or a change, see build_habit_logs_upsert
+    return habit_log, habit_log.created_at == now, habit_log.updated_at == now
+
+def bulk_upsert_habit_logs(entries: List[Tuple[int, BulkHabitLogEntry]], session: Session) -> BulkUpsertHabitLogsResponse:
+    """
+    Upserts a chunk of habit log entries with one multi-row statement and commits it, together with the monthly
+    summaries of the months it touched
+    :param entries: tuples of the index of the entry in the request and the entry
+    :param session: current DB session
+    :return: indexes of the created, updated and unchanged entries, and of the rejected ones
+    """
+    result = BulkUpsertHabitLogsResponse()
+
+    # When the same habit and date appear more than once, the last entry wins
+    entries_by_key: Dict[Tuple[int, date], Tuple[int, BulkHabitLogEntry]] = {}
+    for index, entry in entries:
+        key = (entry.habit_id, entry.log_date)
+        if key in entries_by_key:
+            result.errors.append(BulkHabitLogError(index=entries_by_key[key][0],
+                                                   detail="Superseded by a later entry for the same habit and date"))
+        entries_by_key[key] = (index, entry)
+    if not entries_by_key:
+        return result
+
+    habit_ids = {habit_id for habit_id, _ in entries_by_key}
+    found_habit_ids = lock_habits(habit_ids, session)
+    for key, (index, entry) in list(entries_by_key.items()):
+        if entry.habit_id not in found_habit_ids:
+            result.errors.append(BulkHabitLogError(index=index, detail=f"Habit {entry.habit_id} not found"))
+            del entries_by_key[key]
+    if not entries_by_key:
+        return result
+
+    unarchive_habit_logs(entries_by_key, session)
+    existing_logs_statement = (
+        select(HabitLogs.habit_fk, HabitLogs.log_date, *[getattr(HabitLogs, column) for column in LOG_VALUE_COLUMNS])
+        .where(tuple_(HabitLogs.habit_fk, HabitLogs.log_date).in_(list(entries_by_key)))
+    )
+    existing_values = {(log.habit_fk, log.log_date): tuple(log[2:]) for log in session.exec(existing_logs_statement)}
+
+    now = datetime.now()
+    rows = []
+    for key, (index, entry) in entries_by_key.items():
+        values = entry.model_dump(include=set(LOG_VALUE_COLUMNS))
+        if key not in existing_values:
+            result.created.append(index)
+        elif existing_values[key] == tuple(values[column] for column in LOG_VALUE_COLUMNS):
+            result.unchanged.append(index)
+            continue
+        else:
+            result.updated.append(index)
+        rows.append({**values, "habit_fk": entry.habit_id, "log_date": entry.log_date, "created_at": now,
+                     "updated_at": now})
+
+    if rows:
+        session.exec(build_habit_logs_upsert(session.get_bind().dialect.name, rows))
+        refresh_monthly_summaries({(row["habit_fk"], row["log_date"].replace(day=1)) for row in rows}, session)
+        session.commit()
+    return result
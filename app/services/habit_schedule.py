@@ -0,0 +1,268 @@
+from dataclasses import dataclass
+import calendar
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlmodel import Session, select, func, case, and_, or_
+
+from ..enums.repeat_type_enum import RepeatType
+from ..models.models import Habits
+from .habit_log_archive import get_habit_logs_entity, get_latest_log_dates
+
+MAX_SCHEDULE_RANGE_DAYS = 366
+WEEKDAY_STRINGS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+@dataclass
+class HabitLogFacts:
+    """
+    Log facts needed to evaluate the count-based repeat rules of a habit for a given date
+    """
+    week_log_count: int = 0
+    month_log_count: int = 0
+    # latest log strictly before the evaluated date
+    latest_log_date: Optional[date] = None
+
+
+def get_week_bounds(given_date: date) -> Tuple[date, date]:
+    """
+    Returns the [start, end) bounds of the ISO week that contains the given date
+    """
+    week_start = given_date - timedelta(days=given_date.weekday())
+    return week_start, week_start + timedelta(days=7)
+
+def get_month_bounds(given_date: date) -> Tuple[date, date]:
+    """
+    Returns the [start, end) bounds of the calendar month that contains the given date
+    """
+    month_start = given_date.replace(day=1)
+    if month_start.month == 12:
+        return month_start, month_start.replace(year=month_start.year + 1, month=1)
+    return month_start, month_start.replace(month=month_start.month + 1)
+
+def compile_repeat_rule(repeat_type: Optional[str], repeat_config: Optional[str]) -> Tuple[int, int, Optional[int]]:
+    """
+    Compiles a repeat rule into a 7-bit weekday mask (bit 0 is monday), a 31-bit month day mask (bit 0 is day 1) and
+    the N of the count-based rules, so that the rule doesn't have to be parsed every time it's evaluated.
+    :param repeat_type: one of the RepeatType values
+    :param repeat_config: comma separated weekdays or month days, or N for the count-based rules
+    :return: tuple of weekday_mask, month_day_mask and repeat_n
+    """
+    weekday_mask, month_day_mask, repeat_n = 0, 0, None
+    if repeat_type is not None and repeat_type not in RepeatType._value2member_map_:
+        raise ValueError(f"Unknown repeat type: {repeat_type}")
+    if not repeat_config:
+        return weekday_mask, month_day_mask, repeat_n
+
+    match repeat_type:
+        case RepeatType.SPECIFIC_WEEKDAYS.value:
+            for weekday in repeat_config.split(","):
+                weekday = weekday.strip().lower()
+                if weekday not in WEEKDAY_STRINGS:
+                    raise ValueError(f"Invalid weekday in repeat_config: {weekday}")
+                weekday_mask |= 1 << WEEKDAY_STRINGS.index(weekday)
+        case RepeatType.SPECIFIC_MONTH_DAYS.value:
+            for month_day in repeat_config.split(","):
+                if not month_day.strip().isdigit() or not 1 <= int(month_day) <= 31:
+                    raise ValueError(f"Invalid month day in repeat_config: {month_day.strip()}")
+                month_day_mask |= 1 << (int(month_day) - 1)
+        case RepeatType.N_TIMES_PER_WEEK.value | RepeatType.N_TIMES_PER_MONTH.value | RepeatType.EVERY_N_DAYS.value:
+            if not repeat_config.strip().isdigit() or int(repeat_config) < 1:
+                raise ValueError(f"repeat_config must be a positive integer for {repeat_type} habits")
+            repeat_n = int(repeat_config)
+
+    return weekday_mask, month_day_mask, repeat_n
+
+def apply_compiled_repeat_rule(habit: Habits):
+    """
+    Stores the compiled repeat rule of a habit in its weekday_mask, month_day_mask and repeat_n columns
+    :raises ValueError: if the repeat rule of the habit is invalid
+    """
+    habit.weekday_mask, habit.month_day_mask, habit.repeat_n = compile_repeat_rule(habit.repeat_type,
+                                                                                   habit.repeat_config)
+
+def build_calendar_rule_filter(given_date: date):
+    """
+    Returns a WHERE clause that drops the SPECIFIC_WEEKDAYS and SPECIFIC_MONTH_DAYS habits that are not due on the
+    given date, using the compiled masks. Habits of the other repeat types are kept for evaluation in memory.
+    """
+    return or_(
+        Habits.repeat_type.notin_([RepeatType.SPECIFIC_WEEKDAYS.value, RepeatType.SPECIFIC_MONTH_DAYS.value]),
+        Habits.weekday_mask.op("&")(1 << given_date.weekday()) != 0,
+        Habits.month_day_mask.op("&")(1 << (given_date.day - 1)) != 0,
+    )
+
+def load_habit_log_facts(habits: Sequence[Habits], given_date: date, session: Session) -> Dict[int, HabitLogFacts]:
+    """
+    Loads the log facts of every given habit with a fixed number of set-based queries: one aggregate over the
+    week/month window for the count-based rules and one for the latest log before the given date.
+    :param habits: habits to load the facts for
+    :param given_date: date the habits are being evaluated for
+    :param session: current DB session
+    :return: dict that maps every habit ID to its log facts
+    """
+    facts = {habit.id: HabitLogFacts() for habit in habits}
+    counted_habit_ids = [habit.id for habit in habits if habit.repeat_type in (
+        RepeatType.N_TIMES_PER_WEEK.value, RepeatType.N_TIMES_PER_MONTH.value)]
+    every_n_days_habit_ids = [habit.id for habit in habits if habit.repeat_type == RepeatType.EVERY_N_DAYS.value]
+
+    if counted_habit_ids:
+        week_start, week_end = get_week_bounds(given_date)
+        month_start, month_end = get_month_bounds(given_date)
+        logs = get_habit_logs_entity(min(week_start, month_start))
+        counts_statement = (
+            select(
+                logs.habit_fk,
+                func.sum(case((and_(logs.log_date >= week_start, logs.log_date < week_end), 1), else_=0)),
+                func.sum(case((and_(logs.log_date >= month_start, logs.log_date < month_end), 1), else_=0)),
+            )
+            .where(logs.habit_fk.in_(counted_habit_ids))
+            .where(logs.log_date >= min(week_start, month_start))
+            .where(logs.log_date < max(week_end, month_end))
+            .group_by(logs.habit_fk)
+        )
+        for habit_id, week_log_count, month_log_count in session.exec(counts_statement):
+            facts[habit_id].week_log_count = int(week_log_count or 0)
+            facts[habit_id].month_log_count = int(month_log_count or 0)
+
+    if every_n_days_habit_ids:
+        for habit_id, latest_log_date in get_latest_log_dates(every_n_days_habit_ids, given_date, session).items():
+            facts[habit_id].latest_log_date = latest_log_date
+
+    return facts
+
+def is_habit_due(habit: Habits, given_date: date, facts: HabitLogFacts) -> bool:
+    """
+    Evaluates the repeat rule of a habit in memory, using the log facts loaded for the given date
+    """
+    repeat_n = habit.repeat_n
+    # TODO: Throw an exception when the repeat_config is None instead of returning False
+    match habit.repeat_type:
+        case RepeatType.DAILY.value:
+            return True
+        case RepeatType.SPECIFIC_WEEKDAYS.value:
+            return bool(habit.weekday_mask & (1 << given_date.weekday()))
+        case RepeatType.SPECIFIC_MONTH_DAYS.value:
+            return bool(habit.month_day_mask & (1 << (given_date.day - 1)))
+        case RepeatType.N_TIMES_PER_WEEK.value:
+            return repeat_n is not None and facts.week_log_count < repeat_n
+        case RepeatType.N_TIMES_PER_MONTH.value:
+            return repeat_n is not None and facts.month_log_count < repeat_n
+        case RepeatType.EVERY_N_DAYS.value:
+            if repeat_n is None:
+                return False
+            # If there are no habit_log records, that means this habit has never been displayed
+            if facts.latest_log_date is None:
+                return True
+            return (given_date - facts.latest_log_date).days >= repeat_n
+    return False
+
+def get_habit_ids_due_on_date(habits: Sequence[Habits], given_date: date, session: Session) -> List[int]:
+    """
+    Returns the IDs of the habits that have to be completed on the given date, keeping the order of the habits
+    :param habits: habits to evaluate
+    :param given_date: date to evaluate the habits for
+    :param session: current DB session
+    """
+    facts = load_habit_log_facts(habits, given_date, session)
+    return [habit.id for habit in habits if is_habit_due(habit, given_date, facts[habit.id])]
+
+def get_habit_ids_due_in_date_range(habits: Sequence[Habits], start_date: date, end_date: date,
+                                    session: Session) -> Dict[date, List[int]]:
+    """
+    Returns the IDs of the habits that have to be completed on every date of the [start_date, end_date] range.
+    The logs of the whole window are loaded once and the repeat rules are stepped across the range day by day.
+    :param habits: habits to evaluate
+    :param start_date: first date of the range
+    :param end_date: last date of the range (inclusive)
+    :param session: current DB session
+    :return: dict that maps every date of the range to the IDs of the habits due on it
+    """
+    # The window covers the full weeks and months the range touches, since the count-based rules look at them
+    window_start = min(get_week_bounds(start_date)[0], get_month_bounds(start_date)[0])
+    window_end = max(get_week_bounds(end_date)[1], get_month_bounds(end_date)[1])
+
+    week_log_counts: Dict[Tuple[int, date], int] = {}
+    month_log_counts: Dict[Tuple[int, date], int] = {}
+    log_dates_by_habit: Dict[int, List[date]] = {}
+    latest_log_dates: Dict[int, Optional[date]] = {habit.id: None for habit in habits}
+    logged_habit_ids = [habit.id for habit in habits if habit.repeat_type in (
+        RepeatType.N_TIMES_PER_WEEK.value, RepeatType.N_TIMES_PER_MONTH.value, RepeatType.EVERY_N_DAYS.value)]
+
+    if logged_habit_ids:
+        logs = get_habit_logs_entity(window_start)
+        window_logs_statement = (
+            select(logs.habit_fk, logs.log_date)
+            .where(logs.habit_fk.in_(logged_habit_ids))
+            .where(logs.log_date >= window_start)
+            .where(logs.log_date < window_end)
+            .order_by(logs.log_date)
+        )
+        for habit_id, log_date in session.exec(window_logs_statement):
+            week_key = (habit_id, get_week_bounds(log_date)[0])
+            month_key = (habit_id, log_date.replace(day=1))
+            week_log_counts[week_key] = week_log_counts.get(week_key, 0) + 1
+            month_log_counts[month_key] = month_log_counts.get(month_key, 0) + 1
+            log_dates_by_habit.setdefault(habit_id, []).append(log_date)
+
+        latest_log_dates.update(get_latest_log_dates(logged_habit_ids, window_start, session))
+
+    next_log_indexes = {habit.id: 0 for habit in habits}
+    facts = {habit.id: HabitLogFacts() for habit in habits}
+    due_habit_ids_by_date = {}
+    current_date = start_date
+    while current_date <= end_date:
+        week_start = get_week_bounds(current_date)[0]
+        month_start = current_date.replace(day=1)
+        for habit_id, habit_facts in facts.items():
+            # Advance the latest log before the current date past the logs of the previous days
+            log_dates = log_dates_by_habit.get(habit_id, [])
+            next_log_index = next_log_indexes[habit_id]
+            while next_log_index < len(log_dates) and log_dates[next_log_index] < current_date:
+                latest_log_dates[habit_id] = log_dates[next_log_index]
+                next_log_index += 1
+            next_log_indexes[habit_id] = next_log_index
+
+            habit_facts.latest_log_date = latest_log_dates[habit_id]
+            habit_facts.week_log_count = week_log_counts.get((habit_id, week_start), 0)
+            habit_facts.month_log_count = month_log_counts.get((habit_id, month_start), 0)
+
+        due_habit_ids_by_date[current_date] = [
+            habit.id for habit in habits if is_habit_due(habit, current_date, facts[habit.id])
+        ]
+        current_date += timedelta(days=1)
+
+    return due_habit_ids_by_date
+
+def get_expected_completions(habit: Habits, start_date: date, end_date: date) -> float:
+    """
+    Returns how many times a habit is expected to be completed in the [start_date, end_date] range according to its
+    repeat rule alone, regardless of its logs. Count-based rules are prorated for partial weeks and months.
+    """
+    start_date = max(start_date, habit.start_date.date())
+    if habit.end_date is not None:
+        end_date = min(end_date, habit.end_date.date())
+    if end_date < start_date:
+        return 0
+    days = (end_date - start_date).days + 1
+    repeat_n = habit.repeat_n
+
+    match habit.repeat_type:
+        case RepeatType.DAILY.value:
+            return days
+        case RepeatType.SPECIFIC_WEEKDAYS.value:
+            return sum(1 for offset in range(days)
+                       if habit.weekday_mask & (1 << (start_date + timedelta(days=offset)).weekday()))
+        case RepeatType.SPECIFIC_MONTH_DAYS.value:
+            return sum(1 for offset in range(days)
+                       if habit.month_day_mask & (1 << ((start_date + timedelta(days=offset)).day - 1)))
+        case RepeatType.N_TIMES_PER_WEEK.value:
+            return repeat_n * days / 7 if repeat_n else 0
+        case RepeatType.N_TIMES_PER_MONTH.value:
+            if not repeat_n:
+                return 0
+            return sum(repeat_n / calendar.monthrange(current_date.year, current_date.month)[1]
+                       for current_date in (start_date + timedelta(days=offset) for offset in range(days)))
+        case RepeatType.EVERY_N_DAYS.value:
+            return days / repeat_n if repeat_n else 0
+    return 0
@@ -0,0 +1,139 @@
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlmodel import Session, select, func, case
+
+from ..enums.statistics_bucket_enum import StatisticsBucket
+from ..models.models import HabitLogs
+from .habit_log_archive import get_habit_logs_entity
+from .habit_summaries import get_longest_streak, reportable_streak
+
+DEFAULT_STATISTICS_RANGE_DAYS = 365
+# ranges of up to 10 years, e.g. to compare several years of daily buckets
+MAX_STATISTICS_RANGE_DAYS = 3660
+
+
+def resolve_date_range(start_date: Optional[date], end_date: Optional[date], days: Optional[int]) -> Tuple[date, date]:
+    """
+    Resolves the inclusive date range of a statistics request, either explicit or the rolling window of the given
+    number of days that ends on end_date, today by default
+    :raises HTTPException: 400 if the range is invalid or too long
+    """
+    if start_date is not None and days is not None:
+        raise HTTPException(status_code=400, detail="start_date and days can't be used together")
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=(days or DEFAULT_STATISTICS_RANGE_DAYS) - 1)
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if (end_date - start_date).days >= MAX_STATISTICS_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date ranges can span at most {MAX_STATISTICS_RANGE_DAYS} days")
+    return start_date, end_date
+
+def get_bucket_expression(dialect_name: str, bucket: StatisticsBucket, logs=HabitLogs):
+    """
+    Returns the SQL expression of the first day of the bucket that contains the log_date of a log. Weeks start on
+    Monday. SQLite, used for local testing, gets the equivalent date functions.
+    :param logs: entity the logs are read from (see get_habit_logs_entity)
+    """
+    if bucket == StatisticsBucket.DAY:
+        return logs.log_date
+    if dialect_name == "mysql":
+        if bucket == StatisticsBucket.WEEK:
+            return func.subdate(logs.log_date, func.weekday(logs.log_date))
+        return func.date_format(logs.log_date, "%Y-%m-01")
+    if dialect_name == "sqlite":
+        if bucket == StatisticsBucket.WEEK:
+            # moves forward to the next Sunday, or stays on a Sunday, then back to the Monday before it
+            return func.date(logs.log_date, "weekday 0", "-6 days")
+        return func.strftime("%Y-%m-01", logs.log_date)
+    raise NotImplementedError(f"Statistics buckets are not supported for the {dialect_name} dialect")
+
+def to_date(value) -> date:
+    # the bucket expressions return strings on some dialects
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+def select_log_aggregates(*columns, logs=HabitLogs):
+    is_perfect_day = case((logs.completion_percentage == 100, 1), else_=0)
+    return select(
+        *columns,
+        func.count(logs.id).label("active_days"),
+        func.coalesce(func.sum(is_perfect_day), 0).label("perfect_days"),
+        func.coalesce(func.sum(logs.progress_value), 0).label("total_completed"),
+        func.avg(logs.completion_percentage).label("average_completion_percentage"),
+    )
+
+def format_aggregates(row) -> Dict:
+    return {
+        "active_days": row.active_days,
+        "perfect_days": int(row.perfect_days),
+        "total_completed": float(row.total_completed),
+        "average_completion_percentage": (float(row.average_completion_percentage)
+                                          if row.average_completion_percentage is not None else None),
+    }
+
+def build_habit_statistics(habit_id: int, start_date: date, end_date: date, bucket: StatisticsBucket,
+                           session: Session) -> Dict:
+    """
+    Builds the statistics of a habit over a date range. The totals and buckets are aggregated by the database with
+    GROUP BY, the streaks come from one ordered scan of the date and completion columns of the logs.
+    :param habit_id: ID of the habit
+    :param start_date: first date of the range
+    :param end_date: last date of the range (inclusive)
+    :param bucket: size of the buckets the range is split into
+    :param session: current DB session
+    """
+    logs = get_habit_logs_entity(start_date)
+    in_range = (logs.habit_fk == habit_id, logs.log_date >= start_date, logs.log_date <= end_date)
+
+    totals = session.exec(select_log_aggregates(logs=logs).where(*in_range)).one()
+
+    bucket_expression = get_bucket_expression(session.get_bind().dialect.name, bucket, logs).label("bucket_start")
+    buckets_statement = (
+        select_log_aggregates(bucket_expression, logs=logs)
+        .where(*in_range)
+        .group_by(bucket_expression)
+        .order_by(bucket_expression)
+    )
+    buckets = [{"start_date": to_date(row.bucket_start), **format_aggregates(row)}
+               for row in session.exec(buckets_statement)]
+
+    streaks_statement = (
+        select(logs.log_date, logs.completion_percentage)
+        .where(*in_range)
+        .order_by(logs.log_date)
+    )
+    active_dates = []
+    perfect_dates = []
+    for log_date, completion_percentage in session.exec(streaks_statement):
+        active_dates.append(log_date)
+        if completion_percentage == 100:
+            perfect_dates.append(log_date)
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "bucket": bucket.value,
+        **format_aggregates(totals),
+        "longest_active_streak": reportable_streak(get_longest_streak(active_dates)),
+        "longest_perfect_streak": reportable_streak(get_longest_streak(perfect_dates)),
+        "buckets": buckets,
+    }
+
+def build_habit_heatmap(habit_id: int, start_date: date, end_date: date, session: Session) -> Dict:
+    """
+    Returns the completion percentage of every logged day of a range, read from the (habit_fk, log_date) index range
+    """
+    logs = get_habit_logs_entity(start_date)
+    statement = (
+        select(logs.log_date, logs.completion_percentage)
+        .where(logs.habit_fk == habit_id)
+        .where(logs.log_date >= start_date)
+        .where(logs.log_date <= end_date)
+        .order_by(logs.log_date)
+    )
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "days": {log_date: completion_percentage for log_date, completion_percentage in session.exec(statement)},
+    }
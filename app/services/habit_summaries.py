@@ -0,0 +1,378 @@
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, delete, tuple_
+
+from ..models.models import Habits, HabitLogs, HabitMonthlySummaries
+from .habit_log_archive import get_habit_logs_entity
+from .habit_schedule import get_month_bounds, get_week_bounds, get_expected_completions
+
+# completion rates of the user summary are computed over this many days, ending today
+COMPLETION_RATE_DAYS = 30
+# columns of a summary row that are overwritten when it's refreshed
+SUMMARY_VALUE_COLUMNS = tuple(column.name for column in HabitMonthlySummaries.__table__.c if not column.primary_key)
+MONTH_NAMES = ("january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+               "november", "december")
+
+
+def get_longest_streak(sorted_dates: Sequence[date]) -> int:
+    """
+    Returns the length of the longest run of consecutive dates
+    :param sorted_dates: dates sorted in ascending order, without duplicates
+    """
+    longest_streak = 0
+    current_streak = 0
+    previous_date = None
+    for current_date in sorted_dates:
+        if previous_date is not None and (current_date - previous_date).days == 1:
+            current_streak += 1
+        else:
+            current_streak = 1
+        longest_streak = max(longest_streak, current_streak)
+        previous_date = current_date
+    return longest_streak
+
+def get_leading_and_trailing_streaks(dates: Iterable[date], year: int, month: int):
+    """
+    Returns the length of the streak that starts on the first day of the month and of the one that ends on its last day
+    """
+    days_of_month = {given_date.day for given_date in dates}
+    days_in_month = calendar.monthrange(year, month)[1]
+
+    leading_streak = 0
+    while leading_streak < days_in_month and leading_streak + 1 in days_of_month:
+        leading_streak += 1
+
+    trailing_streak = 0
+    while trailing_streak < days_in_month and days_in_month - trailing_streak in days_of_month:
+        trailing_streak += 1
+
+    return leading_streak, trailing_streak
+
+def summarize_month(habit_id: int, year: int, month: int, month_logs) -> HabitMonthlySummaries:
+    """
+    Builds the monthly summary row of a habit
+    :param month_logs: rows with the log_date, completion_percentage, progress_value and goal_unit of the logs of the
+    month, ordered by log_date
+    """
+    active_dates = sorted({log.log_date for log in month_logs})
+    perfect_dates = sorted({log.log_date for log in month_logs if log.completion_percentage == 100})
+    leading_active_streak, trailing_active_streak = get_leading_and_trailing_streaks(active_dates, year, month)
+    leading_perfect_streak, trailing_perfect_streak = get_leading_and_trailing_streaks(perfect_dates, year, month)
+
+    return HabitMonthlySummaries(
+        habit_fk=habit_id,
+        year=year,
+        month=month,
+        active_days=len(month_logs),
+        perfect_days=sum(1 for log in month_logs if log.completion_percentage == 100),
+        total_completed=sum(log.progress_value or 0 for log in month_logs),
+        goal_unit=month_logs[0].goal_unit,
+        longest_active_streak=get_longest_streak(active_dates),
+        longest_perfect_streak=get_longest_streak(perfect_dates),
+        leading_active_streak=leading_active_streak,
+        trailing_active_streak=trailing_active_streak,
+        leading_perfect_streak=leading_perfect_streak,
+        trailing_perfect_streak=trailing_perfect_streak,
+        updated_at=datetime.now(),
+    )
+
+def select_summary_log_columns(logs=HabitLogs):
+    return select(logs.habit_fk, logs.log_date, logs.completion_percentage, logs.progress_value, logs.goal_unit)
+
+def refresh_monthly_summary(habit_id: int, given_date: date, session: Session):
+    """
+    Recomputes the summary row of the month that contains the given date from the (at most 31) logs of that month.
+    It doesn't commit, so that the row is updated in the same transaction as the log that changed it.
+    :param habit_id: ID of the habit
+    :param given_date: date of the log that changed
+    :param session: current DB session
+    """
+    refresh_monthly_summaries({(habit_id, given_date.replace(day=1))}, session)
+
+def lock_habits(habit_ids: Iterable[int], session: Session) -> Set[int]:
+    """
+    Locks the rows of the given habits until the end of the transaction with SELECT ... FOR UPDATE, in ID order. The
+    writes of logs take it before touching any log, so that the writes of the same habit and the refreshes of its
+    monthly summaries are serialized and every refresh reads the logs committed before it. SQLite, which locks the
+    whole database on the first write, ignores it.
+    :return: IDs of the habits that exist
+    """
+    lock_statement = (
+        select(Habits.id)
+        .where(Habits.id.in_(set(habit_ids)))
+        .order_by(Habits.id)
+        .with_for_update()
+    )
+    return set(session.exec(lock_statement).all())
+
+def build_monthly_summaries_upsert(dialect_name: str, rows: List[Dict]):
+    """
+    Builds a single multi-row INSERT ... ON DUPLICATE KEY UPDATE statement on the primary key of the summary rows, or
+    the equivalent INSERT ... ON CONFLICT DO UPDATE for SQLite
+    :param dialect_name: name of the dialect of the bound engine
+    :param rows: dicts with every column of the summary rows
+    """
+    if dialect_name == "mysql":
+        statement = mysql_insert(HabitMonthlySummaries).values(rows)
+        return statement.on_duplicate_key_update(
+            {column: statement.inserted[column] for column in SUMMARY_VALUE_COLUMNS})
+    if dialect_name == "sqlite":
+        statement = sqlite_insert(HabitMonthlySummaries).values(rows)
+        return statement.on_conflict_do_update(
+            index_elements=["habit_fk", "year", "month"],
+            set_={column: statement.excluded[column] for column in SUMMARY_VALUE_COLUMNS})
+    raise NotImplementedError(f"Monthly summary upserts are not supported for the {dialect_name} dialect")
+
+def refresh_monthly_summaries(habit_months: Set[Tuple[int, date]], session: Session):
+    """
+    Recomputes the summary rows of several habits and months with one query for their logs, and writes them with one
+    upsert. The caller writes the logs under the lock of their habits, which the refresh reads under as well, see
+    lock_habits. It doesn't commit.
+    :param habit_months: set of (habit ID, first day of the month) tuples whose logs changed
+    :param session: current DB session
+    """
+    if not habit_months:
+        return
+
+    habit_ids = {habit_id for habit_id, _ in habit_months}
+    month_starts = {month_start for _, month_start in habit_months}
+    logs = get_habit_logs_entity(min(month_starts))
+    month_logs_statement = (
+        select_summary_log_columns(logs)
+        .where(logs.habit_fk.in_(habit_ids))
+        .where(logs.log_date >= min(month_starts))
+        .where(logs.log_date < get_month_bounds(max(month_starts))[1])
+        .order_by(logs.log_date)
+    )
+    logs_by_month: Dict[Tuple[int, date], list] = {}
+    for log in session.exec(month_logs_statement):
+        habit_month = (log.habit_fk, log.log_date.replace(day=1))
+        if habit_month in habit_months:
+            logs_by_month.setdefault(habit_month, []).append(log)
+
+    if logs_by_month:
+        rows = [summarize_month(habit_id, month_start.year, month_start.month, month_logs).model_dump()
+                for (habit_id, month_start), month_logs in logs_by_month.items()]
+        session.exec(build_monthly_summaries_upsert(session.get_bind().dialect.name, rows))
+    # the months left without logs no longer have a summary row
+    emptied_months = [(habit_id, month_start.year, month_start.month) for habit_id, month_start in habit_months
+                      if (habit_id, month_start) not in logs_by_month]
+    if emptied_months:
+        session.exec(delete(HabitMonthlySummaries).where(
+            tuple_(HabitMonthlySummaries.habit_fk, HabitMonthlySummaries.year, HabitMonthlySummaries.month)
+            .in_(emptied_months)))
+
+def rebuild_monthly_summaries(habit_ids: List[int], session: Session) -> int:
+    """
+    Replaces the monthly summary rows of the given habits with rows computed from all of their logs. It doesn't commit.
+    :return: number of summary rows written
+    """
+    session.exec(delete(HabitMonthlySummaries).where(HabitMonthlySummaries.habit_fk.in_(habit_ids)))
+    logs = get_habit_logs_entity(None)
+    logs_statement = (
+        select_summary_log_columns(logs)
+        .where(logs.habit_fk.in_(habit_ids))
+        .order_by(logs.habit_fk, logs.log_date)
+    )
+    logs_by_month: Dict[tuple, list] = {}
+    for log in session.exec(logs_statement):
+        logs_by_month.setdefault((log.habit_fk, log.log_date.year, log.log_date.month), []).append(log)
+
+    session.add_all([summarize_month(habit_id, year, month, month_logs)
+                     for (habit_id, year, month), month_logs in logs_by_month.items()])
+    return len(logs_by_month)
+
+def stitch_longest_streak(summaries: Sequence[HabitMonthlySummaries], streak_type: str) -> int:
+    """
+    Returns the longest streak across consecutive months, joining the trailing streak of a month with the leading streak
+    of the next one
+    :param summaries: monthly summaries ordered by year and month
+    :param streak_type: either "active" or "perfect"
+    """
+    longest_streak = 0
+    open_streak = 0
+    previous_month_index: Optional[int] = None
+    for summary in summaries:
+        month_index = summary.year * 12 + summary.month - 1
+        if previous_month_index is None or month_index - previous_month_index != 1:
+            open_streak = 0
+
+        leading_streak = getattr(summary, f"leading_{streak_type}_streak")
+        longest_streak = max(longest_streak, getattr(summary, f"longest_{streak_type}_streak"),
+                             open_streak + leading_streak)
+        if leading_streak == calendar.monthrange(summary.year, summary.month)[1]:
+            open_streak += leading_streak
+        else:
+            open_streak = getattr(summary, f"trailing_{streak_type}_streak")
+        previous_month_index = month_index
+    return longest_streak
+
+def reportable_streak(streak: int) -> int:
+    # Single days are not reported as streaks
+    return streak if streak >= 2 else 0
+
+def build_yearly_summary(habit_id: int, year: int, session: Session, include_daily_progress: bool = True) -> Dict:
+    """
+    Builds the monthly and yearly summaries of a habit from its (at most 12) monthly summary rows
+    :param habit_id: ID of the habit
+    :param year: year to summarize
+    :param session: current DB session
+    :param include_daily_progress: whether to include the completion percentage of every logged day
+    """
+    summaries_statement = (
+        select(HabitMonthlySummaries)
+        .where(HabitMonthlySummaries.habit_fk == habit_id)
+        .where(HabitMonthlySummaries.year == year)
+        .order_by(HabitMonthlySummaries.month)
+    )
+    summaries = session.exec(summaries_statement).all()
+
+    response = {
+        "monthly_data": {},
+        "yearly_summary": {}
+    }
+    if not summaries:
+        return response
+
+    monthly_data = {}
+    for summary in summaries:
+        monthly_data[MONTH_NAMES[summary.month - 1]] = {
+            "monthly_summary": {
+                "active_days": summary.active_days,
+                "longest_active_streak": reportable_streak(summary.longest_active_streak),
+                "perfect_days": summary.perfect_days,
+                "longest_perfect_streak": reportable_streak(summary.longest_perfect_streak),
+                "total_completed": f"{summary.total_completed} {summary.goal_unit}"
+            }
+        }
+
+    if include_daily_progress:
+        logs = get_habit_logs_entity(date(year, 1, 1))
+        daily_progress_statement = (
+            select(logs.log_date, logs.completion_percentage)
+            .where(logs.habit_fk == habit_id)
+            .where(logs.log_date >= date(year, 1, 1))
+            .where(logs.log_date < date(year + 1, 1, 1))
+            .order_by(logs.log_date)
+        )
+        for log_date, completion_percentage in session.exec(daily_progress_statement):
+            # a month whose summary row is missing, e.g. while it's being refreshed, is reported as empty
+            month_data = monthly_data.setdefault(MONTH_NAMES[log_date.month - 1], {
+                "monthly_summary": {
+                    "active_days": 0,
+                    "longest_active_streak": 0,
+                    "perfect_days": 0,
+                    "longest_perfect_streak": 0,
+                    "total_completed": f"0.0 {summaries[0].goal_unit}"
+                }
+            })
+            month_data.setdefault("daily_progress", []).append({
+                "date": f"{log_date.month:02d}/{log_date.day:02d}/{log_date.year}",
+                "completion_percentage": completion_percentage
+            })
+
+    response["monthly_data"] = {month_name: monthly_data[month_name] for month_name in MONTH_NAMES
+                                if month_name in monthly_data}
+    response["yearly_summary"] = {
+        "active_days": sum(summary.active_days for summary in summaries),
+        "longest_active_streak": reportable_streak(stitch_longest_streak(summaries, "active")),
+        "perfect_days": sum(summary.perfect_days for summary in summaries),
+        "longest_perfect_streak": reportable_streak(stitch_longest_streak(summaries, "perfect")),
+        "total_completed": f"{float(sum(summary.total_completed for summary in summaries))} {summaries[0].goal_unit}"
+    }
+    return response
+
+def get_current_streak(log_dates: Set[date], today: date, window_start: date,
+                       summaries_by_month: Dict[Tuple[int, int], HabitMonthlySummaries]) -> int:
+    """
+    Returns the length of the active streak that ends today, or yesterday when today hasn't been logged yet
+    :param log_dates: dates of the logs from window_start to today
+    :param window_start: first day of the month the log dates start from
+    :param summaries_by_month: monthly summaries of the habit by (year, month), used to extend the streak past
+    window_start one month at a time
+    """
+    current_date = today if today in log_dates else today - timedelta(days=1)
+    current_streak = 0
+    while current_date >= window_start and current_date in log_dates:
+        current_streak += 1
+        current_date -= timedelta(days=1)
+    if current_date >= window_start:
+        return current_streak
+
+    # the streak goes on before the window, current_date is now the last day of a month
+    while True:
+        summary = summaries_by_month.get((current_date.year, current_date.month))
+        if summary is None:
+            return current_streak
+        current_streak += summary.trailing_active_streak
+        if summary.trailing_active_streak < current_date.day:
+            return current_streak
+        current_date = current_date.replace(day=1) - timedelta(days=1)
+
+def build_user_summary(user_id: int, today: date, session: Session) -> Dict:
+    """
+    Builds the dashboard summary of every habit of a user with a fixed number of queries: the habits, their monthly
+    summary rows for the longest streaks, and the logs of a short recent window for the current streaks, the completion
+    rates and the progress of the week
+    :param user_id: ID of the user
+    :param today: date the summary is built for
+    :param session: current DB session
+    """
+    habits = session.exec(select(Habits)
+                          .where(Habits.user_fk == user_id)
+                          .where(Habits.is_archived == False)
+                          .order_by(Habits.display_order.desc())).all()
+    response = {"date": today, "completion_rate_days": COMPLETION_RATE_DAYS, "habits": []}
+    if not habits:
+        return response
+    habit_ids = [habit.id for habit in habits]
+
+    summaries_statement = (
+        select(HabitMonthlySummaries)
+        .where(HabitMonthlySummaries.habit_fk.in_(habit_ids))
+        .order_by(HabitMonthlySummaries.habit_fk, HabitMonthlySummaries.year, HabitMonthlySummaries.month)
+    )
+    summaries_by_habit: Dict[int, List[HabitMonthlySummaries]] = {habit_id: [] for habit_id in habit_ids}
+    for summary in session.exec(summaries_statement):
+        summaries_by_habit[summary.habit_fk].append(summary)
+
+    rate_start = today - timedelta(days=COMPLETION_RATE_DAYS - 1)
+    week_start, week_end = get_week_bounds(today)
+    window_start = min(rate_start, week_start).replace(day=1)
+    logs = get_habit_logs_entity(window_start)
+    window_logs_statement = (
+        select(logs.habit_fk, logs.log_date, logs.completion_percentage)
+        .where(logs.habit_fk.in_(habit_ids))
+        .where(logs.log_date >= window_start)
+        .where(logs.log_date <= today)
+    )
+    window_logs_by_habit: Dict[int, list] = {habit_id: [] for habit_id in habit_ids}
+    for log in session.exec(window_logs_statement):
+        window_logs_by_habit[log.habit_fk].append(log)
+
+    for habit in habits:
+        summaries = summaries_by_habit[habit.id]
+        window_logs = window_logs_by_habit[habit.id]
+        current_streak = get_current_streak(
+            {log.log_date for log in window_logs}, today, window_start,
+            {(summary.year, summary.month): summary for summary in summaries})
+
+        expected_completions = get_expected_completions(habit, rate_start, today)
+        completed = sum(log.completion_percentage for log in window_logs if log.log_date >= rate_start) / 100
+        completion_rate = round(min(completed / expected_completions, 1), 4) if expected_completions else None
+
+        response["habits"].append({
+            "habit_id": habit.id,
+            "name": habit.name,
+            "current_streak": current_streak,
+            "longest_streak": max(stitch_longest_streak(summaries, "active"), current_streak),
+            "completion_rate": completion_rate,
+            "completed_this_week": sum(1 for log in window_logs
+                                       if log.log_date >= week_start and log.completion_percentage == 100),
+            "target_this_week": round(get_expected_completions(habit, week_start, week_end - timedelta(days=1)), 2),
+        })
+    return response
@@ -0,0 +1,197 @@
+import logging
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# statements kept per request for the slow-request log
+MAX_LOGGED_STATEMENTS = 50
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Database work of the request being served, filled by the engine event hooks
+    """
+    collect_statements: bool = False
+    queries: int = 0
+    db_seconds: float = 0.0
+    rows: int = 0
+    # (statement, seconds) of the first MAX_LOGGED_STATEMENTS queries, only collected for the slow-request log
+    statements: List[Tuple[str, float]] = field(default_factory=list)
+
+
+# metrics of the request being served, the threadpool workers of the sync endpoints inherit the context of the request
+current_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request_metrics", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # the last count is the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+@dataclass
+class RouteMetrics:
+    latency: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+    queries: Histogram = field(default_factory=lambda: Histogram(QUERY_COUNT_BUCKETS))
+    db_seconds: float = 0.0
+    rows: int = 0
+    requests_by_status: Dict[int, int] = field(default_factory=dict)
+
+
+class MetricsRegistry:
+    """
+    Per-route request metrics of this worker, rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+
+    def record(self, method: str, route: str, status_code: int, seconds: float, request_metrics: RequestMetrics):
+        with self._lock:
+            route_metrics = self._routes.get((method, route))
+            if route_metrics is None:
+                route_metrics = self._routes[(method, route)] = RouteMetrics()
+            route_metrics.latency.observe(seconds)
+            route_metrics.queries.observe(request_metrics.queries)
+            route_metrics.db_seconds += request_metrics.db_seconds
+            route_metrics.rows += request_metrics.rows
+            route_metrics.requests_by_status[status_code] = route_metrics.requests_by_status.get(status_code, 0) + 1
+
+    def render(self) -> str:
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP http_requests_total Requests served, by route template and status code",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route), route_metrics in routes:
+                for status_code, count in sorted(route_metrics.requests_by_status.items()):
+                    lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status_code}"}} {count}')
+
+            lines += ["# HELP http_request_duration_seconds Request latency, by route template",
+                      "# TYPE http_request_duration_seconds histogram"]
+            for (method, route), route_metrics in routes:
+                lines += render_histogram("http_request_duration_seconds", f'method="{method}",route="{route}"',
+                                          route_metrics.latency)
+
+            lines += ["# HELP db_queries_per_request SQL statements executed per request, by route template",
+                      "# TYPE db_queries_per_request histogram"]
+            for (method, route), route_metrics in routes:
+                lines += render_histogram("db_queries_per_request", f'method="{method}",route="{route}"',
+                                          route_metrics.queries)
+
+            lines += ["# HELP db_query_seconds_total Time spent executing SQL statements, by route template",
+                      "# TYPE db_query_seconds_total counter"]
+            lines += [f'db_query_seconds_total{{method="{method}",route="{route}"}} {route_metrics.db_seconds}'
+                      for (method, route), route_metrics in routes]
+
+            lines += ["# HELP db_rows_total Rows returned or affected as reported by the driver, by route template",
+                      "# TYPE db_rows_total counter"]
+            lines += [f'db_rows_total{{method="{method}",route="{route}"}} {route_metrics.rows}'
+                      for (method, route), route_metrics in routes]
+        return "\n".join(lines) + "\n"
+
+
+def render_histogram(name: str, labels: str, histogram: Histogram) -> List[str]:
+    lines = []
+    cumulative_count = 0
+    for bucket, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+        cumulative_count += count
+        lines.append(f'{name}_bucket{{{labels},le="{bucket}"}} {cumulative_count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+    lines.append(f"{name}_count{{{labels}}} {cumulative_count}")
+    return lines
+
+
+def attach_query_metrics(engine: Engine):
+    """
+    Adds the executed statements of an engine to the metrics of the request being served, if any
+    """
+    def on_before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        if current_request_metrics.get() is not None:
+            connection.info.setdefault("query_started_at", []).append(perf_counter())
+
+    def on_after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        request_metrics = current_request_metrics.get()
+        if request_metrics is None or not connection.info.get("query_started_at"):
+            return
+        seconds = perf_counter() - connection.info["query_started_at"].pop()
+        request_metrics.queries += 1
+        request_metrics.db_seconds += seconds
+        if cursor.rowcount > 0:
+            request_metrics.rows += cursor.rowcount
+        if request_metrics.collect_statements and len(request_metrics.statements) < MAX_LOGGED_STATEMENTS:
+            request_metrics.statements.append((statement, seconds))
+
+    event.listen(engine, "before_cursor_execute", on_before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", on_after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records the latency and the database work of every request by route template, and logs the
+    statements of the requests slower than slow_request_seconds
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, slow_request_seconds: Optional[float] = None):
+        self.app = app
+        self.registry = registry
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_metrics = RequestMetrics(collect_statements=self.slow_request_seconds is not None)
+        token = current_request_metrics.set(request_metrics)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = perf_counter() - started_at
+            current_request_metrics.reset(token)
+            # the router stores the matched route in the scope, its path is the template, e.g. /habits/{habit_id}
+            route = scope.get("route")
+            route_template = route.path if route is not None else "unmatched"
+            self.registry.record(scope["method"], route_template, status_code, seconds, request_metrics)
+            if self.slow_request_seconds is not None and seconds >= self.slow_request_seconds:
+                log_slow_request(scope, route_template, status_code, seconds, request_metrics)
+
+
+def log_slow_request(scope, route_template: str, status_code: int, seconds: float, request_metrics: RequestMetrics):
+    statements = "\n".join(f"  {statement_seconds * 1000:.1f} ms: {' '.join(statement.split())}"
+                           for statement, statement_seconds in request_metrics.statements)
+    logger.warning("Slow request %s %s (%s) returned %s in %.1f ms with %s queries taking %.1f ms:\n%s",
+                   scope["method"], scope["path"], route_template, status_code, seconds * 1000,
+                   request_metrics.queries, request_metrics.db_seconds * 1000, statements)
+
+
+metrics_registry = MetricsRegistry()
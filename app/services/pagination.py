@@ -0,0 +1,108 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Annotated, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlmodel import Session, and_, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# response header that carries the cursor of the next page, it's missing on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+PageLimit = Annotated[Optional[int], Query(ge=1, le=MAX_PAGE_SIZE)]
+
+
+def encode_cursor(values: Sequence) -> str:
+    """
+    Encodes the ordering values of the last item of a page into an opaque cursor
+    """
+    serialized_values = json.dumps([value.isoformat() if isinstance(value, (date, datetime)) else value
+                                    for value in values])
+    return base64.urlsafe_b64encode(serialized_values.encode()).decode()
+
+def decode_cursor(cursor: str, order_columns: Sequence) -> List:
+    """
+    Decodes a cursor back into the ordering values of the last item of the previous page
+    :raises ValueError: if the cursor is malformed or doesn't match the ordering columns
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(order_columns):
+        raise ValueError("Invalid cursor")
+
+    decoded_values = []
+    for column, value in zip(order_columns, values):
+        python_type = column.type.python_type
+        if python_type in (date, datetime) and isinstance(value, str):
+            decoded_values.append(python_type.fromisoformat(value))
+        elif value is None or isinstance(value, python_type):
+            decoded_values.append(value)
+        else:
+            raise ValueError("Invalid cursor")
+    return decoded_values
+
+def build_keyset_filter(order_columns: Sequence, values: Sequence, descending: bool):
+    """
+    Returns a WHERE clause that selects the items after the given ordering values, expanded as
+    (a > x) OR (a = x AND b > y) so that the database can seek on the matching composite index
+    """
+    conditions = []
+    for position, (column, value) in enumerate(zip(order_columns, values)):
+        equal_prefix = [order_columns[index] == values[index] for index in range(position)]
+        comparison = column < value if descending else column > value
+        conditions.append(and_(*equal_prefix, comparison))
+    return or_(*conditions)
+
+def paginate(statement, order_columns: Sequence, session: Session, limit: Optional[int] = None,
+             cursor: Optional[str] = None, descending: bool = False) -> Tuple[List, Optional[str]]:
+    """
+    Runs a select of ORM entities with keyset pagination, so that every page costs the same however deep it is
+    :param statement: select without an ORDER BY
+    :param order_columns: columns that uniquely order the items, backed by a matching index
+    :param session: current DB session
+    :param limit: max number of items to return, all of them when None
+    :param cursor: cursor returned with the previous page
+    :param descending: whether the items are ordered in descending order
+    :return: tuple of the items of the page and the cursor of the next page, None on the last page
+    :raises ValueError: if the cursor is invalid
+    """
+    if cursor:
+        statement = statement.where(build_keyset_filter(order_columns, decode_cursor(cursor, order_columns),
+                                                        descending))
+    statement = statement.order_by(*[column.desc() if descending else column for column in order_columns])
+    if limit is None:
+        return session.exec(statement).all(), None
+
+    items = session.exec(statement.limit(limit + 1)).all()
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor([getattr(items[-1], column.key) for column in order_columns])
+
+def fetch_page(statement, order_columns: Sequence, session: Session, limit: Optional[int] = None,
+               cursor: Optional[str] = None, descending: bool = False) -> Tuple[List, Optional[str]]:
+    """
+    Same as paginate, but rejects invalid cursors with a 400
+    """
+    try:
+        return paginate(statement, order_columns, session, limit, cursor, descending)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+def set_next_cursor_header(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+def paginate_into_response(statement, order_columns: Sequence, session: Session, response: Response,
+                           limit: Optional[int] = None, cursor: Optional[str] = None,
+                           descending: bool = False) -> List:
+    """
+    Same as fetch_page, but sets the cursor of the next page in the NEXT_CURSOR_HEADER of the response
+    """
+    items, next_cursor = fetch_page(statement, order_columns, session, limit, cursor, descending)
+    set_next_cursor_header(response, next_cursor)
+    return items
@@ -0,0 +1,38 @@
+from datetime import date, timedelta
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select, func, desc
+
+from ..enums.statistics_bucket_enum import StatisticsBucket
+from ..models.models import Habits, Categories, HabitLogs
+from .habit_schedule import build_calendar_rule_filter
+from .habit_statistics import build_habit_statistics
+from .habit_summaries import build_yearly_summary, build_user_summary
+from .pagination import paginate, DEFAULT_PAGE_SIZE
+
+# ID that no row has, the hot queries are run for it only to compile and cache their SQL
+MISSING_ID = -1
+
+
+def precompile_hot_statements(engine: Engine):
+    """
+    Runs the queries of the hot read routes once, so that the engine's compiled cache already holds their SQL when the
+    first requests come in. The statements are cached by structure, so running them for a missing ID is enough.
+    """
+    today = date.today()
+    with Session(engine) as session:
+        # ETag validators
+        session.exec(select(func.max(Habits.updated_at), func.count()).where(Habits.user_fk == MISSING_ID)).one()
+        session.exec(select(func.max(Categories.updated_at), func.count()).where(Categories.user_fk == MISSING_ID)).one()
+        session.exec(select(func.max(HabitLogs.updated_at), func.count()).where(HabitLogs.habit_fk == MISSING_ID)).one()
+        # habit lists and schedules
+        paginate(select(Habits).where(Habits.user_fk == MISSING_ID), [Habits.display_order, Habits.id], session,
+                 DEFAULT_PAGE_SIZE, descending=True)
+        session.exec(select(Habits)
+                     .where(Habits.user_fk == MISSING_ID)
+                     .where(build_calendar_rule_filter(today))
+                     .order_by(desc(Habits.display_order))).all()
+        # summaries and statistics
+        build_yearly_summary(MISSING_ID, today.year, session)
+        build_user_summary(MISSING_ID, today, session)
+        build_habit_statistics(MISSING_ID, today - timedelta(days=364), today, StatisticsBucket.MONTH, session)
@@ -0,0 +1,138 @@
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel, Session, select, func
+
+from app.enums.repeat_type_enum import RepeatType
+from app.models.models import Users, Habits, Categories, HabitsCategoriesLink, HabitLogs
+from app.services.habit_schedule import compile_repeat_rule
+from app.services.habit_summaries import rebuild_monthly_summaries
+
+# repeat configs of the generated habits, with the chance of a log on any given day
+REPEAT_RULES = (
+    (RepeatType.DAILY.value, None, 0.8),
+    (RepeatType.SPECIFIC_WEEKDAYS.value, "monday,wednesday,friday", 0.4),
+    (RepeatType.SPECIFIC_WEEKDAYS.value, "saturday,sunday", 0.25),
+    (RepeatType.SPECIFIC_MONTH_DAYS.value, "1,15", 0.06),
+    (RepeatType.N_TIMES_PER_WEEK.value, "3", 0.4),
+    (RepeatType.N_TIMES_PER_MONTH.value, "10", 0.3),
+    (RepeatType.EVERY_N_DAYS.value, "2", 0.45),
+    (RepeatType.EVERY_N_DAYS.value, "7", 0.14),
+)
+CATEGORIES_PER_USER = 8
+ARCHIVED_HABIT_RATIO = 0.1
+INSERT_BATCH_SIZE = 5000
+
+
+@dataclass
+class Dataset:
+    """
+    IDs of the generated rows, used by the benchmarks to pick their parameters
+    """
+    user_ids: List[int] = field(default_factory=list)
+    habit_ids_by_user: Dict[int, List[int]] = field(default_factory=dict)
+    first_log_date: date = None
+    last_log_date: date = None
+    log_count: int = 0
+
+
+def insert_in_batches(session: Session, model, rows: List[Dict]):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        session.execute(insert(model), rows[start:start + INSERT_BATCH_SIZE])
+
+def generate_dataset(engine: Engine, users: int = 3, habits_per_user: int = 200, years: int = 2,
+                     end_date: date = None, seed: int = 42) -> Dataset:
+    """
+    Fills an empty database with realistic users: habits of every repeat type, categories, and years of daily logs
+    with partial and perfect completions. The monthly summaries are rebuilt from the generated logs.
+    :param engine: engine of a disposable database, its tables are created if missing
+    :param users: number of users
+    :param habits_per_user: number of habits of every user
+    :param years: number of years of logs, ending on end_date
+    :param end_date: last date with logs, today by default
+    :param seed: seed of the random generator, the same seed generates the same dataset
+    """
+    randomizer = random.Random(seed)
+    end_date = end_date or date.today()
+    start_date = end_date.replace(year=end_date.year - years)
+    now = datetime.now()
+    SQLModel.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        if session.exec(select(func.count(Users.id))).one():
+            raise ValueError("The database already has users, generate the dataset into an empty database")
+
+        dataset = Dataset(first_log_date=start_date, last_log_date=end_date)
+        user_rows, category_rows, habit_rows, link_rows, log_rows = [], [], [], [], []
+        habit_id = 0
+        for user_id in range(1, users + 1):
+            dataset.user_ids.append(user_id)
+            user_rows.append({"id": user_id, "email": f"user{user_id}@example.com", "password_hash": "x",
+                              "created_at": now, "updated_at": now})
+            category_ids = [(user_id - 1) * CATEGORIES_PER_USER + index for index in range(1, CATEGORIES_PER_USER + 1)]
+            category_rows.extend({"id": category_id, "name": f"category {category_id}", "user_fk": user_id,
+                                  "created_at": now, "updated_at": now} for category_id in category_ids)
+
+            habit_ids = dataset.habit_ids_by_user.setdefault(user_id, [])
+            for display_order in range(1, habits_per_user + 1):
+                habit_id += 1
+                habit_ids.append(habit_id)
+                repeat_type, repeat_config, log_chance = REPEAT_RULES[habit_id % len(REPEAT_RULES)]
+                weekday_mask, month_day_mask, repeat_n = compile_repeat_rule(repeat_type, repeat_config)
+                habit_start_date = start_date + timedelta(days=randomizer.randrange(0, 180))
+                habit_rows.append({
+                    "id": habit_id, "name": f"habit {habit_id}", "is_bad_habit": False, "repeat_type": repeat_type,
+                    "repeat_config": repeat_config, "weekday_mask": weekday_mask, "month_day_mask": month_day_mask,
+                    "repeat_n": repeat_n, "is_archived": randomizer.random() < ARCHIVED_HABIT_RATIO,
+                    "is_check_only": False, "start_date": datetime.combine(habit_start_date, datetime.min.time()),
+                    "display_order": display_order, "goal_value": 30, "goal_unit": "minutes", "goal_is_time": True,
+                    "user_fk": user_id, "created_at": now, "updated_at": now,
+                })
+                link_rows.extend({"habit_fk": habit_id, "category_fk": category_id, "created_at": now,
+                                  "updated_at": now}
+                                 for category_id in randomizer.sample(category_ids, randomizer.randint(0, 3)))
+
+                log_date = habit_start_date
+                while log_date <= end_date:
+                    if randomizer.random() < log_chance:
+                        completion_percentage = randomizer.choice((100, 100, 100, 75, 50, 25))
+                        log_rows.append({
+                            "habit_fk": habit_id, "log_date": log_date, "progress_value": 30 * completion_percentage / 100,
+                            "note": "", "goal_value": 30, "goal_unit": "minutes",
+                            "completion_percentage": completion_percentage, "created_at": now, "updated_at": now,
+                        })
+                    log_date += timedelta(days=1)
+
+        insert_in_batches(session, Users, user_rows)
+        insert_in_batches(session, Categories, category_rows)
+        insert_in_batches(session, Habits, habit_rows)
+        insert_in_batches(session, HabitsCategoriesLink, link_rows)
+        insert_in_batches(session, HabitLogs, log_rows)
+        session.commit()
+        dataset.log_count = len(log_rows)
+
+        all_habit_ids = [habit_id for habit_ids in dataset.habit_ids_by_user.values() for habit_id in habit_ids]
+        for start in range(0, len(all_habit_ids), 100):
+            rebuild_monthly_summaries(all_habit_ids[start:start + 100], session)
+            session.commit()
+
+    return dataset
+
+def load_dataset(engine: Engine) -> Dataset:
+    """
+    Reads the IDs and log date range of a dataset generated earlier
+    """
+    with Session(engine) as session:
+        dataset = Dataset()
+        for habit_id, user_id in session.exec(select(Habits.id, Habits.user_fk).order_by(Habits.id)):
+            dataset.habit_ids_by_user.setdefault(user_id, []).append(habit_id)
+        dataset.user_ids = sorted(dataset.habit_ids_by_user)
+        dataset.first_log_date, dataset.last_log_date, dataset.log_count = session.exec(
+            select(func.min(HabitLogs.log_date), func.max(HabitLogs.log_date), func.count(HabitLogs.id))).one()
+    if not dataset.user_ids:
+        raise ValueError("The database is empty, generate a dataset first")
+    return dataset
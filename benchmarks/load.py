@@ -0,0 +1,148 @@
+import asyncio
+import random
+import statistics
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .data_generator import Dataset
+
+# (method, path, params, json body) of a request
+RequestSpec = Tuple[str, str, Optional[Dict], Optional[Dict]]
+
+# query counter of the request being sent, the ASGI app runs in the context of the task that sends it and the
+# threadpool workers of the sync endpoints inherit that context
+current_query_counter: ContextVar[Optional[List[int]]] = ContextVar("current_query_counter", default=None)
+
+
+@dataclass
+class Scenario:
+    name: str
+    # builds a request from a random generator and the dataset
+    build_request: Callable[[random.Random, Dataset], RequestSpec]
+
+
+def random_date(randomizer: random.Random, dataset: Dataset, min_days_back: int = 0) -> date:
+    days = (dataset.last_log_date - dataset.first_log_date).days
+    return dataset.last_log_date - timedelta(days=randomizer.randint(min_days_back, max(days, min_days_back)))
+
+def random_user_and_habit(randomizer: random.Random, dataset: Dataset) -> Tuple[int, int]:
+    user_id = randomizer.choice(dataset.user_ids)
+    return user_id, randomizer.choice(dataset.habit_ids_by_user[user_id])
+
+def build_habits_for_date_request(randomizer: random.Random, dataset: Dataset) -> RequestSpec:
+    given_date = random_date(randomizer, dataset)
+    return "GET", f"/users/{randomizer.choice(dataset.user_ids)}/habits-for-date", \
+        {"param_date": f"{given_date.isoformat()}T00:00:00"}, None
+
+def build_habits_for_week_request(randomizer: random.Random, dataset: Dataset) -> RequestSpec:
+    start_date = random_date(randomizer, dataset, min_days_back=6)
+    return "GET", f"/users/{randomizer.choice(dataset.user_ids)}/habits-for-date-range", \
+        {"start_date": start_date.isoformat(), "end_date": (start_date + timedelta(days=6)).isoformat()}, None
+
+def build_user_habits_request(randomizer: random.Random, dataset: Dataset) -> RequestSpec:
+    return "GET", f"/users/{randomizer.choice(dataset.user_ids)}/habits", {"include_categories": "true"}, None
+
+def build_yearly_summary_request(randomizer: random.Random, dataset: Dataset) -> RequestSpec:
+    _, habit_id = random_user_and_habit(randomizer, dataset)
+    year = randomizer.randint(dataset.first_log_date.year, dataset.last_log_date.year)
+    return "GET", f"/habits/{habit_id}/year/{year}", None, None
+
+def build_statistics_request(randomizer: random.Random, dataset: Dataset) -> RequestSpec:
+    _, habit_id = random_user_and_habit(randomizer, dataset)
+    return "GET", f"/habits/{habit_id}/statistics", \
+        {"days": 365, "end_date": dataset.last_log_date.isoformat(), "bucket": "week"}, None
+
+def build_user_summary_request(randomizer: random.Random, dataset: Dataset) -> RequestSpec:
+    return "GET", f"/users/{randomizer.choice(dataset.user_ids)}/summary", \
+        {"param_date": random_date(randomizer, dataset).isoformat()}, None
+
+def build_upsert_log_request(randomizer: random.Random, dataset: Dataset) -> RequestSpec:
+    _, habit_id = random_user_and_habit(randomizer, dataset)
+    completion_percentage = randomizer.choice((100, 50))
+    return "PUT", f"/habits/{habit_id}/logs/{random_date(randomizer, dataset).isoformat()}", None, \
+        {"progress_value": 30 * completion_percentage / 100, "note": "", "goal_value": 30, "goal_unit": "minutes",
+         "completion_percentage": completion_percentage}
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario("habits_for_date", build_habits_for_date_request),
+    Scenario("habits_for_week", build_habits_for_week_request),
+    Scenario("user_habits_with_categories", build_user_habits_request),
+    Scenario("yearly_summary", build_yearly_summary_request),
+    Scenario("statistics_365_days", build_statistics_request),
+    Scenario("user_summary", build_user_summary_request),
+    Scenario("upsert_log", build_upsert_log_request),
+)}
+
+
+def count_queries(engine: Engine):
+    """
+    Counts the statements executed on the engine for the request being sent
+    """
+    def on_before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        query_counter = current_query_counter.get()
+        if query_counter is not None:
+            query_counter[0] += 1
+
+    event.listen(engine, "before_cursor_execute", on_before_cursor_execute)
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+async def run_scenario(app, dataset: Dataset, scenario: Scenario, requests: int, concurrency: int,
+                       seed: int) -> Dict:
+    """
+    Sends requests through the ASGI app, without a server or network in between, from concurrent workers
+    :return: latency percentiles in milliseconds, throughput, queries per request and error count
+    """
+    randomizer = random.Random(seed)
+    request_specs = [scenario.build_request(randomizer, dataset) for _ in range(requests)]
+    latencies = []
+    query_counts = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        async def send(request_spec: RequestSpec):
+            nonlocal errors
+            method, path, params, body = request_spec
+            query_counter = [0]
+            current_query_counter.set(query_counter)
+            started_at = perf_counter()
+            response = await client.request(method, path, params=params, json=body)
+            latencies.append((perf_counter() - started_at) * 1000)
+            query_counts.append(query_counter[0])
+            if response.status_code >= 400:
+                errors += 1
+
+        async def worker(worker_index: int):
+            for request_spec in request_specs[worker_index::concurrency]:
+                await send(request_spec)
+
+        # warm up the pool and the caches of the database
+        await send(request_specs[0])
+        latencies.clear()
+        query_counts.clear()
+        errors = 0
+
+        started_at = perf_counter()
+        await asyncio.gather(*[worker(worker_index) for worker_index in range(concurrency)])
+        elapsed = perf_counter() - started_at
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "queries_per_request": round(statistics.fmean(query_counts), 2),
+        "errors": errors,
+    }
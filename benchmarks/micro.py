@@ -0,0 +1,112 @@
+import random
+import statistics
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from time import perf_counter
+from typing import Callable, Dict
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from app.models.models import Habits, HabitMonthlySummaries
+from app.services.habit_schedule import compile_repeat_rule, is_habit_due, get_expected_completions, \
+    get_habit_ids_due_on_date, get_habit_ids_due_in_date_range, HabitLogFacts
+from app.services.habit_summaries import get_longest_streak, stitch_longest_streak, summarize_month, \
+    build_yearly_summary, build_user_summary
+from .data_generator import Dataset, REPEAT_RULES
+
+# row shape of the log columns read by summarize_month
+MonthLog = namedtuple("MonthLog", ["log_date", "completion_percentage", "progress_value", "goal_unit"])
+
+
+def measure(function: Callable, repeat: int = 7, number: int = 0, min_duration: float = 0.2) -> Dict:
+    """
+    Times a function like timeit: every round calls it number times, calibrated to last at least min_duration
+    when number is 0, and the per-call times of the rounds are reported in microseconds
+    """
+    if not number:
+        number = 1
+        while True:
+            started_at = perf_counter()
+            for _ in range(number):
+                function()
+            if perf_counter() - started_at >= min_duration or number >= 1_000_000:
+                break
+            number *= 10
+
+    per_call_times = []
+    for _ in range(repeat):
+        started_at = perf_counter()
+        for _ in range(number):
+            function()
+        per_call_times.append((perf_counter() - started_at) / number * 1_000_000)
+    return {
+        "median_us": round(statistics.median(per_call_times), 3),
+        "min_us": round(min(per_call_times), 3),
+        "calls_per_round": number,
+    }
+
+def run_pure_benchmarks(seed: int = 42) -> Dict[str, Dict]:
+    """
+    Benchmarks the streak and recurrence helpers on in-memory data
+    """
+    randomizer = random.Random(seed)
+    end_date = date(2025, 12, 31)
+    three_years = [end_date - timedelta(days=offset) for offset in range(3 * 365)][::-1]
+    logged_dates = [logged_date for logged_date in three_years if randomizer.random() < 0.7]
+
+    month_logs = [MonthLog(date(2025, 3, day), randomizer.choice((100, 50)), 10.0, "minutes")
+                  for day in range(1, 32) if randomizer.random() < 0.7]
+    logs_by_month = {}
+    for logged_date in logged_dates:
+        logs_by_month.setdefault(logged_date.replace(day=1), []).append(MonthLog(logged_date, 100, 1.0, "minutes"))
+    summaries = [summarize_month(1, month_start.year, month_start.month, logs)
+                 for month_start, logs in logs_by_month.items()]
+
+    habits = []
+    for habit_id, (repeat_type, repeat_config, _) in enumerate(REPEAT_RULES, 1):
+        weekday_mask, month_day_mask, repeat_n = compile_repeat_rule(repeat_type, repeat_config)
+        habits.append(Habits(id=habit_id, name="habit", is_bad_habit=False, repeat_type=repeat_type,
+                             repeat_config=repeat_config, weekday_mask=weekday_mask, month_day_mask=month_day_mask,
+                             repeat_n=repeat_n, is_archived=False, is_check_only=False,
+                             start_date=datetime(2023, 1, 1), display_order=habit_id, goal_is_time=False, user_fk=1))
+    facts = HabitLogFacts(week_log_count=1, month_log_count=4, latest_log_date=end_date - timedelta(days=3))
+    one_year = three_years[-365:]
+
+    return {
+        "get_longest_streak_3_years": measure(lambda: get_longest_streak(logged_dates)),
+        "stitch_longest_streak_36_months": measure(lambda: stitch_longest_streak(summaries, "active")),
+        "summarize_month": measure(lambda: summarize_month(1, 2025, 3, month_logs)),
+        "compile_repeat_rule_all_types": measure(
+            lambda: [compile_repeat_rule(repeat_type, repeat_config) for repeat_type, repeat_config, _ in REPEAT_RULES]),
+        "is_habit_due_all_types_1_year": measure(
+            lambda: [is_habit_due(habit, given_date, facts) for habit in habits for given_date in one_year]),
+        "get_expected_completions_all_types_30_days": measure(
+            lambda: [get_expected_completions(habit, end_date - timedelta(days=29), end_date) for habit in habits]),
+    }
+
+def run_database_benchmarks(engine: Engine, dataset: Dataset) -> Dict[str, Dict]:
+    """
+    Benchmarks the service functions that query the database, on the first user of a generated dataset
+    """
+    user_id = dataset.user_ids[0]
+    given_date = dataset.last_log_date
+    with Session(engine) as session:
+        habits = session.exec(select(Habits).where(Habits.user_fk == user_id)).all()
+        habit_id = session.exec(
+            select(HabitMonthlySummaries.habit_fk)
+            .where(HabitMonthlySummaries.habit_fk.in_([habit.id for habit in habits]))
+            .group_by(HabitMonthlySummaries.habit_fk)
+            .order_by(HabitMonthlySummaries.habit_fk)
+        ).first()
+
+        return {
+            "get_habit_ids_due_on_date": measure(lambda: get_habit_ids_due_on_date(habits, given_date, session),
+                                                 repeat=5),
+            "get_habit_ids_due_in_date_range_31_days": measure(
+                lambda: get_habit_ids_due_in_date_range(habits, given_date - timedelta(days=30), given_date, session),
+                repeat=5),
+            "build_yearly_summary": measure(lambda: build_yearly_summary(habit_id, given_date.year, session),
+                                            repeat=5),
+            "build_user_summary": measure(lambda: build_user_summary(user_id, given_date, session), repeat=5),
+        }
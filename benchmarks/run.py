@@ -0,0 +1,127 @@
+"""
+Benchmark suite of the API, run against SQLite or a disposable MySQL database with:
+
+    DB_URL=sqlite:////tmp/better_habits_benchmark.db python -m benchmarks.run generate
+    DB_URL=sqlite:////tmp/better_habits_benchmark.db python -m benchmarks.run micro
+    DB_URL=sqlite:////tmp/better_habits_benchmark.db python -m benchmarks.run load --compare
+
+The other DB_* settings still have to be set, as for the app. Results are compared with benchmarks/baseline.json,
+which is only meaningful on the machine and database it was recorded with: record a new one with --save-baseline
+before making a change, then compare after it. Set CACHE_ENABLED=false to measure the uncached endpoints.
+"""
+import asyncio
+import json
+import platform
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+
+from app.config import get_settings
+from app.db.database import get_database
+from .data_generator import generate_dataset, load_dataset
+from .load import SCENARIOS, count_queries, run_scenario
+from .micro import run_pure_benchmarks, run_database_benchmarks
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+# metrics where a lower value is better, the others are better when higher
+LOWER_IS_BETTER = ("median_us", "min_us", "p50_ms", "p99_ms", "mean_ms", "queries_per_request", "errors")
+COMPARED_METRICS = ("median_us", "p50_ms", "p99_ms", "throughput_rps", "queries_per_request")
+
+cli = typer.Typer()
+
+
+@cli.callback()
+def main():
+    """
+    Better Habits benchmarks
+    """
+
+
+def read_baseline() -> Dict:
+    if not BASELINE_PATH.exists():
+        return {}
+    return json.loads(BASELINE_PATH.read_text())
+
+def save_baseline(suite: str, results: Dict):
+    baseline = read_baseline()
+    baseline[suite] = results
+    baseline["environment"] = {
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "database": get_database().engine.dialect.name,
+        "cache_enabled": get_settings().cache_enabled,
+    }
+    BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+    typer.echo(f"Saved the {suite} results to {BASELINE_PATH}")
+
+def print_results(suite: str, results: Dict, compare: bool):
+    baseline_results = read_baseline().get(suite, {}) if compare else {}
+    for name, metrics in results.items():
+        columns = []
+        for metric in COMPARED_METRICS:
+            if metric not in metrics:
+                continue
+            column = f"{metric}={metrics[metric]}"
+            baseline_value = baseline_results.get(name, {}).get(metric)
+            if baseline_value:
+                change = (metrics[metric] - baseline_value) / baseline_value * 100
+                is_worse = change > 0 if metric in LOWER_IS_BETTER else change < 0
+                column += f" ({change:+.1f}%{' worse' if is_worse and abs(change) >= 5 else ''})"
+            columns.append(column)
+        if metrics.get("errors"):
+            columns.append(f"errors={metrics['errors']}")
+        typer.echo(f"{name:45} {'  '.join(columns)}")
+
+
+@cli.command()
+def generate(users: int = 3, habits_per_user: int = 200, years: int = 2, seed: int = 42):
+    """
+    Fills the empty database of the settings with a synthetic dataset
+    """
+    dataset = generate_dataset(get_database().engine, users, habits_per_user, years, seed=seed)
+    typer.echo(f"Generated {len(dataset.user_ids)} users, {users * habits_per_user} habits and "
+               f"{dataset.log_count} habit logs from {dataset.first_log_date} to {dataset.last_log_date}")
+
+
+@cli.command()
+def micro(compare: bool = True, save: bool = typer.Option(False, "--save-baseline")):
+    """
+    Runs the micro-benchmarks of the streak and recurrence helpers, and of the services that query the database
+    """
+    results = run_pure_benchmarks()
+    results.update(run_database_benchmarks(get_database().engine, load_dataset(get_database().engine)))
+    print_results("micro", results, compare)
+    if save:
+        save_baseline("micro", results)
+
+
+@cli.command()
+def load(scenarios: Optional[List[str]] = typer.Option(None, "--scenario"), requests: int = 300,
+         concurrency: int = 8, seed: int = 42, compare: bool = True,
+         save: bool = typer.Option(False, "--save-baseline")):
+    """
+    Runs HTTP load scenarios through the ASGI app and reports latency percentiles, throughput and queries per request
+    """
+    from main import create_app
+    app = create_app()
+
+    unknown_scenarios = set(scenarios or []) - SCENARIOS.keys()
+    if unknown_scenarios:
+        raise typer.BadParameter(f"Unknown scenarios: {sorted(unknown_scenarios)}, pick from {sorted(SCENARIOS)}")
+
+    engine = get_database().engine
+    dataset = load_dataset(engine)
+    count_queries(engine)
+    results = {}
+    for name in scenarios or SCENARIOS:
+        results[name] = asyncio.run(run_scenario(app, dataset, SCENARIOS[name], requests, concurrency, seed))
+    print_results("load", results, compare)
+    if save:
+        save_baseline("load", results)
+
+
+if __name__ == "__main__":
+    cli()
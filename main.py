@@ -1,15 +1,93 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
 from fastapi import FastAPI
-from app.routers import habits, categories, habit_logs
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from app.config import Settings, get_settings
+from app.db.database import init_database, close_database, Database
+from app.routers import habits, categories, habit_logs, changes, internal
+from app.services.cache import response_cache, create_cache_backend
+from app.services.change_feed import change_feed, create_change_feed_backend
+from app.services.habit_log_buffer import habit_log_buffer
+from app.services.metrics import MetricsMiddleware, metrics_registry
+from app.services.warm_up import precompile_hot_statements
+
+logger = logging.getLogger(__name__)
+
+
+async def flush_habit_logs_periodically(database: Database, interval_seconds: float):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await run_in_threadpool(habit_log_buffer.flush, database.engine)
+        except Exception:
+            # the logs stay pending and are retried with the next flush
+            logger.exception("Failed to flush the pending habit logs")
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Builds the app. The engines are created and warmed up by the lifespan, and the worker is reported ready by
+    /internal/ready once that's done.
+    Run with: uvicorn --factory main:create_app
+    :param settings: settings of the app, read from the environment when None
+    """
+    settings = settings or get_settings()
 
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        database = init_database(settings)
+        await run_in_threadpool(database.warm_up, min(settings.db_warm_up_connections, settings.db_pool_size))
+        if settings.db_precompile_statements:
+            await run_in_threadpool(precompile_hot_statements, database.engine)
+        if settings.db_async_mode:
+            from app.db.async_database import init_async_engine, close_async_engine
+            init_async_engine(settings)
+        if settings.habit_log_write_behind:
+            flush_task = asyncio.create_task(flush_habit_logs_periodically(database, settings.habit_log_flush_seconds))
+        app.state.is_ready = True
+        yield
+        app.state.is_ready = False
+        if settings.habit_log_write_behind:
+            flush_task.cancel()
+            await run_in_threadpool(habit_log_buffer.flush, database.engine)
+        if settings.db_async_mode:
+            await close_async_engine()
+        close_database()
 
+    # responses are validated against the response models of the routes and serialized with orjson
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.state.is_ready = False
+    response_cache.configure(create_cache_backend(settings))
+    change_feed.configure(create_change_feed_backend(settings), settings.change_feed_max_pending_events)
+    habit_log_buffer.configure(settings.habit_log_write_behind, settings.habit_log_idle_seconds)
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware, registry=metrics_registry,
+                           slow_request_seconds=settings.slow_request_seconds)
 
-app = FastAPI()
+    if settings.db_async_mode:
+        # registered first so that they take precedence over the sync versions of the same routes
+        from app.routers import async_routes
+        app.include_router(async_routes.router)
+    app.include_router(habits.router)
+    app.include_router(categories.router)
+    app.include_router(habit_logs.router)
+    app.include_router(changes.router)
+    app.include_router(internal.router)
 
+    @app.get("/")
+    def read_root() -> Dict[str, str]:
+        return {"Hello": "World!"}
 
-app.include_router(habits.router)
-app.include_router(categories.router)
-app.include_router(habit_logs.router)
+    return app
 
-@app.get("/")
-def read_root():
-    return {"Hello": "World!"}
\ No newline at end of file
+def __getattr__(name: str):
+    # "uvicorn main:app" and "fastapi run" get an app built on first access, so importing main doesn't read the
+    # settings and "uvicorn --factory main:create_app" builds a single app
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
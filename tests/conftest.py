@@ -0,0 +1,95 @@
+import os
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy.pool import StaticPool
+
+# the settings are required by the app, the tests only use SQLite databases
+for name, value in {"DB_USERNAME": "test", "DB_PASSWORD": "test", "DB_DEV_HOST": "localhost",
+                    "DB_PRD_HOST": "localhost", "DB_PORT": "3306", "DB_NAME": "test"}.items():
+    os.environ.setdefault(name, value)
+
+from app.config import Settings
+from app.db.database import init_database, close_database
+from app.models.models import Users, Habits
+from main import create_app
+
+
+def create_schema(engine):
+    """
+    Creates the tables with one user and one daily habit, whose ID is 1
+    """
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Users(id=1, email="user@example.com", password_hash="hash", created_at=datetime.now(),
+                          updated_at=datetime.now()))
+        session.add(Habits(id=1, name="Run", is_bad_habit=False, repeat_type="DAILY", is_check_only=False,
+                           start_date=datetime(2025, 1, 1), display_order=1, goal_value=5, goal_unit="km",
+                           goal_is_time=False, user_fk=1))
+        session.commit()
+
+def build_settings(**overrides) -> Settings:
+    return Settings(db_username="test", db_password="test", db_dev_host="localhost", db_prd_host="localhost",
+                    db_port=3306, db_name="test", **overrides)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    create_schema(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+@pytest.fixture
+def primary_url(tmp_path) -> str:
+    url = f"sqlite:///{tmp_path / 'primary.db'}"
+    engine = create_engine(url)
+    create_schema(engine)
+    engine.dispose()
+    return url
+
+@pytest.fixture
+def replica_url(tmp_path) -> str:
+    """
+    A replica that never catches up: it has the schema and the seed rows, but none of the writes of the test
+    """
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url)
+    create_schema(engine)
+    engine.dispose()
+    return url
+
+@pytest.fixture
+def make_client(primary_url):
+    """
+    Returns a function that builds the app from explicit settings on the primary SQLite database and starts it
+    """
+    clients = []
+
+    def make(**overrides) -> TestClient:
+        client = TestClient(create_app(build_settings(**{"db_url": primary_url, **overrides})))
+        client.__enter__()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in reversed(clients):
+        client.__exit__(None, None, None)
+
+@pytest.fixture
+def make_database():
+    """
+    Returns a function that creates the engines of the maintenance commands on the given database, without the app
+    """
+    def make(db_url: str):
+        return init_database(build_settings(db_url=db_url))
+
+    yield make
+    close_database()
+
+@pytest.fixture
+def client(make_client) -> TestClient:
+    return make_client()
@@ -0,0 +1,22 @@
+from datetime import date
+
+from app.config import get_settings
+from app.services.habit_log_archive import get_hot_logs_start
+
+LOG_BODY = {"progress_value": 3, "note": "", "completion_percentage": 60}
+
+
+def test_app_runs_on_explicit_settings_only(make_client, monkeypatch):
+    for name in ("DB_USERNAME", "DB_PASSWORD", "DB_DEV_HOST", "DB_PRD_HOST", "DB_PORT", "DB_NAME"):
+        monkeypatch.delenv(name, raising=False)
+    get_settings.cache_clear()
+    try:
+        client = make_client(habit_logs_hot_years=5)
+
+        assert client.put("/habits/1/logs/2025-03-04", json=LOG_BODY).status_code == 201
+        heatmap = client.get("/habits/1/heatmap", params={"start_date": "2025-03-01", "end_date": "2025-03-31"})
+        assert heatmap.status_code == 200
+        assert heatmap.json()["days"] == {"2025-03-04": 60}
+        assert get_hot_logs_start(date(2026, 6, 1)) == date(2022, 1, 1)
+    finally:
+        get_settings.cache_clear()
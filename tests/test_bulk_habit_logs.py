@@ -0,0 +1,67 @@
+import json
+
+from app.routers import habit_logs
+
+LOG_BODY = {"progress_value": 3, "note": "", "completion_percentage": 60}
+
+
+def make_entry(log_date: str, habit_id: int = 1, **values):
+    return {**LOG_BODY, "habit_id": habit_id, "log_date": log_date, **values}
+
+def stream(body: bytes, chunk_size: int = 16):
+    # a generator body is sent chunked, without Content-Length
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+
+def test_bulk_reports_created_updated_and_unchanged_entries(client):
+    client.put("/habits/1/logs/2025-03-01", json=LOG_BODY)
+    client.put("/habits/1/logs/2025-03-02", json=LOG_BODY)
+    entries = [make_entry("2025-03-01"), make_entry("2025-03-02", progress_value=4), make_entry("2025-03-03")]
+
+    response = client.post("/habit-logs/bulk", json=entries)
+
+    assert response.status_code == 200
+    assert response.json() == {"created": [2], "updated": [1], "unchanged": [0], "errors": []}
+    assert [log["progress_value"] for log in client.get("/habits/1/logs").json()] == [3, 4, 3]
+
+def test_bulk_accepts_ndjson(client):
+    body = "\n".join(json.dumps(make_entry(f"2025-03-0{day}")) for day in (1, 2)).encode()
+
+    response = client.post("/habit-logs/bulk", content=stream(body), headers={"Content-Type": "application/x-ndjson"})
+
+    assert response.json()["created"] == [0, 1]
+
+def test_bulk_errors_are_sorted_by_entry_index(client):
+    # the unknown habit is rejected while writing, after the invalid entry is rejected by the validation
+    entries = [make_entry("2025-03-01", habit_id=404), make_entry("2025-03-02"), {"habit_id": 1}]
+
+    response = client.post("/habit-logs/bulk", json=entries)
+
+    assert response.json()["created"] == [1]
+    assert [error["index"] for error in response.json()["errors"]] == [0, 2]
+
+def test_bulk_rejects_too_many_entries_without_writing(client, monkeypatch):
+    monkeypatch.setattr(habit_logs, "MAX_BULK_ENTRIES", 2)
+    entries = [make_entry(f"2025-03-0{day}") for day in (1, 2, 3)]
+
+    assert client.post("/habit-logs/bulk", json=entries).status_code == 413
+    assert client.get("/habits/1/logs").json() == []
+
+def test_bulk_rejects_a_large_body_with_content_length(client, monkeypatch):
+    monkeypatch.setattr(habit_logs, "MAX_BULK_BODY_BYTES", 100)
+
+    response = client.post("/habit-logs/bulk", json=[make_entry("2025-03-01"), make_entry("2025-03-02")])
+
+    assert response.status_code == 413
+
+def test_bulk_rejects_a_large_chunked_body(client, monkeypatch):
+    monkeypatch.setattr(habit_logs, "MAX_BULK_BODY_BYTES", 100)
+    body = json.dumps([make_entry("2025-03-01"), make_entry("2025-03-02")]).encode()
+
+    json_response = client.post("/habit-logs/bulk", content=stream(body), headers={"Content-Type": "application/json"})
+    ndjson_response = client.post("/habit-logs/bulk", content=stream(body),
+                                  headers={"Content-Type": "application/x-ndjson"})
+
+    assert (json_response.status_code, ndjson_response.status_code) == (413, 413)
+    assert client.get("/habits/1/logs").json() == []
@@ -0,0 +1,46 @@
+from app.services.cache import response_cache
+
+LOG_BODY = {"progress_value": 5, "note": "", "completion_percentage": 100}
+
+
+def get_run_summary(client, param_date: str):
+    response = client.get("/users/1/summary", params={"param_date": param_date})
+    assert response.status_code == 200
+    return next(habit for habit in response.json()["habits"] if habit["habit_id"] == 1)
+
+
+def test_repeated_read_is_served_from_the_cache(client):
+    client.get("/users/1/habits-for-date", params={"param_date": "2025-06-03T00:00:00"})
+    hits = response_cache.statistics()["hits"]
+
+    client.get("/users/1/habits-for-date", params={"param_date": "2025-06-03T00:00:00"})
+
+    assert response_cache.statistics()["hits"] == hits + 1
+
+def test_log_write_invalidates_the_user_summary(client):
+    assert get_run_summary(client, "2025-03-04")["current_streak"] == 0
+
+    client.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+
+    assert get_run_summary(client, "2025-03-04")["current_streak"] == 1
+
+def test_habit_update_invalidates_the_schedule(client):
+    params = {"param_date": "2025-06-03T00:00:00"}
+    assert client.get("/users/1/habits-for-date", params=params).json() == [1]
+
+    # 2025-06-03 is a tuesday
+    client.patch("/habits/1", json={"repeat_type": "SPECIFIC_WEEKDAYS", "repeat_config": "monday"})
+
+    assert client.get("/users/1/habits-for-date", params=params).json() == []
+
+def test_category_update_invalidates_the_habits_that_embed_it(client):
+    category_id = client.post("/categories", json={"name": "Sport", "user_fk": 1}).json()["id"]
+    client.post("/habits/1/categories", json={"category_ids": [category_id]})
+    params = {"include_categories": True}
+    assert client.get("/users/1/habits", params=params).json()[0]["categories"][0]["name"] == "Sport"
+    assert [category["name"] for category in client.get("/users/1/categories").json()] == ["Sport"]
+
+    client.patch(f"/categories/{category_id}", json={"name": "Fitness"})
+
+    assert client.get("/users/1/habits", params=params).json()[0]["categories"][0]["name"] == "Fitness"
+    assert [category["name"] for category in client.get("/users/1/categories").json()] == ["Fitness"]
@@ -0,0 +1,34 @@
+from sqlalchemy import text
+from sqlmodel import create_engine
+from typer.testing import CliRunner
+
+from app.cli import cli
+
+
+def test_backfill_log_dates_deletes_duplicate_logs(tmp_path, make_database):
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        # habit_logs before the log_date backfill and the unique (habit_fk, log_date) index
+        connection.execute(text("CREATE TABLE habit_logs (id INTEGER PRIMARY KEY, habit_fk INTEGER, log_date DATE, "
+                                "created_at DATETIME, updated_at DATETIME)"))
+        connection.execute(text(
+            "INSERT INTO habit_logs VALUES "
+            "(1, 1, NULL, '2025-03-04 08:00:00.000000', '2025-03-04 09:00:00.000000'), "
+            "(2, 1, NULL, '2025-03-04 10:00:00.000000', '2025-03-04 10:00:00.000000'), "
+            "(3, 1, NULL, '2025-03-04 11:00:00.000000', '2025-03-04 08:00:00.000000'), "
+            "(4, 1, NULL, '2025-03-05 08:00:00.000000', '2025-03-05 08:00:00.000000'), "
+            "(5, 2, NULL, '2025-03-04 08:00:00.000000', '2025-03-04 08:00:00.000000'), "
+            "(6, 2, NULL, '2025-03-04 09:00:00.000000', '2025-03-04 08:00:00.000000')"))
+    make_database(url)
+
+    result = CliRunner().invoke(cli, ["backfill-log-dates", "--batch-size", "1"])
+
+    assert result.exit_code == 0, result.output
+    assert "Backfilled the log_date of 6 habit logs" in result.output
+    assert "Deleted 3 duplicate habit logs" in result.output
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT id, habit_fk, log_date FROM habit_logs ORDER BY id")).all()
+    engine.dispose()
+    # the last updated log of a day is kept, the highest ID on a tie
+    assert [tuple(row) for row in rows] == [(2, 1, "2025-03-04"), (4, 1, "2025-03-05"), (6, 2, "2025-03-04")]
@@ -0,0 +1,38 @@
+from sqlalchemy.dialects import mysql
+
+from app.models.models import Habits, HabitLogs, Categories, HabitMonthlySummaries
+
+LOG_BODY = {"progress_value": 3, "note": "", "completion_percentage": 60}
+
+
+def test_unchanged_habits_are_not_modified(client):
+    response = client.get("/users/1/habits")
+
+    not_modified = client.get("/users/1/habits", headers={"If-None-Match": response.headers["ETag"]})
+
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+def test_every_edit_changes_the_etag(client):
+    etags = [client.get("/users/1/habits").headers["ETag"]]
+    # edits of the same row within the same second
+    for name in ("Walk", "Swim"):
+        assert client.patch("/habits/1", json={"name": name}).status_code == 200
+        etags.append(client.get("/users/1/habits").headers["ETag"])
+
+    assert len(set(etags)) == 3
+    assert client.get("/users/1/habits", headers={"If-None-Match": etags[1]}).status_code == 200
+
+def test_log_writes_change_the_etag_of_the_logs(client):
+    etag = client.get("/habits/1/logs").headers["ETag"]
+    client.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+
+    response = client.get("/habits/1/logs", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+def test_etag_validators_keep_microseconds_on_mysql():
+    for model in (Habits, Categories, HabitLogs, HabitMonthlySummaries):
+        column_type = model.__table__.c.updated_at.type.dialect_impl(mysql.dialect())
+        assert column_type.fsp == 6
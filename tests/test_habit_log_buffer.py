@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import update
+from sqlmodel import create_engine
+
+from app.models.models import Habits
+from app.services.habit_log_buffer import habit_log_buffer
+
+LOG_BODY = {"progress_value": 3, "note": "", "completion_percentage": 60}
+
+
+@pytest.fixture
+def make_timer_client(make_client, primary_url, replica_url):
+    """
+    Returns a function that builds a client with the write-behind buffer, which is only flushed before reads, on the
+    primary and a replica that never catches up. Habit 1 is a timer habit.
+    """
+    engine = create_engine(primary_url)
+    with engine.begin() as connection:
+        connection.execute(update(Habits).where(Habits.id == 1).values(goal_is_time=True))
+    engine.dispose()
+
+    def make():
+        return make_client(db_replica_urls=[replica_url], cache_enabled=False, habit_log_write_behind=True,
+                           habit_log_flush_seconds=3600)
+    return make
+
+def put_timer_progress(client):
+    """
+    Writes a log with a progress of 3 to the database, then buffers a progress of 5, and forgets the cookie that pins
+    the client to the primary
+    """
+    client.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+    assert client.put("/habits/1/logs/2025-03-04", json={**LOG_BODY, "progress_value": 5}).status_code == 200
+    assert habit_log_buffer.statistics()["pending_logs"] == 1
+    client.cookies.clear()
+
+
+def test_reads_flush_the_pending_logs_and_read_them_from_the_primary(make_timer_client):
+    client = make_timer_client()
+    put_timer_progress(client)
+
+    logs = client.get("/habits/1/logs").json()
+
+    assert [log["progress_value"] for log in logs] == [5]
+    assert habit_log_buffer.statistics()["pending_logs"] == 0
+
+def test_reads_go_to_the_primary_when_another_request_flushed_the_logs(make_timer_client, monkeypatch):
+    client = make_timer_client()
+    put_timer_progress(client)
+    # the logs are being written by a concurrent flush, this request has nothing left to flush
+    monkeypatch.setattr(habit_log_buffer, "flush", lambda *args, **kwargs: 0)
+
+    assert len(client.get("/habits/1/logs").json()) == 1
+
+def test_reads_fall_back_to_the_primary_when_the_flush_fails(make_timer_client, monkeypatch):
+    client = make_timer_client()
+    put_timer_progress(client)
+
+    def fail_flush(*args, **kwargs):
+        raise RuntimeError("primary unavailable")
+    monkeypatch.setattr(habit_log_buffer, "flush", fail_flush)
+
+    response = client.get("/habits/1/logs")
+
+    assert response.status_code == 200
+    assert [log["progress_value"] for log in response.json()] == [3]
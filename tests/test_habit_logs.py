@@ -0,0 +1,28 @@
+from app.services.cache import response_cache
+
+LOG_BODY = {"progress_value": 3, "note": "", "completion_percentage": 60}
+
+
+def test_put_creates_then_updates_the_log(client):
+    created = client.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+    updated = client.put("/habits/1/logs/2025-03-04", json={**LOG_BODY, "progress_value": 5})
+
+    assert (created.status_code, updated.status_code) == (201, 200)
+    assert updated.json()["id"] == created.json()["id"]
+    assert updated.json()["progress_value"] == 5
+    assert updated.json()["updated_at"] > created.json()["updated_at"]
+
+def test_unchanged_put_writes_nothing(client):
+    created = client.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+    etag = client.get("/habits/1/logs").headers["ETag"]
+    client.get("/habits/1/year/2025")
+    hits = response_cache.statistics()["hits"]
+
+    unchanged = client.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+
+    assert unchanged.status_code == 200
+    assert unchanged.json()["updated_at"] == created.json()["updated_at"]
+    assert client.get("/habits/1/logs", headers={"If-None-Match": etag}).status_code == 304
+    # the cached summary wasn't invalidated
+    client.get("/habits/1/year/2025")
+    assert response_cache.statistics()["hits"] == hits + 1
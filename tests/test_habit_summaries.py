@@ -0,0 +1,114 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from sqlmodel import select
+
+from app.models.models import HabitLogs, HabitMonthlySummaries
+from app.services.habit_summaries import get_longest_streak, get_leading_and_trailing_streaks, summarize_month, \
+    stitch_longest_streak, get_current_streak, build_yearly_summary, refresh_monthly_summaries
+
+
+def date_range(start_date: date, end_date: date):
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+def make_summary(log_dates, completion_percentage: float = 100) -> HabitMonthlySummaries:
+    logs = [SimpleNamespace(log_date=log_date, completion_percentage=completion_percentage, progress_value=1,
+                            goal_unit="km") for log_date in sorted(log_dates)]
+    return summarize_month(1, logs[0].log_date.year, logs[0].log_date.month, logs)
+
+def add_logs(session, log_dates, completion_percentage: float = 100):
+    for log_date in log_dates:
+        session.add(HabitLogs(habit_fk=1, log_date=log_date, progress_value=1, goal_value=5, goal_unit="km",
+                              completion_percentage=completion_percentage))
+    session.flush()
+
+
+def test_longest_streak_of_consecutive_dates():
+    dates = [date(2025, 1, 1), date(2025, 1, 2), date(2025, 1, 4), date(2025, 1, 5), date(2025, 1, 6)]
+    assert get_longest_streak(dates) == 3
+    assert get_longest_streak([]) == 0
+
+def test_leading_and_trailing_streaks():
+    dates = [date(2025, 4, 1), date(2025, 4, 2), date(2025, 4, 10), date(2025, 4, 29), date(2025, 4, 30)]
+    assert get_leading_and_trailing_streaks(dates, 2025, 4) == (2, 2)
+    assert get_leading_and_trailing_streaks([date(2025, 4, 15)], 2025, 4) == (0, 0)
+
+def test_full_month_is_both_leading_and_trailing():
+    summary = make_summary(date_range(date(2024, 2, 1), date(2024, 2, 29)))
+    assert (summary.leading_active_streak, summary.trailing_active_streak, summary.longest_active_streak) == \
+        (29, 29, 29)
+
+def test_summary_keeps_perfect_streaks_apart():
+    logs = [SimpleNamespace(log_date=date(2025, 3, day), completion_percentage=percentage, progress_value=1,
+                            goal_unit="km")
+            for day, percentage in ((1, 100), (2, 50), (3, 100), (31, 100))]
+    summary = summarize_month(1, 2025, 3, logs)
+    assert (summary.active_days, summary.perfect_days) == (4, 3)
+    assert (summary.leading_active_streak, summary.longest_active_streak) == (3, 3)
+    assert (summary.leading_perfect_streak, summary.trailing_perfect_streak, summary.longest_perfect_streak) == \
+        (1, 1, 1)
+
+def test_streak_is_stitched_across_a_month_boundary():
+    summaries = [make_summary(date_range(date(2025, 1, 29), date(2025, 1, 31))),
+                 make_summary(date_range(date(2025, 2, 1), date(2025, 2, 2)))]
+    assert stitch_longest_streak(summaries, "active") == 5
+
+def test_streak_is_stitched_through_a_full_month():
+    summaries = [make_summary(date_range(date(2025, 1, 30), date(2025, 1, 31))),
+                 make_summary(date_range(date(2025, 2, 1), date(2025, 2, 28))),
+                 make_summary(date_range(date(2025, 3, 1), date(2025, 3, 3)))]
+    assert stitch_longest_streak(summaries, "active") == 2 + 28 + 3
+
+def test_streak_is_not_stitched_across_a_missing_month():
+    summaries = [make_summary(date_range(date(2025, 1, 29), date(2025, 1, 31))),
+                 make_summary(date_range(date(2025, 3, 1), date(2025, 3, 2)))]
+    assert stitch_longest_streak(summaries, "active") == 3
+
+def test_longest_streak_inside_a_month_wins():
+    summaries = [make_summary([date(2025, 1, 31)]),
+                 make_summary([date(2025, 2, 1), *date_range(date(2025, 2, 10), date(2025, 2, 20))])]
+    assert stitch_longest_streak(summaries, "active") == 11
+
+def test_current_streak_starts_yesterday_when_today_is_not_logged():
+    today = date(2025, 6, 15)
+    log_dates = set(date_range(date(2025, 6, 10), date(2025, 6, 14)))
+    assert get_current_streak(log_dates, today, date(2025, 6, 1), {}) == 5
+    assert get_current_streak(log_dates | {today}, today, date(2025, 6, 1), {}) == 6
+
+def test_current_streak_walks_back_through_monthly_summaries():
+    today = date(2025, 6, 3)
+    summaries = [make_summary(date_range(date(2025, 4, 25), date(2025, 4, 30))),
+                 make_summary(date_range(date(2025, 5, 1), date(2025, 5, 31)))]
+    summaries_by_month = {(summary.year, summary.month): summary for summary in summaries}
+    log_dates = set(date_range(date(2025, 6, 1), today))
+    assert get_current_streak(log_dates, today, date(2025, 6, 1), summaries_by_month) == 3 + 31 + 6
+
+def test_current_streak_stops_at_a_missing_summary():
+    today = date(2025, 6, 3)
+    log_dates = set(date_range(date(2025, 6, 1), today))
+    assert get_current_streak(log_dates, today, date(2025, 6, 1), {}) == 3
+
+def test_yearly_summary_reports_a_month_without_summary_row(session):
+    add_logs(session, [date(2025, 1, 30), date(2025, 1, 31), date(2025, 2, 1)])
+    refresh_monthly_summaries({(1, date(2025, 1, 1))}, session)
+    session.commit()
+
+    summary = build_yearly_summary(1, 2025, session)
+
+    assert list(summary["monthly_data"]) == ["january", "february"]
+    assert summary["monthly_data"]["february"]["monthly_summary"]["active_days"] == 0
+    assert summary["monthly_data"]["february"]["daily_progress"] == [
+        {"date": "02/01/2025", "completion_percentage": 100}]
+    assert summary["yearly_summary"]["active_days"] == 2
+
+def test_refresh_upserts_and_deletes_summary_rows(session):
+    add_logs(session, [date(2025, 1, 1), date(2025, 2, 1)])
+    refresh_monthly_summaries({(1, date(2025, 1, 1)), (1, date(2025, 2, 1))}, session)
+    add_logs(session, [date(2025, 1, 2)])
+    session.delete(session.exec(select(HabitLogs).where(HabitLogs.log_date == date(2025, 2, 1))).one())
+    refresh_monthly_summaries({(1, date(2025, 1, 1)), (1, date(2025, 2, 1))}, session)
+    session.commit()
+
+    summaries = session.exec(select(HabitMonthlySummaries)).all()
+    assert [(summary.month, summary.active_days, summary.leading_active_streak) for summary in summaries] == \
+        [(1, 2, 2)]
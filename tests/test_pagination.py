@@ -0,0 +1,71 @@
+from datetime import date
+
+import pytest
+
+from app.models.models import HabitLogs
+from app.services.pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER
+
+LOG_BODY = {"progress_value": 3, "note": "", "completion_percentage": 60}
+HABIT_BODY = {"is_bad_habit": False, "repeat_type": "DAILY", "is_check_only": True, "start_date": "2025-01-01T00:00:00",
+              "goal_is_time": False, "user_fk": 1}
+
+
+def read_all_pages(client, url: str, limit: int):
+    """
+    Follows the next cursors from the first page to the last one
+    :return: the pages, as lists of items
+    """
+    pages = []
+    params = {"limit": limit}
+    while True:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        next_cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if next_cursor is None:
+            return pages
+        params = {"limit": limit, "cursor": next_cursor}
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor([date(2025, 3, 4)])
+    assert decode_cursor(cursor, [HabitLogs.log_date]) == [date(2025, 3, 4)]
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor([1, 2]), encode_cursor(["not a date"])])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, [HabitLogs.log_date])
+
+def test_log_pages_cover_every_log_once(client):
+    log_dates = [f"2025-03-0{day}" for day in range(1, 6)]
+    for log_date in reversed(log_dates):
+        client.put(f"/habits/1/logs/{log_date}", json=LOG_BODY)
+
+    pages = read_all_pages(client, "/habits/1/logs", 2)
+
+    assert [[log["log_date"] for log in page] for page in pages] == [log_dates[0:2], log_dates[2:4], log_dates[4:]]
+
+def test_habit_pages_cover_every_habit_once(client):
+    for name in ("Read", "Swim", "Write", "Cook"):
+        assert client.post("/habits", json={**HABIT_BODY, "name": name}).status_code == 200
+
+    pages = read_all_pages(client, "/users/1/habits", 2)
+
+    # the last added habit comes first
+    assert [habit["name"] for page in pages for habit in page] == ["Cook", "Write", "Swim", "Read", "Run"]
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+def test_unlimited_read_has_no_next_cursor(client):
+    client.put("/habits/1/logs/2025-03-01", json=LOG_BODY)
+
+    response = client.get("/habits/1/logs")
+
+    assert len(response.json()) == 1
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+@pytest.mark.parametrize("url", ["/habits/1/logs", "/users/1/habits", "/habits", "/users/1/categories"])
+def test_invalid_cursor_is_a_bad_request(client, url):
+    assert client.get(url, params={"limit": 2, "cursor": "not a cursor"}).status_code == 400
+
+def test_page_size_is_bounded(client):
+    assert client.get("/habits/1/logs", params={"limit": 501}).status_code == 422
@@ -0,0 +1,62 @@
+from datetime import date, datetime
+
+import pytest
+
+from app.models.models import Habits
+from app.services.habit_schedule import compile_repeat_rule, apply_compiled_repeat_rule, is_habit_due, HabitLogFacts
+
+
+def make_habit(repeat_type: str, repeat_config: str) -> Habits:
+    habit = Habits(id=1, name="Run", is_bad_habit=False, repeat_type=repeat_type, repeat_config=repeat_config,
+                   is_check_only=True, start_date=datetime(2025, 1, 1), display_order=1, goal_is_time=False, user_fk=1)
+    apply_compiled_repeat_rule(habit)
+    return habit
+
+
+def test_weekday_mask():
+    # bit 0 is monday
+    assert compile_repeat_rule("SPECIFIC_WEEKDAYS", "monday, Friday,sunday") == (0b1010001, 0, None)
+
+def test_month_day_mask():
+    # bit 0 is day 1
+    assert compile_repeat_rule("SPECIFIC_MONTH_DAYS", "1,15,31") == (0, (1 << 0) | (1 << 14) | (1 << 30), None)
+
+def test_count_based_rules_only_set_repeat_n():
+    assert compile_repeat_rule("N_TIMES_PER_WEEK", "3") == (0, 0, 3)
+    assert compile_repeat_rule("EVERY_N_DAYS", "2") == (0, 0, 2)
+    assert compile_repeat_rule("DAILY", None) == (0, 0, None)
+
+@pytest.mark.parametrize("repeat_type, repeat_config", [
+    ("SPECIFIC_WEEKDAYS", "monday,funday"),
+    ("SPECIFIC_MONTH_DAYS", "0"),
+    ("SPECIFIC_MONTH_DAYS", "32"),
+    ("N_TIMES_PER_MONTH", "0"),
+    ("HOURLY", "1"),
+])
+def test_invalid_rules_are_rejected(repeat_type, repeat_config):
+    with pytest.raises(ValueError):
+        compile_repeat_rule(repeat_type, repeat_config)
+
+def test_habit_is_due_on_its_weekdays():
+    habit = make_habit("SPECIFIC_WEEKDAYS", "monday,friday")
+    # 2025-06-02 is a monday
+    due_days = [day for day in range(2, 9) if is_habit_due(habit, date(2025, 6, day), HabitLogFacts())]
+    assert due_days == [2, 6]
+
+def test_habit_is_due_on_its_month_days():
+    habit = make_habit("SPECIFIC_MONTH_DAYS", "1,31")
+    assert is_habit_due(habit, date(2025, 1, 31), HabitLogFacts())
+    assert is_habit_due(habit, date(2025, 2, 1), HabitLogFacts())
+    assert not is_habit_due(habit, date(2025, 2, 28), HabitLogFacts())
+
+def test_updated_rule_is_recompiled_into_the_masks(client):
+    response = client.patch("/habits/1", json={"repeat_type": "SPECIFIC_WEEKDAYS", "repeat_config": "monday,friday"})
+    assert response.status_code == 200
+
+    schedule = client.get("/users/1/habits-for-date-range",
+                          params={"start_date": "2025-06-02", "end_date": "2025-06-08"}).json()
+    assert {day for day, habit_ids in schedule.items() if 1 in habit_ids} == {"2025-06-02", "2025-06-06"}
+
+def test_invalid_rule_is_rejected_by_the_api(client):
+    response = client.patch("/habits/1", json={"repeat_type": "SPECIFIC_WEEKDAYS", "repeat_config": "funday"})
+    assert response.status_code == 400
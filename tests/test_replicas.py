@@ -0,0 +1,37 @@
+import pytest
+
+from app.db.database import PRIMARY_PIN_COOKIE
+
+LOG_BODY = {"progress_value": 3, "note": "", "completion_percentage": 60}
+
+
+@pytest.fixture
+def make_replicated_client(make_client, primary_url, replica_url):
+    def make(**overrides):
+        return make_client(db_replica_urls=[replica_url], cache_enabled=False, **overrides)
+    return make
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_writes_pin_their_client_to_the_primary(make_replicated_client, primary_url, async_mode):
+    async_settings = {"db_async_mode": True, "db_async_url": primary_url.replace("sqlite://", "sqlite+aiosqlite://")}
+    writer = make_replicated_client(**(async_settings if async_mode else {}))
+
+    response = writer.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+
+    assert response.status_code == 201
+    assert PRIMARY_PIN_COOKIE in response.cookies
+    assert [log["log_date"] for log in writer.get("/habits/1/logs").json()] == ["2025-03-04"]
+
+def test_reads_of_other_clients_go_to_the_replicas(make_replicated_client):
+    writer = make_replicated_client()
+    writer.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+    writer.cookies.clear()
+
+    assert writer.get("/habits/1/logs").json() == []
+
+def test_writes_without_replicas_set_no_cookie(client):
+    response = client.put("/habits/1/logs/2025-03-04", json=LOG_BODY)
+
+    assert PRIMARY_PIN_COOKIE not in response.cookies
+    assert len(client.get("/habits/1/logs").json()) == 1